@@ -40,7 +40,7 @@ from .scheduler import Scheduler
 from .model import Model
 from .generator import TaskGenerator
 from .worker import WorkerScheduler, Worker
-from .logentry import LogEntry
+from .logentry import LogEntry, OutputLogEntry
 from .reducer import (ActionParser, BashParser, ChainedParser,
                       DictFilterParser, PrefixParser, StageParser, StrFilterParser,
                       StageInParser)
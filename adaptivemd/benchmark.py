@@ -0,0 +1,614 @@
+##############################################################################
+# adaptiveMD: A Python Framework to Run Adaptive Molecular Dynamics (MD)
+#             Simulations on HPC Resources
+# Copyright 2017 FU Berlin and the Authors
+#
+# Authors: Jan-Hendrik Prinz
+# Contributors:
+#
+# `adaptiveMD` is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with MDTraj. If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+"""
+Micro-benchmarks of the storage layer
+
+Each scale creates a temporary project with `n` trajectory generation
+tasks, their trajectories and one model per 100 trajectories, i.e. the
+object graphs a real project stores. The timings are returned as a dict
+that can be written as JSON and compared between runs. Use the
+`adaptivemdbenchmark` script to run the suite from the command line.
+
+Benchmarks that time single operations use `sample` objects at most, so
+the cost of one operation can be compared across the size of the
+collections.
+"""
+from __future__ import absolute_import, print_function
+
+import datetime
+import multiprocessing
+import platform
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from timeit import default_timer as timer
+
+import numpy as np
+
+from .engine.openmm import OpenMMEngine
+from .file import File
+from .model import Model
+from .mongodb import MongoDBStorage, ObjectJSON, DataDict
+from .project import Project
+
+benchmarks = [
+    'save', 'load', 'iterate', 'syncvar', 'serialize', 'filestore', 'claim']
+
+default_scales = [1000, 10000, 100000]
+
+# trajectories per model
+_model_every = 100
+
+
+def _record(name, scale, ops, seconds, latencies=None, **extra):
+    record = {
+        'benchmark': name,
+        'scale': scale,
+        'ops': ops,
+        'seconds': seconds,
+        'ops_per_s': ops / seconds if seconds > 0 else None,
+        'us_per_op': 1e6 * seconds / ops if ops else None
+    }
+
+    if latencies:
+        latencies = np.array(latencies) * 1e6
+        record['latency_us'] = {
+            'min': float(latencies.min()),
+            'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95)),
+            'p99': float(np.percentile(latencies, 99)),
+            'max': float(latencies.max())
+        }
+
+    record.update(extra)
+    return record
+
+
+def _timed(fnc, objs):
+    # latency of each call and the total time
+    latencies = []
+    start = timer()
+    for obj in objs:
+        t0 = timer()
+        fnc(obj)
+        latencies.append(timer() - t0)
+
+    return timer() - start, latencies
+
+
+def _sampled(objs, sample):
+    # evenly spaced objects, so old and new documents are both used
+    objs = list(objs)
+    if len(objs) <= sample:
+        return objs
+
+    step = float(len(objs)) / sample
+    return [objs[int(i * step)] for i in range(sample)]
+
+
+def _model_data(trajectories, engine):
+    # shaped like the results of `PyEMMAAnalysis`
+    k = 100
+    return {
+        'input': {
+            'trajectories': trajectories,
+            'pdb': engine['pdb_file'],
+            'n_atoms': 2269,
+            'frames': 100 * len(trajectories),
+            'n_trajectories': len(trajectories),
+            'lengths': [100] * len(trajectories),
+            'selection': 'protein'
+        },
+        'tica': {
+            'dimension': 2,
+            'lagtime': 2,
+            'eigenvalues': np.random.random(10),
+            'eigenvectors': np.random.random((10, 10)),
+        },
+        'clustering': {
+            'k': k,
+            'dtrajs': [np.random.randint(0, k, 100) for _ in trajectories],
+            'centers': np.random.random((k, 2)),
+        },
+        'msm': {
+            'lagtime': 2,
+            'P': np.random.random((k, k)),
+            'C': np.random.randint(0, 100, (k, k)),
+        }
+    }
+
+
+class _Graphs(object):
+    """
+    Creates the tasks, trajectories and models of a benchmark project
+    """
+    def __init__(self, project):
+        self.project = project
+        pdb = File('file:///benchmark/alanine.pdb').named('initial_pdb')
+        self.engine = OpenMMEngine(
+            pdb_file=pdb,
+            system_file=File('file:///benchmark/system.xml'),
+            integrator_file=File('file:///benchmark/integrator.xml'),
+            args='-r --report-interval 1 -p CPU'
+        ).named('openmm')
+
+        self.engine.add_output_type('master', 'master.dcd', stride=10)
+        self.engine.add_output_type('protein', 'protein.dcd', stride=1)
+
+    def tasks(self, n):
+        project = self.project
+        return [
+            self.engine.run(project.new_trajectory(
+                self.engine['pdb_file'], 100, self.engine))
+            for _ in range(n)]
+
+    def model(self, tasks):
+        trajectories = [task.trajectory for task in tasks]
+        return Model(DataDict(_model_data(trajectories, self.engine)))
+
+
+class _Run(object):
+    """
+    The benchmarks for one scale
+    """
+    def __init__(self, name, scale, sample, workers, claims, batch_size):
+        self.name = name
+        self.scale = scale
+        self.sample = sample
+        self.workers = workers
+        self.claims = claims
+        self.batch_size = batch_size
+        self.records = []
+
+        self.task_ids = []
+        self.trajectory_ids = []
+        self.model_ids = []
+
+    def add(self, name, ops, seconds, latencies=None, **extra):
+        self.records.append(
+            _record(name, self.scale, ops, seconds, latencies, **extra))
+
+    def fresh_project(self):
+        # a new storage has empty caches, like a new process
+        return Project(self.name)
+
+    def save(self, project):
+        graphs = _Graphs(project)
+        project.generators.add(graphs.engine)
+
+        seconds = 0.0
+        models = 0
+        done = 0
+        while done < self.scale:
+            tasks = graphs.tasks(min(self.batch_size, self.scale - done))
+            new_models = [
+                graphs.model(tasks[i:i + _model_every])
+                for i in range(0, len(tasks), _model_every)]
+
+            t0 = timer()
+            project.tasks.add(tasks)
+            project.models.add(new_models)
+            seconds += timer() - t0
+
+            self.task_ids.extend(task.__uuid__ for task in tasks)
+            self.trajectory_ids.extend(
+                task.trajectory.__uuid__ for task in tasks)
+            self.model_ids.extend(model.__uuid__ for model in new_models)
+
+            done += len(tasks)
+            models += len(new_models)
+
+        self.add('save_bulk', done, seconds, models=models,
+                 batch_size=self.batch_size)
+
+        # the same graphs saved one by one, which is what `project.queue`
+        # does for single tasks
+        tasks = graphs.tasks(self.sample)
+        seconds, latencies = _timed(project.tasks.add, tasks)
+        self.add('save_one', len(tasks), seconds, latencies)
+
+    def load(self):
+        project = self.fresh_project()
+        store = project.storage.tasks
+        idxs = _sampled(self.task_ids, self.sample)
+        seconds, latencies = _timed(store.load, idxs)
+        self.add('load_one', len(idxs), seconds, latencies)
+        project.close()
+
+        project = self.fresh_project()
+        store = project.storage.tasks
+        t0 = timer()
+        store.load_many(self.task_ids)
+        self.add('load_many', len(self.task_ids), timer() - t0)
+        project.close()
+
+    def iterate(self):
+        project = self.fresh_project()
+        t0 = timer()
+        n = sum(1 for _ in project.tasks)
+        self.add('iterate_tasks', n, timer() - t0)
+        project.close()
+
+        # the tasks have put their trajectories into the cache
+        project = self.fresh_project()
+        t0 = timer()
+        n = sum(1 for _ in project.files)
+        self.add('iterate_files', n, timer() - t0)
+        project.close()
+
+    def syncvar(self):
+        project = self.fresh_project()
+        storage = project.storage
+        tasks = storage.tasks.load_many(_sampled(self.task_ids, self.sample))
+        trajectories = storage.files.load_many(
+            _sampled(self.trajectory_ids, self.sample))
+
+        seconds, latencies = _timed(lambda task: task.state, tasks)
+        self.add('syncvar_get', len(tasks), seconds, latencies)
+
+        t0 = timer()
+        with storage.snapshot(storage.tasks, ['state']):
+            for task in tasks:
+                task.state
+        self.add('syncvar_get_snapshot', len(tasks), timer() - t0)
+
+        def set_created(traj):
+            traj.created = time.time()
+
+        seconds, latencies = _timed(set_created, trajectories)
+        self.add('syncvar_set', len(trajectories), seconds, latencies)
+
+        storage.set_write_behind(True)
+        t0 = timer()
+        for traj in trajectories:
+            set_created(traj)
+        storage.set_write_behind(False)
+        self.add('syncvar_set_write_behind', len(trajectories), timer() - t0)
+
+        project.close()
+
+    def serialize(self, project):
+        # graphs that are not stored, so sync variables do not read the DB
+        graphs = _Graphs(project)
+        tasks = graphs.tasks(self.sample)
+        unsaved = {
+            'Task': tasks,
+            'Trajectory': [task.trajectory for task in tasks],
+            'Model': [
+                graphs.model(tasks[i:i + _model_every])
+                for i in range(0, len(tasks), _model_every)]
+        }
+
+        fresh = self.fresh_project()
+        storage = fresh.storage
+        loaded = {
+            'Task': storage.tasks.load_many(
+                _sampled(self.task_ids, self.sample)),
+            'Trajectory': storage.files.load_many(
+                _sampled(self.trajectory_ids, self.sample)),
+            'Model': storage.models.load_many(
+                _sampled(self.model_ids, self.sample))
+        }
+
+        # load lazy fields before timing
+        for objs in loaded.values():
+            for obj in objs:
+                storage.simplifier.to_simple_dict(obj)
+
+        # compare the generic conversion with cached class plans
+        for plans in [False, True]:
+            # the full graphs, as used for JSON and files
+            simplifier = ObjectJSON()
+            simplifier.use_plans = plans
+            for cls_name, objs in sorted(unsaved.items()):
+                seconds, latencies = _timed(simplifier.simplify, objs)
+                self.add('simplify', len(objs), seconds, latencies,
+                         cls=cls_name, plans=plans)
+
+                simplified = [simplifier.simplify(obj) for obj in objs]
+                seconds, latencies = _timed(simplifier.build, simplified)
+                self.add('build', len(simplified), seconds, latencies,
+                         cls=cls_name, plans=plans)
+
+            # the documents of the stores, which reference other objects
+            simplifier = storage.simplifier
+            simplifier.use_plans = plans
+            for cls_name, objs in sorted(loaded.items()):
+                seconds, latencies = _timed(simplifier.to_simple_dict, objs)
+                self.add('simplify_stored', len(objs), seconds, latencies,
+                         cls=cls_name, plans=plans)
+
+                simplified = [simplifier.to_simple_dict(obj) for obj in objs]
+                seconds, latencies = _timed(
+                    simplifier.from_simple_dict, simplified)
+                self.add('build_stored', len(simplified), seconds, latencies,
+                         cls=cls_name, plans=plans)
+
+        fresh.close()
+
+    def filestore(self, project):
+        payload = {'array': np.random.random((100, 100)),
+                   'dtrajs': [np.random.randint(0, 100, 1000)
+                              for _ in range(10)]}
+
+        data = [DataDict(dict(payload)) for _ in range(self.sample)]
+        seconds, latencies = _timed(project.data.add, data)
+        self.add('filestore_put', len(data), seconds, latencies)
+
+        idxs = [obj.__uuid__ for obj in data]
+        fresh = self.fresh_project()
+        seconds, latencies = _timed(fresh.storage.data.load, idxs)
+        self.add('filestore_get', len(idxs), seconds, latencies)
+        fresh.close()
+
+    def claim(self, project, url):
+        tasks = project.storage.tasks._document
+        for method in ['modify_test_one', 'claim_one', 'claim_many']:
+            tasks.update_many(
+                {'state': {'$ne': 'created'}}, {'$set': {'state': 'created'}})
+
+            claims = [self.claims // self.workers] * self.workers
+            claims[0] += self.claims % self.workers
+
+            queue = multiprocessing.Queue()
+            start = multiprocessing.Event()
+            processes = [
+                multiprocessing.Process(
+                    target=_claim_worker,
+                    args=(url, self.name, method, n, start, queue))
+                for n in claims]
+
+            for p in processes:
+                p.start()
+
+            t0 = timer()
+            start.set()
+            latencies = []
+            for _ in processes:
+                latencies.extend(queue.get())
+
+            seconds = timer() - t0
+            for p in processes:
+                p.join()
+
+            self.add('claim', len(latencies), seconds, latencies,
+                     method=method, workers=self.workers)
+
+
+# tasks claimed by one call of `claim_many`
+_claim_batch = 10
+
+
+def _claim_worker(url, name, method, n_claims, start, queue):
+    # one worker that claims tasks while others do the same
+    MongoDBStorage.set_location(url)
+    project = Project(name)
+    store = project.storage.tasks
+
+    latencies = []
+    start.wait()
+    while len(latencies) < n_claims:
+        t0 = timer()
+        if method == 'modify_test_one':
+            tasks = [store.modify_test_one(
+                lambda x: True, 'state', 'created', 'running')]
+        elif method == 'claim_one':
+            tasks = [store.claim_one({}, 'state', 'created', 'running')]
+        else:
+            tasks = store.claim_many(
+                {}, 'state', 'created', 'running',
+                min(_claim_batch, n_claims - len(latencies)))
+
+        if not tasks or tasks[0] is None:
+            break
+
+        # the time of a batch is shared by its tasks
+        latencies.extend([(timer() - t0) / len(tasks)] * len(tasks))
+
+    project.close()
+    queue.put(latencies)
+
+
+def _public_url(url):
+    # remove credentials from a mongodb url
+    return re.sub(r'//[^@/]*@', '//', url)
+
+
+def _version():
+    try:
+        from ._version import get_versions
+        return get_versions()['version']
+    except Exception:
+        return None
+
+
+def run_benchmarks(scales=None, dburl=None, sample=1000, workers=4,
+                   claims=100, batch_size=1000, include=None, id_format=None,
+                   log=None):
+    """
+    Run the storage benchmarks
+
+    Parameters
+    ----------
+    scales : list of int or None
+        the number of tasks created for each run. Default is 1k, 10k and 100k
+    dburl : str or None
+        the DB url, e.g. `mongodb://localhost:27017/`. If None an embedded
+        SQLite DB in a temporary directory is used
+    sample : int
+        the maximal number of objects used to time single operations
+    workers : int
+        the number of processes that claim tasks at the same time
+    claims : int
+        the number of tasks claimed by all workers together
+    batch_size : int
+        the number of tasks saved together
+    include : list of str or None
+        the benchmarks to run, see `benchmarks`. If None all are run
+    id_format : str or None
+        the id format of the projects, `string` or `binary`. If None the
+        default of :class:`mongodb.MongoDBStorage` is used
+    log : file or None
+        if given progress is written to this file
+
+    Returns
+    -------
+    dict
+        `meta` describes the run and `results` contains one dict per
+        benchmark and scale
+
+    """
+    if scales is None:
+        scales = default_scales
+
+    if include is None:
+        include = benchmarks
+
+    unknown = set(include) - set(benchmarks)
+    if unknown:
+        raise ValueError(
+            'Unknown benchmarks %s. Use %s' % (sorted(unknown), benchmarks))
+
+    tempdir = None
+    if dburl is None:
+        tempdir = tempfile.mkdtemp()
+        dburl = 'sqlite://' + tempdir
+
+    old_url = MongoDBStorage._db_url
+    old_format = MongoDBStorage.default_id_format
+
+    MongoDBStorage.set_location(dburl)
+    if id_format is not None:
+        MongoDBStorage.default_id_format = id_format
+
+    report = {
+        'meta': {
+            'date': datetime.datetime.utcnow().isoformat() + 'Z',
+            'adaptivemd': _version(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'dburl': _public_url(dburl),
+            'backend': 'sqlite' if dburl.startswith('sqlite:') else 'mongodb',
+            'id_format': MongoDBStorage.default_id_format,
+            'scales': list(scales),
+            'sample': sample,
+            'workers': workers,
+            'claims': claims,
+            'batch_size': batch_size
+        },
+        'results': []
+    }
+
+    try:
+        for scale in scales:
+            name = 'benchmark-' + uuid.uuid4().hex[:12]
+            run = _Run(name, scale, sample, workers, claims, batch_size)
+
+            project = Project(name)
+            project.initialize()
+
+            try:
+                steps = [
+                    ('save', lambda: run.save(project)),
+                    ('load', run.load),
+                    ('iterate', run.iterate),
+                    ('syncvar', run.syncvar),
+                    ('serialize', lambda: run.serialize(project)),
+                    ('filestore', lambda: run.filestore(project)),
+                    ('claim', lambda: run.claim(project, dburl))
+                ]
+
+                for step, fnc in steps:
+                    # the other benchmarks need the saved objects
+                    if step in include or step == 'save':
+                        if log is not None:
+                            print('%7d %s' % (scale, step), file=log)
+
+                        n_records = len(run.records)
+                        fnc()
+                        if step not in include:
+                            del run.records[n_records:]
+
+            finally:
+                project.close()
+                Project.delete(name)
+
+            report['results'].extend(run.records)
+
+    finally:
+        MongoDBStorage.set_location(old_url)
+        MongoDBStorage.default_id_format = old_format
+        if tempdir is not None:
+            shutil.rmtree(tempdir, ignore_errors=True)
+
+    return report
+
+
+def compare(report, baseline, tolerance=0.2):
+    """
+    Find benchmarks that became slower
+
+    Parameters
+    ----------
+    report : dict
+        the result of :func:`run_benchmarks`
+    baseline : dict
+        an older result to compare to
+    tolerance : float
+        the allowed relative increase of the time per operation
+
+    Returns
+    -------
+    list of dict
+        the benchmarks that are slower than `(1 + tolerance)` times the
+        baseline with the `ratio` of new and old time per operation
+
+    """
+    def key(record):
+        return (record['benchmark'], record['scale'], record.get('cls'),
+                record.get('method'), record.get('plans'))
+
+    old = {key(record): record for record in baseline['results']}
+
+    slower = []
+    for record in report['results']:
+        base = old.get(key(record))
+        if base is None or not base['us_per_op'] or not record['us_per_op']:
+            continue
+
+        ratio = record['us_per_op'] / base['us_per_op']
+        if ratio > 1.0 + tolerance:
+            slower.append({
+                'benchmark': record['benchmark'],
+                'scale': record['scale'],
+                'cls': record.get('cls'),
+                'method': record.get('method'),
+                'plans': record.get('plans'),
+                'us_per_op': record['us_per_op'],
+                'baseline_us_per_op': base['us_per_op'],
+                'ratio': ratio
+            })
+
+    return slower
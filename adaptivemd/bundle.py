@@ -397,6 +397,138 @@ class ViewBundle(BaseBundle):
                 yield o
 
 
+class QueryBundle(ViewBundle):
+    """
+    A view on a stored bundle where objects are selected by a DB query
+
+    The query is created from the store by a function. If it returns None
+    the objects are filtered by the bool function `view` instead
+    """
+    def __init__(self, bundle, query, view):
+        super(QueryBundle, self).__init__(bundle, view)
+        self.query = query
+
+    def _store_query(self):
+        store = self.bundle._set
+        if store is None:
+            return None, None
+
+        return store, self.query(store)
+
+    def __iter__(self):
+        store, query = self._store_query()
+        if query is None:
+            return super(QueryBundle, self).__iter__()
+
+        return store.find(query)
+
+    def __len__(self):
+        store, query = self._store_query()
+        if query is None:
+            return super(QueryBundle, self).__len__()
+
+        return store.count_matching(query)
+
+    def __contains__(self, item):
+        return self.view(item) and item in self.bundle
+
+    def materialize(self, query=None, max_age=None):
+        """
+        Return a bundle of the entries kept up to date by the store
+
+        Parameters
+        ----------
+        query : dict or None
+            an additional mongodb filter the entries have to match
+        max_age : float or None
+            if set the entries are requested from the DB again after this
+            number of seconds to see deletions of other processes
+
+        Returns
+        -------
+        `MaterializedBundle`
+            the read-only bundle showing filtered entries
+        """
+        def combined(store):
+            base = self.query(store)
+            if query is None:
+                return base
+            elif base is None:
+                return None
+
+            return {'$and': [base, query]}
+
+        return MaterializedBundle(self.bundle, combined, max_age)
+
+
+class MaterializedBundle(BaseBundle):
+    """
+    A view on a stored bundle that is maintained by the store
+
+    The ids of the entries are requested once and then updated from the
+    saves and changes of this process and from recent changes in the DB,
+    see :class:`adaptivemd.mongodb.MaterializedView`. Counting and
+    membership tests only request the recently changed documents.
+    """
+    def __init__(self, bundle, query, max_age=None):
+        super(MaterializedBundle, self).__init__()
+        self.bundle = bundle
+        self.query = query
+        self.max_age = max_age
+        self._view = None
+
+    @property
+    def materialized(self):
+        """
+        `MaterializedView` or None
+            the view of the currently used store
+        """
+        store = self.bundle._set
+        if store is None:
+            return None
+
+        if self._view is None or self._view.store is not store:
+            self._view = store.view(self.query(store), self.max_age)
+
+        return self._view
+
+    def refresh(self):
+        """
+        Request the entries from the DB again
+        """
+        view = self.materialized
+        if view is not None:
+            view.refresh()
+
+    def invalidate(self):
+        """
+        Request the entries from the DB again on the next access
+        """
+        if self._view is not None:
+            self._view.invalidate()
+
+    def __iter__(self):
+        view = self.materialized
+        if view is None:
+            return iter([])
+
+        return iter(view.store.load_many(list(view)))
+
+    def __len__(self):
+        view = self.materialized
+        if view is None:
+            return 0
+
+        return len(view)
+
+    def __contains__(self, item):
+        view = self.materialized
+        if view is None or not hasattr(item, '__uuid__'):
+            return False
+
+        return item.__uuid__ in view
+
+
 class SortedBundle(BaseBundle):
     """
     Sorted view of a bundle
@@ -494,7 +626,8 @@ class StoredBundle(Bundle):
                 n  = 1
 
             logger.info('Adding %s elements of type `%s to store %s`' % (n, it.__class__.__name__, self._set))
-            self._set.save(item)
+            with self._set.storage.bulk_save():
+                self._set.save(item)
 
     @property
     def last(self):
@@ -525,6 +658,54 @@ class StoredBundle(Bundle):
         if self._set is not None:
             return self._set[item]
 
+    def __contains__(self, item):
+        # only stored objects can be part of a store
+        if self._set is not None and hasattr(item, '__uuid__'):
+            return item in self._set
+
+        return False
+
+    def c(self, cls):
+        """
+        Return a view bundle on all entries that are instances of a class
+
+        The entries are selected by a DB query on the stored class name, so
+        only matching objects are loaded
+
+        Parameters
+        ----------
+        cls : `type`
+            a class to be filtered by
+
+        Returns
+        -------
+        `QueryBundle`
+            the read-only bundle showing filtered entries
+        """
+        return QueryBundle(
+            self,
+            lambda store: store.class_filter(cls),
+            lambda x: isinstance(x, cls))
+
+    def materialize(self, query, max_age=None):
+        """
+        Return a bundle of the entries kept up to date by the store
+
+        Parameters
+        ----------
+        query : dict
+            the mongodb filter the entries have to match
+        max_age : float or None
+            if set the entries are requested from the DB again after this
+            number of seconds to see deletions of other processes
+
+        Returns
+        -------
+        `MaterializedBundle`
+            the read-only bundle showing filtered entries
+        """
+        return MaterializedBundle(self, lambda store: query, max_age)
+
     def consume_one(self):
         """
         Picks and removes one (random) element in one step.
@@ -554,4 +735,4 @@ class StoredBundle(Bundle):
         """
 
         if self._set is not None:
-            return [x for x in self._set if getattr(x, key) == value]
+            return self._set.find_all_by(key, value)
@@ -268,6 +268,7 @@ class File(Location):
     the time stamp when it was created.
     """
     _find_by = ['created', 'task']
+    _lazy_fields = ['_file']
 
     created = SyncVariable('created', lambda x: x is not None and x < 0)
     _file = ObjectSyncVariable('_file', lambda x: x is not None)
@@ -564,6 +565,19 @@ class File(Location):
         """
         return self._file is not None
 
+    @property
+    def content_uuid(self):
+        """
+
+        Returns
+        -------
+        int or None
+            the UUID of the stored file content. It is read without loading
+            the content and None if no content is stored
+
+        """
+        return File._file.uuid(self)
+
     def set_file(self, content):
         """
         Set the file content.
@@ -587,6 +601,8 @@ class JSONFile(File):
     A special file which as assumed JSON readable content
     """
     _find_by = ['created', '_data', 'task']
+    _no_index = ['_data']
+    _lazy_fields = []
 
     _data = JSONDataSyncVariable('_data', lambda x: not None)
     # _file = SyncVariable('_data', lambda x: not None)
@@ -629,6 +645,11 @@ class JSONFile(File):
     def has_file(self):
         return self._data is not None
 
+    @property
+    def content_uuid(self):
+        # the content is part of the JSON data and not stored separately
+        return None
+
     def get_file(self):
         if self._data is not None:
             return _json_file_simplifier.to_json(self._data)
@@ -21,7 +21,10 @@
 ##############################################################################
 from __future__ import print_function, absolute_import
 
+import codecs
+
 from .mongodb import StorableMixin
+from .mongodb.compression import compress, decompress
 from .util import DT
 
 
@@ -71,3 +74,188 @@ class LogEntry(StorableMixin):
             self.title,
             self.message
         )
+
+
+class OutputLogEntry(LogEntry):
+    """
+    The stdout or stderr of a task
+
+    Short output is contained in the message. Otherwise the message only has
+    the first and last part of it and the full output is stored in
+    compressed chunks of bounded size in the `output` GridFS bucket. Use
+    :meth:`read` to get all of it.
+
+    Attributes
+    ----------
+    size : int
+        the length of the full output in bytes
+    chunks : int
+        the number of stored chunks, 0 if the message is complete
+    compression : str or None
+        the compression of the chunks, see
+        :func:`mongodb.compression.available_compressions`
+
+    """
+
+    grid_name = 'output'
+
+    def __init__(self, logger, title, message, level=LogEntry.INFO,
+                 objs=None, size=0, chunks=0, compression=None):
+        super(OutputLogEntry, self).__init__(
+            logger, title, message, level, objs)
+        self.size = size
+        self.chunks = chunks
+        self.compression = compression
+
+    @property
+    def truncated(self):
+        """
+        bool : True if the message only contains the head and tail
+        """
+        return self.chunks > 0
+
+    def chunk_id(self, n):
+        return '%s.%d' % (hex(self.__uuid__), n)
+
+    def read(self):
+        """
+        Return the full output
+
+        Returns
+        -------
+        str
+            the output decoded as UTF-8
+
+        """
+        if not self.truncated:
+            return self.message
+
+        grid = self.__store__.storage.create_grid(self.grid_name)
+        data = b''.join(
+            decompress(grid.get(self.chunk_id(n)).read(), self.compression)
+            for n in range(self.chunks))
+
+        return data.decode('utf8', 'replace')
+
+
+class OutputSpool(object):
+    """
+    Capture a stream of output in a file while keeping a preview in memory
+
+    Memory use is bounded by `head_size` and `tail_size`, no matter how
+    much is written.
+    """
+
+    # bytes kept from the start and the end for the message of the log
+    head_size = 16 * 1024
+    tail_size = 16 * 1024
+
+    # uncompressed bytes in a single stored chunk
+    chunk_size = 1024 * 1024
+
+    compression = 'zlib'
+
+    def __init__(self, filename):
+        """
+        Parameters
+        ----------
+        filename : str
+            the file the full output is written to
+        """
+        self.filename = filename
+        self.size = 0
+        self._file = open(filename, 'wb')
+        self._head = bytearray()
+        self._tail = bytearray()
+
+    def write(self, data):
+        """
+        Append output
+
+        Parameters
+        ----------
+        data : bytes
+            the new output
+
+        """
+        self._file.write(data)
+        self.size += len(data)
+
+        if len(self._head) < self.head_size:
+            self._head += data[:self.head_size - len(self._head)]
+
+        self._tail += data
+        if len(self._tail) > self.tail_size:
+            del self._tail[:-self.tail_size]
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    @property
+    def truncated(self):
+        """
+        bool : True if the output does not fit into the preview
+        """
+        return self.size > self.head_size + self.tail_size
+
+    def preview(self):
+        """
+        Return the output or its first and last part if it is too long
+
+        Returns
+        -------
+        str
+            the decoded output
+
+        """
+        if not self.truncated:
+            rest = self.size - len(self._head)
+            data = bytes(self._head) + (bytes(self._tail[-rest:]) if rest else b'')
+            return data.decode('utf8', 'replace')
+
+        # do not show characters that were cut in half
+        head = codecs.getincrementaldecoder('utf8')('replace').decode(
+            bytes(self._head))
+        tail = bytes(self._tail).lstrip(
+            bytes(bytearray(range(0x80, 0xc0)))).decode('utf8', 'replace')
+
+        return '%s\n... [%d bytes omitted, use `.read()`] ...\n%s' % (
+            head, self.size - len(self._head) - len(self._tail), tail)
+
+    def log_entry(self, storage, logger, title):
+        """
+        Create the log entry of the output and store the full output
+
+        Parameters
+        ----------
+        storage : :class:`mongodb.MongoDBStorage`
+            the storage that gets the chunks of long output
+        logger : str
+            the name of the logger
+        title : str
+            the title of the entry
+
+        Returns
+        -------
+        `OutputLogEntry`
+            the log entry to be saved
+
+        """
+        self.close()
+        log = OutputLogEntry(logger, title, self.preview(), size=self.size)
+
+        if self.truncated:
+            grid = storage.create_grid(OutputLogEntry.grid_name)
+            with open(self.filename, 'rb') as f:
+                n = 0
+                for data in iter(lambda: f.read(self.chunk_size), b''):
+                    grid.put(
+                        compress(data, self.compression),
+                        _id=log.chunk_id(n))
+                    n += 1
+
+            log.chunks = n
+            log.compression = self.compression
+
+        return log
@@ -21,9 +21,10 @@
 ##############################################################################
 from __future__ import absolute_import
 
-from .mongodb import StorableMixin
+from .mongodb import StorableMixin, lazy_loading_attributes
 
 
+@lazy_loading_attributes('data')
 class Model(StorableMixin):
     """
     A wrapper to hold model data
@@ -40,8 +41,11 @@ class Model(StorableMixin):
     Attributes
     ----------
     data : dict of str : anything
-        the data of the model
+        the data of the model. It is only loaded from the DB when accessed
     """
+
+    _lazy_fields = ['data']
+
     def __init__(self, data):
         super(Model, self).__init__()
         self.data = data
@@ -27,15 +27,24 @@
 from __future__ import absolute_import
 
 
-from .base import StorableMixin, create_to_dict
-from .syncvar import SyncVariable, ObjectSyncVariable, JSONDataSyncVariable
+from .base import StorableMixin, create_to_dict, uuid_from_db, uuid_to_str, \
+    uuid_to_binary, modified_update
+from .syncvar import SyncVariable, ObjectSyncVariable, JSONDataSyncVariable, \
+    SyncSnapshot, WriteBuffer
 from .cache import WeakKeyCache, WeakLRUCache, WeakValueCache, MaxCache, \
-    NoCache, Cache, LRUCache
-from .dictify import ObjectJSON, UUIDObjectJSON
+    NoCache, Cache, LRUCache, ByteLRUCache, parse_bytes
+from .index import UUIDIndex
+from .dictify import ObjectJSON, UUIDObjectJSON, ClassPlan
 from .mongodb import MongoDBStorage
+from .embedded import SQLiteClient, SQLiteGridFS
+from .clients import get_client, set_client_options, close_clients
+from .migrate import migrate_ids
 
 from .object import ObjectStore
+from .view import MaterializedView
+from .watch import StoreWatch
 
-from .proxy import DelayedLoader, lazy_loading_attributes, LoaderProxy
+from .proxy import DelayedLoader, lazy_loading_attributes, LoaderProxy, \
+    FieldLoaderProxy
 
 from .file import FileStore, DataDict
@@ -27,22 +27,98 @@
 from __future__ import absolute_import
 
 
+import binascii
 import inspect
 import logging
 import time
 import uuid
 import six
 
+from bson.binary import Binary, UUID_SUBTYPE
+
 if six.PY2:
     long_t = long
 else:
     long_t = int
 
-# TODO forward and reverse for hex, int, and uuidstring
-#      representation of object/document IDs
+# the arguments of `__init__` by class, see `StorableMixin.args`
+_init_args = {}
+
+# by class, if an attribute is stored, see `StorableMixin.to_dict`
+_stored_attrs = {}
+
 hex_t = lambda l: hex(l) if six.PY2 else ''.join([hex(l), 'L'])
 #hex_t = lambda l: hex(l).rstrip('L') if six.PY2 else hex(l)
 
+
+# conversions between the int used for `__uuid__` and the representations
+# of object ids in the DB. These avoid creating `uuid.UUID` objects
+
+def uuid_to_str(idx):
+    """
+    Return the UUID string of an object id, e.g. used as document `_id`
+
+    """
+    h = '%032x' % idx
+    return '%s-%s-%s-%s-%s' % (h[:8], h[8:12], h[12:16], h[16:20], h[20:])
+
+
+def uuid_to_binary(idx):
+    """
+    Return an object id as 16 byte BSON UUID (binary subtype 4)
+
+    """
+    return Binary(binascii.unhexlify('%032x' % idx), UUID_SUBTYPE)
+
+
+def uuid_from_db(value):
+    """
+    Return the object id for any of its representations in the DB
+
+    Parameters
+    ----------
+    value : str or `bson.binary.Binary` or `uuid.UUID`
+        a UUID string, a hex string with optional `L` suffix as used in
+        old references, a BSON UUID or a decoded `uuid.UUID`
+
+    Returns
+    -------
+    int
+        the object id
+
+    """
+    if isinstance(value, Binary):
+        return long_t(binascii.hexlify(value), 16)
+    elif isinstance(value, uuid.UUID):
+        return value.int
+    elif value.startswith('0x'):
+        return long_t(value.rstrip('L'), 16)
+    else:
+        return long_t(value.replace('-', ''), 16)
+
+
+def modified_update(update):
+    """
+    Add setting `_modified` to the time of the DB server to an update
+
+    Stores use `_modified` to find changed documents, see
+    :meth:`ObjectStore.watch`. All updates of stored documents should use it
+
+    Parameters
+    ----------
+    update : dict
+        a mongodb update using operators like `$set`
+
+    Returns
+    -------
+    dict
+        the extended update
+
+    """
+    update = dict(update)
+    update['$currentDate'] = {'_modified': True}
+    return update
+
 logger = logging.getLogger(__name__)
 
 
@@ -56,6 +132,23 @@ class StorableMixin(object):
     _ignore = False
     _find_by = []
 
+    # attributes that are stored next to `_find_by` to be used in DB queries.
+    # These are derived values and are not restored when loading
+    _query_by = []
+
+    # fields that other tools add to stored documents and query for. These
+    # are not stored by the object itself, but get a DB index
+    _index_by = []
+
+    # fields of `_find_by` that are never queried and get no DB index, like
+    # large payloads or values that change with every heartbeat
+    _no_index = []
+
+    # large attributes of `to_dict` that are only loaded from the DB when
+    # they are accessed. These need to be handled by a `DelayedLoader`
+    # (see `lazy_loading_attributes`) or a sync variable
+    _lazy_fields = []
+
     INSTANCE_UUID = list(uuid.uuid1().fields[:-1])
     CREATION_COUNT = long_t(0)
     ACTIVE_LONG = int(uuid.UUID(
@@ -245,6 +338,12 @@ class StorableMixin(object):
             included.
 
         """
+        # inspecting the signature is slow and it does not change
+        try:
+            return list(_init_args[cls])
+        except KeyError:
+            pass
+
         try:
             if six.PY2:
                 args = inspect.getargspec(cls.__init__)[0]
@@ -256,6 +355,8 @@ class StorableMixin(object):
                     args = args.args
         except TypeError as t:
             return []
+
+        _init_args[cls] = tuple(args)
         return args
 
     _excluded_attr = []
@@ -276,19 +377,55 @@ class StorableMixin(object):
             the dictionary representing the (immutable) state of the object
 
         """
-        excluded_keys = ['idx', 'json', 'identifier']
-        keys_to_store = {
-            key for key in self.__dict__
-            if key in self._included_attr or (
-                key not in excluded_keys and
-                key not in self._excluded_attr and
-                not (key.startswith('_') and self._exclude_private_attr)
-            )
-        }
+        dct = self._stored_attributes()
+
+        # lazy attributes are handled by descriptors and not in `__dict__`
+        for key in self._lazy_fields:
+            if key not in dct:
+                dct[key] = getattr(self, key)
+
+        return dct
+
+    @classmethod
+    def stores_attribute(cls, key):
+        """
+        Return True if `to_dict` includes an attribute of this name
+
+        Parameters
+        ----------
+        key : str
+            the attribute name
+
+        Returns
+        -------
+        bool
+            True if the attribute is stored
+
+        """
+        return key in cls._included_attr or (
+            key not in ('idx', 'json', 'identifier') and
+            key not in cls._excluded_attr and
+            not (key.startswith('_') and cls._exclude_private_attr)
+        )
+
+    def _stored_attributes(self):
+        # the decision for each attribute name is cached by class
+        cls = self.__class__
+        try:
+            stored = _stored_attrs[cls]
+        except KeyError:
+            stored = _stored_attrs[cls] = {}
+
+        dct = {}
+        for key, value in self.__dict__.items():
+            keep = stored.get(key)
+            if keep is None:
+                keep = stored[key] = cls.stores_attribute(key)
+
+            if keep:
+                dct[key] = value
 
-        return {
-            key: self.__dict__[key] for key in keys_to_store
-        }
+        return dct
 
     @classmethod
     def from_dict(cls, dct):
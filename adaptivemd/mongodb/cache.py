@@ -32,10 +32,76 @@ import weakref
 __author__ = 'Jan-Hendrik Prinz'
 
 
+_byte_units = {
+    'B': 1,
+    'KB': 1024,
+    'MB': 1024 ** 2,
+    'GB': 1024 ** 3
+}
+
+
+def parse_bytes(value):
+    """
+    Convert a memory size like `'64MB'` into a number of bytes
+
+    Parameters
+    ----------
+    value : int or str
+        a number of bytes or a number followed by `B`, `KB`, `MB` or `GB`
+
+    Returns
+    -------
+    int
+        the number of bytes
+
+    """
+    if isinstance(value, int):
+        return value
+
+    text = value.strip().upper()
+    for unit in sorted(_byte_units, key=len, reverse=True):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * _byte_units[unit])
+
+    return int(text)
+
+
 class Cache(object):
     """
     A cache like dict
+
+    Lookups using `cache[key]` are counted as `hits` or `misses`. Objects
+    that a size limited cache drops (or only keeps weakly) are counted as
+    `evictions`.
     """
+
+    # True if `__setitem__` accepts a `size` in bytes
+    sized = False
+
+    hits = 0
+    misses = 0
+    evictions = 0
+
+    @property
+    def stats(self):
+        """
+        dict : the number of `hits`, `misses` and `evictions`
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+    def reset_stats(self):
+        """
+        Set the hit, miss and eviction counters to zero
+
+        """
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
     @property
     def count(self):
         """
@@ -131,6 +197,7 @@ class NoCache(Cache):
         super(NoCache, self).__init__()
 
     def __getitem__(self, item):
+        self.misses += 1
         raise KeyError('No Cache has no items')
 
     def __contains__(self, item):
@@ -168,6 +235,16 @@ class MaxCache(dict, Cache):
         super(MaxCache, self).__init__()
         Cache.__init__(self)
 
+    def __getitem__(self, item):
+        try:
+            obj = dict.__getitem__(self, item)
+        except KeyError:
+            self.misses += 1
+            raise
+
+        self.hits += 1
+        return obj
+
     @property
     def count(self):
         return len(self), 0
@@ -216,17 +293,27 @@ class LRUCache(Cache):
         return reversed(self._cache)
 
     def __getitem__(self, item):
-        obj = self._cache.pop(item)
+        try:
+            obj = self._cache.pop(item)
+        except KeyError:
+            self.misses += 1
+            raise
+
         self._cache[item] = obj
+        self.hits += 1
         return obj
 
     def __setitem__(self, key, value, **kwargs):
         self._cache[key] = value
         self._check_size_limit()
 
+    def __delitem__(self, key):
+        self._cache.pop(key, None)
+
     def _check_size_limit(self):
         while len(self._cache) > self.size_limit:
             self._cache.popitem(last=False)
+            self.evictions += 1
 
     def __contains__(self, item):
         return item in self._cache
@@ -289,11 +376,18 @@ class WeakLRUCache(Cache):
         try:
             obj = self._cache.pop(item)
             self._cache[item] = obj
+            self.hits += 1
             return obj
         except KeyError:
-            obj = self._weak_cache[item]
+            try:
+                obj = self._weak_cache[item]
+            except KeyError:
+                self.misses += 1
+                raise
+
             del self._weak_cache[item]
             self._cache[item] = obj
+            self.hits += 1
             self._check_size_limit()
             return obj
 
@@ -338,10 +432,15 @@ class WeakLRUCache(Cache):
             except KeyError:
                 return None
 
+    def __delitem__(self, key):
+        self._cache.pop(key, None)
+        self._weak_cache.pop(key, None)
+
     def _check_size_limit(self):
         if self.size_limit is not None:
             while len(self._cache) > self.size_limit:
                 self._weak_cache.__setitem__(*self._cache.popitem(last=False))
+                self.evictions += 1
 
     def __contains__(self, item):
         return item in self._cache or item in self._weak_cache
@@ -373,6 +472,111 @@ class WeakLRUCache(Cache):
             yield key
 
 
+class ByteLRUCache(WeakLRUCache):
+    """
+    A Least Recently Used Cache limited by the memory of its objects
+
+    Like :class:`WeakLRUCache` objects that do not fit into the budget are
+    only kept as weak references. The size of an object is given when it is
+    added, usually the length of its stored document, otherwise
+    `default_item_size` is used.
+    """
+
+    sized = True
+
+    # bytes assumed for objects added without a size
+    default_item_size = 1024
+
+    def __init__(self, max_bytes, weak_type='value'):
+        """
+        Parameters
+        ----------
+        max_bytes : int
+            the number of bytes of strongly referenced objects
+        weak_type : str
+            `value` or `key`, see :class:`WeakLRUCache`
+        """
+        super(ByteLRUCache, self).__init__(None, weak_type)
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._sizes = {}
+
+    @property
+    def size(self):
+        return -1, -1
+
+    @property
+    def stats(self):
+        stats = super(ByteLRUCache, self).stats
+        stats['bytes'] = self.nbytes
+        stats['max_bytes'] = self.max_bytes
+        return stats
+
+    def _item_size(self, key):
+        return self._sizes.get(key, self.default_item_size)
+
+    def clear(self):
+        super(ByteLRUCache, self).clear()
+        self._sizes.clear()
+        self.nbytes = 0
+
+    def __getitem__(self, item):
+        try:
+            obj = self._cache.pop(item)
+            self._cache[item] = obj
+            self.hits += 1
+            return obj
+        except KeyError:
+            try:
+                obj = self._weak_cache[item]
+            except KeyError:
+                self.misses += 1
+                raise
+
+            del self._weak_cache[item]
+            self._cache[item] = obj
+            self.nbytes += self._item_size(item)
+            self.hits += 1
+            self._check_size_limit()
+            return obj
+
+    def __setitem__(self, key, value, size=None, **kwargs):
+        if key in self._cache:
+            self.nbytes -= self._item_size(key)
+            del self._cache[key]
+        else:
+            self._weak_cache.pop(key, None)
+
+        if size is not None:
+            self._sizes[key] = size
+
+        self._cache[key] = value
+        self.nbytes += self._item_size(key)
+        self._check_size_limit()
+
+    def __delitem__(self, key):
+        if key in self._cache:
+            self.nbytes -= self._item_size(key)
+            del self._cache[key]
+
+        self._weak_cache.pop(key, None)
+        self._sizes.pop(key, None)
+
+    def _check_size_limit(self):
+        # keep at least the last object, even if it is too large
+        while self.nbytes > self.max_bytes and len(self._cache) > 1:
+            key, value = self._cache.popitem(last=False)
+            self.nbytes -= self._item_size(key)
+            self._weak_cache[key] = value
+            self.evictions += 1
+
+        if len(self._sizes) > 2 * (len(self._cache) + len(self._weak_cache)):
+            # forget sizes of objects that were garbage collected
+            self._sizes = {
+                key: size for key, size in self._sizes.items()
+                if key in self._cache or key in self._weak_cache}
+
+
 class WeakValueCache(weakref.WeakValueDictionary, Cache):
     """
     Implements a cache that keeps weak references to all elements
@@ -382,6 +586,16 @@ class WeakValueCache(weakref.WeakValueDictionary, Cache):
         weakref.WeakValueDictionary.__init__(self, *args, **kwargs)
         Cache.__init__(self)
 
+    def __getitem__(self, item):
+        try:
+            obj = weakref.WeakValueDictionary.__getitem__(self, item)
+        except KeyError:
+            self.misses += 1
+            raise
+
+        self.hits += 1
+        return obj
+
     @property
     def count(self):
         return 0, len(self)
@@ -396,6 +610,16 @@ class WeakKeyCache(weakref.WeakKeyDictionary, Cache):
     Implements a cache that keeps weak references to all elements
     """
 
+    def __getitem__(self, item):
+        try:
+            obj = weakref.WeakKeyDictionary.__getitem__(self, item)
+        except KeyError:
+            self.misses += 1
+            raise
+
+        self.hits += 1
+        return obj
+
     @property
     def count(self):
         return 0, len(self)
@@ -0,0 +1,141 @@
+##############################################################################
+# adaptiveMD: A Python Framework to Run Adaptive Molecular Dynamics (MD)
+#             Simulations on HPC Resources
+# Copyright 2017 FU Berlin and the Authors
+#
+# Authors: Jan-Hendrik Prinz
+# Contributors:
+#
+# `adaptiveMD` is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with MDTraj. If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+"""
+Process wide registry of DB clients
+
+Each client keeps a pool of connections to the server. All parts of
+adaptiveMD that talk to the same DB url in a process, such as projects,
+workers and the RP database access, share one client from
+:func:`get_client`. Clients are not inherited by child processes. After a
+fork, new clients are created on first use.
+"""
+from __future__ import absolute_import
+
+import logging
+import os
+import threading
+
+from pymongo import MongoClient
+
+from .embedded import SQLiteClient
+
+logger = logging.getLogger(__name__)
+
+# options for all new `MongoClient` instances, see `set_client_options`
+client_options = {}
+
+_clients = {}
+_lock = threading.Lock()
+_pid = os.getpid()
+
+
+def set_client_options(**options):
+    """
+    Set the options used for new MongoDB clients
+
+    The options are passed to `pymongo.MongoClient`, e.g. `maxPoolSize`,
+    `minPoolSize`, `serverSelectionTimeoutMS`, `socketTimeoutMS` or
+    `readPreference`. Options set to None are removed. Existing clients
+    are not changed, use :func:`close_clients` to recreate them.
+
+    Parameters
+    ----------
+    options : dict
+        the client options
+
+    """
+    for key, value in options.items():
+        if value is None:
+            client_options.pop(key, None)
+        else:
+            client_options[key] = value
+
+
+def _check_fork():
+    # the connection pools of the parent cannot be used after a fork
+    global _pid
+    if os.getpid() != _pid:
+        _clients.clear()
+        _pid = os.getpid()
+
+
+def _key(url, options):
+    return url, tuple(sorted((key, repr(v)) for key, v in options.items()))
+
+
+def get_client(url, **options):
+    """
+    Return the shared client for a DB url
+
+    Parameters
+    ----------
+    url : str
+        the url of the DB. `sqlite` urls use the embedded backend
+        :class:`mongodb.embedded.SQLiteClient`
+    options : dict
+        options that replace the ones from :func:`set_client_options` for
+        this client. Different options result in a different client
+
+    Returns
+    -------
+    `pymongo.MongoClient` or :class:`mongodb.embedded.SQLiteClient`
+        the client. Do not close it, it is used by others
+
+    """
+    with _lock:
+        _check_fork()
+
+        if url.startswith('sqlite:'):
+            options = {}
+        else:
+            options = dict(client_options, **options)
+
+        key = _key(url, options)
+        client = _clients.get(key)
+        if client is None:
+            if url.startswith('sqlite:'):
+                client = SQLiteClient(url)
+            else:
+                logger.debug('Connecting to %s' % url)
+                # decoded binary ids can be used in queries again
+                client = MongoClient(
+                    url, uuidRepresentation='standard', **options)
+
+            _clients[key] = client
+
+        return client
+
+
+def close_clients():
+    """
+    Close all clients of this process
+
+    Clients requested afterwards are connected again.
+
+    """
+    with _lock:
+        _check_fork()
+        clients = list(_clients.values())
+        _clients.clear()
+
+    for client in clients:
+        client.close()
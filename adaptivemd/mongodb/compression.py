@@ -0,0 +1,120 @@
+##############################################################################
+# adaptiveMD: A Python Framework to Run Adaptive Molecular Dynamics (MD)
+#             Simulations on HPC Resources
+# Copyright 2017 FU Berlin and the Authors
+#
+# Authors: Jan-Hendrik Prinz
+# Contributors:
+#
+# `adaptiveMD` is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with MDTraj. If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+from __future__ import absolute_import
+
+import zlib
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+try:
+    import blosc
+except ImportError:
+    blosc = None
+
+
+def available_compressions():
+    """
+    Return the names of the compression methods that can be used
+
+    `zlib` is always available, `lz4` and `blosc` only if the packages
+    are installed.
+
+    Returns
+    -------
+    list of str
+        the names of the usable methods
+
+    """
+    methods = ['zlib']
+    if lz4_frame is not None:
+        methods.append('lz4')
+    if blosc is not None:
+        methods.append('blosc')
+
+    return methods
+
+
+def _check(method):
+    if method not in available_compressions():
+        raise ValueError(
+            'Compression `%s` is not available. Use one of %s' % (
+                method, available_compressions()))
+
+
+def compress(data, method, typesize=1):
+    """
+    Compress a buffer
+
+    Parameters
+    ----------
+    data : bytes-like
+        the buffer to be compressed, e.g. a contiguous numpy array
+    method : str
+        one of `zlib`, `lz4` or `blosc`
+    typesize : int
+        the size of a single item in bytes. Only used by `blosc` to shuffle
+        the bytes of numeric data before compression
+
+    Returns
+    -------
+    bytes
+        the compressed data
+
+    """
+    _check(method)
+
+    if method == 'zlib':
+        return zlib.compress(data, 1)
+    elif method == 'lz4':
+        return lz4_frame.compress(data)
+    elif method == 'blosc':
+        return blosc.compress(data, typesize=typesize)
+
+
+def decompress(data, method):
+    """
+    Decompress a buffer created by :func:`compress`
+
+    Parameters
+    ----------
+    data : bytes
+        the compressed data
+    method : str
+        the method used for compression
+
+    Returns
+    -------
+    bytes
+        the original data
+
+    """
+    _check(method)
+
+    if method == 'zlib':
+        return zlib.decompress(data)
+    elif method == 'lz4':
+        return lz4_frame.decompress(data)
+    elif method == 'blosc':
+        return blosc.decompress(data)
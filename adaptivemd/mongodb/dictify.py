@@ -27,24 +27,113 @@
 from __future__ import absolute_import, print_function
 
 import base64
+import hashlib
 import importlib
+import threading
+from contextlib import contextmanager
 
 import numpy as np
 import math
 import abc
 from uuid import UUID
 
+import gridfs
 import six
 import ujson
+from bson.binary import Binary
 
 import marshal
 import types
 import opcode
 
-from .base import StorableMixin, long_t
+from .base import StorableMixin, long_t, uuid_from_db, uuid_to_str, \
+    uuid_to_binary
+from .compression import compress, decompress
 
 __author__ = 'Jan-Hendrik Prinz'
 
+# values that are stored as they are
+_plain_types = frozenset(
+    (str, bool, type(None), six.text_type) + six.integer_types)
+
+# keys that mark a dict as an encoded object in `ObjectJSON.build`
+_build_markers = frozenset([
+    '_slice', '_numpy', '_float', '_integer', '_uuid', '_cls', '_tuple',
+    '_type', '_dict', '_import', '_marshal', '_module'])
+
+_generic_to_dict = six.get_unbound_function(StorableMixin.to_dict)
+_generic_from_dict = StorableMixin.from_dict.__func__
+
+
+class ClassPlan(object):
+    """
+    The conversion of objects of one storable class from and to dicts
+
+    Everything that only depends on the class is looked up once, e.g. the
+    arguments of `__init__` and the `_lazy_fields`. Classes with their own
+    `to_dict` or `from_dict` use these instead.
+
+    Attributes
+    ----------
+    cls : type
+        the storable class
+    name : str
+        the class name used as `_cls`
+
+    """
+
+    def __init__(self, cls):
+        self.cls = cls
+        self.name = cls.__name__
+
+        if six.get_unbound_function(cls.to_dict) is _generic_to_dict:
+            self._lazy_fields = list(cls._lazy_fields)
+            self.to_dict = self._attribute_dict
+        else:
+            self.to_dict = self._own_to_dict
+
+        if cls.from_dict.__func__ is _generic_from_dict:
+            self._args = frozenset(cls.args())
+            self._restore = cls._restore_non_initial_attr
+            self.from_dict = self._from_attributes
+        else:
+            self.from_dict = cls.from_dict
+
+    @staticmethod
+    def _own_to_dict(obj):
+        return obj.to_dict()
+
+    def _attribute_dict(self, obj):
+        if type(obj) is not self.cls:
+            # e.g. a proxy for an object of this class
+            return obj.to_dict()
+
+        dct = obj._stored_attributes()
+        for key in self._lazy_fields:
+            if key not in dct:
+                dct[key] = getattr(obj, key)
+
+        return dct
+
+    def _from_attributes(self, dct):
+        if dct is None:
+            dct = {}
+
+        args = self._args
+        try:
+            obj = self.cls(**{
+                key: value for key, value in dct.items() if key in args})
+        except TypeError:
+            # raises with a description of the stored parameters
+            return self.cls.from_dict(dct)
+
+        if self._restore:
+            for key, value in dct.items():
+                if key not in args:
+                    setattr(obj, key, value)
+
+        return obj
+
 
 class ObjectJSON(object):
     """
@@ -54,9 +143,25 @@ class ObjectJSON(object):
 
     allow_marshal = True
 
+    # compression used for numpy arrays. One of `None`, `zlib`, `lz4` or
+    # `blosc`, see :func:`compression.available_compressions`
+    array_compression = None
+
+    # arrays with less bytes are never compressed
+    array_compression_min_size = 4096
+
     # switch to `true`, if you want more protection
     prevent_unsafe_modules = False
 
+    # the representation of the `_id` of simplified objects
+    id_format = 'string'
+
+    # use a cached `ClassPlan` for each storable class
+    use_plans = True
+
+    _build_markers = _build_markers
+    db_id = staticmethod(uuid_to_str)
+
     allowed_storable_atomic_types = [
         int, float, bool, long_t, str,
         np.float32, np.float64,
@@ -81,6 +186,8 @@ class ObjectJSON(object):
         self.allowed_storable_types = dict()
         self.type_names = {}
         self.type_classes = {}
+        self._plans = {}
+        self._local = threading.local()
 
         self.update_class_list()
 
@@ -92,13 +199,56 @@ class ObjectJSON(object):
         self.type_classes = {
             cls: name for name, cls in self.type_names.items()}
 
+    def plan(self, cls):
+        """
+        Return the conversion plan of a storable class
+
+        Plans are created on first use and cached
+
+        Parameters
+        ----------
+        cls : type
+            a subclass of :class:`mongodb.StorableMixin`
+
+        Returns
+        -------
+        :class:`ClassPlan`
+            the plan of the class
+
+        """
+        try:
+            return self._plans[cls]
+        except KeyError:
+            plan = self._plans[cls] = ClassPlan(cls)
+            return plan
+
+    def _to_dict(self, obj):
+        if self.use_plans and isinstance(obj, StorableMixin):
+            return self.plan(obj.__class__).to_dict(obj)
+
+        return obj.to_dict()
+
+    def _from_dict(self, cls, dct):
+        if self.use_plans:
+            return self.plan(cls).from_dict(dct)
+
+        return cls.from_dict(dct)
+
     def simplify_object(self, obj):
         return {
             '_cls': obj.__class__.__name__,
-            '_dict': self.simplify(obj.to_dict(), obj.base_cls_name)
+            '_dict': self.simplify(self._to_dict(obj), obj.base_cls_name)
         }
 
     def simplify(self, obj, base_type=''):
+        # the most frequent types first
+        if type(obj) in _plain_types:
+            return obj
+        elif type(obj) is list:
+            return [self.simplify(o, base_type) for o in obj]
+        elif type(obj) is dict:
+            return self._simplify_dict(obj)
+
         if obj.__class__.__name__ == 'module':
             # store an imported module
             if obj.__name__.split('.')[0] in self.safe_modules:
@@ -139,26 +289,21 @@ class ObjectJSON(object):
             #             '_units': self.unit_to_dict(obj.unit)
             #         }
             if obj.__class__ is np.ndarray:
-                # this is maybe not the best way to store large numpy arrays!
-                return {
-                    '_numpy': self.simplify(obj.shape),
-                    '_dtype': str(obj.dtype),
-                    '_data': base64.b64encode(obj.copy(order='C'))
-                }
+                return self.simplify_array(obj)
             elif hasattr(obj, 'to_dict'):
                 # the object knows how to dismantle itself into a json string
                 if hasattr(obj, '__uuid__'):
                     return {
                         '_cls': obj.__class__.__name__,
-                        '_obj_uuid': str(UUID(int=obj.__uuid__)),
-                        '_dict': self.simplify(obj.to_dict(), base_type)}
+                        '_obj_uuid': uuid_to_str(obj.__uuid__),
+                        '_dict': self.simplify(self._to_dict(obj), base_type)}
                 else:
                     return {
                         '_cls': obj.__class__.__name__,
-                        '_dict': self.simplify(obj.to_dict(), base_type)}
+                        '_dict': self.simplify(self._to_dict(obj), base_type)}
             elif type(obj) is UUID:
                 return {
-                    '_uuid': str(UUID(int=obj))}
+                    '_uuid': str(obj)}
 
             # we will convert numpy scalars to python scalar (and cross fingers)
             elif isinstance(obj, np.bool_):
@@ -174,35 +319,123 @@ class ObjectJSON(object):
             return [self.simplify(o, base_type) for o in obj]
         elif type(obj) is tuple:
             return {'_tuple': [self.simplify(o, base_type) for o in obj]}
-        elif type(obj) is dict:
-            # we want to support storable objects as keys so we need to wrap
-            # dicts with care and store them using tuples
-
-            simple = [
-                key for key in obj.keys()
-                if type(key) is str or type(key) is int]
+        elif type(obj) is slice:
+            return {
+                '_slice': [obj.start, obj.stop, obj.step]}
+        else:
+            oo = obj
+            return oo
 
-            if len(simple) < len(obj):
+    def _simplify_dict(self, obj):
+        # we want to support storable objects as keys so we need to wrap
+        # dicts with care and store them using tuples
+        excluded = self.excluded_keys
+        for key in obj:
+            if type(key) is not str and type(key) is not int:
                 # other keys than int or str
-                result = {
+                return {
                     '_dict': [
                         self.simplify(tuple([key, o]))
                         for key, o in obj.items()
-                        if key not in self.excluded_keys
+                        if key not in excluded
                     ]}
-            else:
-                result = {
-                    key: self.simplify(o) for key, o in obj.items()
-                    if key not in self.excluded_keys
-                }
 
-            return result
-        elif type(obj) is slice:
-            return {
-                '_slice': [obj.start, obj.stop, obj.step]}
+        return {
+            key: self.simplify(o) for key, o in obj.items()
+            if key not in excluded
+        }
+
+    @contextmanager
+    def _text_mode(self):
+        # inside this context arrays are encoded as base64 strings and ids
+        # as hex strings, since raw bytes cannot be represented in JSON
+        level = getattr(self._local, 'text', 0)
+        self._local.text = level + 1
+        try:
+            yield
+        finally:
+            self._local.text = level
+
+    def simplify_array(self, arr):
+        """
+        Turn a numpy array into a dict
+
+        The raw bytes are stored as BSON `Binary` so a document stored in the
+        DB does not need base64 encoding. For JSON output (see :meth:`to_json`)
+        the bytes are base64 encoded instead. Arrays with at least
+        `array_compression_min_size` bytes are compressed using
+        `array_compression`.
+
+        Parameters
+        ----------
+        arr : `numpy.ndarray`
+            the array to be simplified
+
+        Returns
+        -------
+        dict
+            the simplified array
+
+        """
+        arr = np.ascontiguousarray(arr)
+
+        dct = {
+            '_numpy': self.simplify(arr.shape),
+            '_dtype': arr.dtype.str
+        }
+
+        method = self.array_compression
+        if method is not None and arr.nbytes >= self.array_compression_min_size:
+            data = compress(arr, method, arr.dtype.itemsize)
+            dct['_compression'] = method
         else:
-            oo = obj
-            return oo
+            data = arr.tobytes()
+
+        if getattr(self._local, 'text', 0):
+            dct['_data'] = base64.b64encode(data).decode('ascii')
+        else:
+            self._store_array_bytes(dct, data)
+
+        return dct
+
+    def _store_array_bytes(self, dct, data):
+        dct['_bytes'] = Binary(data)
+
+    def _load_array_bytes(self, obj):
+        if '_bytes' in obj:
+            return obj['_bytes']
+        else:
+            # base64 as used in JSON and by older versions
+            return base64.b64decode(obj['_data'])
+
+    def build_array(self, obj):
+        """
+        Create a numpy array from a dict created by :meth:`simplify_array`
+
+        The array uses the decoded bytes as its buffer without copying
+        and is therefore read-only.
+
+        Parameters
+        ----------
+        obj : dict
+            the simplified array
+
+        Returns
+        -------
+        `numpy.ndarray`
+            the (read-only) array
+
+        """
+        data = self._load_array_bytes(obj)
+
+        method = obj.get('_compression')
+        if method is not None:
+            data = decompress(data, method)
+
+        return np.frombuffer(
+            data,
+            dtype=np.dtype(obj['_dtype'])).reshape(
+                self.build(obj['_numpy']))
 
     @staticmethod
     def _unicode2str(s):
@@ -214,6 +447,16 @@ class ObjectJSON(object):
 
     def build(self, obj):
         if type(obj) is dict:
+            if self._build_markers.isdisjoint(obj):
+                # a plain dict, the most frequent case
+                if six.PY2:
+                    return {
+                        self._unicode2str(key): self.build(o)
+                        for key, o in obj.items()
+                    }
+
+                return {key: self.build(o) for key, o in obj.items()}
+
             # if '_units' in obj and '_value' in obj:
             #     return self.build(
             #         obj['_value']) * self.unit_from_dict(obj['_units'])
@@ -222,11 +465,7 @@ class ObjectJSON(object):
                 return slice(*obj['_slice'])
 
             elif '_numpy' in obj:
-                return np.frombuffer(
-                    base64.b64decode(obj['_data']),
-                    dtype=np.dtype(obj['_dtype'])).reshape(
-                        self.build(obj['_numpy'])
-                )
+                return self.build_array(obj)
 
             elif '_float' in obj:
                 return float(str(obj['_float']))
@@ -235,7 +474,7 @@ class ObjectJSON(object):
                 return float(str(obj['_integer']))
 
             elif '_uuid' in obj:
-                return int(UUID(obj['_uuid']))
+                return uuid_from_db(obj['_uuid'])
 
             elif '_cls' in obj and '_dict' in obj:
                 if obj['_cls'] not in self.class_list:
@@ -251,10 +490,10 @@ class ObjectJSON(object):
                             obj['_cls'])
 
                 attributes = self.build(obj['_dict'])
-                ret = self.class_list[obj['_cls']].from_dict(attributes)
+                ret = self._from_dict(self.class_list[obj['_cls']], attributes)
                 if '_obj_uuid' in obj:
                     # vals = {x: getattr(ret, x) for x in ret._find_by}
-                    ret.__uuid__ = int(UUID(obj['_obj_uuid']))
+                    ret.__uuid__ = uuid_from_db(obj['_obj_uuid'])
                     # for k,v in vals.iteritems():
                     #     setattr(ret, )
 
@@ -293,6 +532,9 @@ class ObjectJSON(object):
         elif type(obj) is list:
             return [self.build(o) for o in obj]
 
+        elif type(obj) in _plain_types and type(obj) is not six.text_type:
+            return obj
+
         # unicode in py2 and str in py3
         elif type(obj) is six.text_type:
             return self._unicode2str(obj)
@@ -499,15 +741,19 @@ class ObjectJSON(object):
         return [code.__code__.co_names[i[1]] for i in ret]
 
     def to_json(self, obj, base_type=''):
-        simplified = self.simplify(obj, base_type)
+        with self._text_mode():
+            simplified = self.simplify(obj, base_type)
+
         return ujson.dumps(simplified)
 
     def to_json_object(self, obj):
-        if hasattr(obj, 'base_cls') \
-                and type(obj) is not type and type(obj) is not abc.ABCMeta:
-            simplified = self.simplify_object(obj)
-        else:
-            simplified = self.simplify(obj)
+        with self._text_mode():
+            if hasattr(obj, 'base_cls') \
+                    and type(obj) is not type \
+                    and type(obj) is not abc.ABCMeta:
+                simplified = self.simplify_object(obj)
+            else:
+                simplified = self.simplify(obj)
 
         return ujson.dumps(simplified)
 
@@ -525,7 +771,7 @@ class ObjectJSON(object):
     def from_simple_dict(self, simplified, builder=None):
         obj = self.build(simplified)
 
-        obj.__uuid__ = int(UUID(simplified.get('_id')))
+        obj.__uuid__ = uuid_from_db(simplified.get('_id'))
         obj.__time__ = simplified.get('_time', 0)  # use time or 0 if unset
 
         if 'name' in simplified:
@@ -544,11 +790,37 @@ class ObjectJSON(object):
     def to_simple_dict(self, obj, base_type=''):
         dct = {
             '_cls': obj.__class__.__name__,
-            '_obj_uuid': str(UUID(int=obj.__uuid__)),
-            '_dict': self.simplify(obj.to_dict(), base_type),
-            '_id': str(UUID(int=obj.__uuid__)),
+            '_dict': self.simplify(self._to_dict(obj), base_type),
+            '_id': self.db_id(obj.__uuid__),
             '_time': int(obj.__time__)}
 
+        if self.id_format == 'string':
+            # the same as `_id`, kept for readers of older versions
+            dct['_obj_uuid'] = dct['_id']
+
+        dct.update(self.search_fields(obj))
+
+        return dct
+
+    def search_fields(self, obj):
+        """
+        Return the simplified fields of an object stored next to `_dict`
+
+        These are `name`, `_find_by` and `_query_by` and hold the current
+        values of sync variables.
+
+        Parameters
+        ----------
+        obj : :class:`mongodb.base.StorableMixin`
+            the object
+
+        Returns
+        -------
+        dict
+            the simplified values by field name
+
+        """
+        dct = {}
         if hasattr(obj, 'name'):
             dct['name'] = obj.name
 
@@ -556,16 +828,288 @@ class ObjectJSON(object):
             if hasattr(obj, key):
                 dct[key] = self.simplify(getattr(obj, key))
 
+        for key in obj._query_by:
+            dct[key] = self.simplify(getattr(obj, key))
+
         return dct
 
 
 class UUIDObjectJSON(ObjectJSON):
+    # number of reference levels that are fetched in bulk before an object
+    # graph is built. `0` disables prefetching
+    default_prefetch_depth = 4
+
+    # arrays with more (compressed) bytes are stored in GridFS instead of
+    # inside the document to stay below the document size limit
+    array_gridfs_min_size = 4 * 1024 * 1024
+
     def __init__(self, storage, unit_system=None):
         super(UUIDObjectJSON, self).__init__(unit_system)
         self.excluded_keys = ['json']
         self.storage = storage
+        self.prefetch_depth = self.default_prefetch_depth
+        self._array_grid = None
+
+    @property
+    def _prefetched(self):
+        try:
+            return self._local.prefetched
+        except AttributeError:
+            self._local.prefetched = {}
+            self._local.level = 0
+            return self._local.prefetched
+
+    @property
+    def id_format(self):
+        """
+        str : `string` or `binary`, the id format of the storage
+        """
+        return self.storage.id_format
+
+    def db_id(self, idx):
+        return self.storage.db_id(idx)
+
+    def _binary_ids(self):
+        return self.storage.id_format == 'binary' and \
+            not getattr(self._local, 'text', 0)
+
+    def reference(self, obj, store_name):
+        """
+        Return the simplified reference to a stored object
+
+        Parameters
+        ----------
+        obj : :class:`mongodb.StorableMixin`
+            the referenced object
+        store_name : str
+            the name of the store that holds `obj`
+
+        Returns
+        -------
+        dict
+            the reference using `_bin_uuid` for binary ids and `_hex_uuid`
+            otherwise
+
+        """
+        if self._binary_ids():
+            return {
+                '_bin_uuid': uuid_to_binary(obj.__uuid__),
+                '_store': store_name}
+        else:
+            return {
+                '_hex_uuid': hex(obj.__uuid__),
+                '_store': store_name}
+
+    def reference_filter(self, path, objs):
+        """
+        Return a DB filter for references to one of the given objects
+
+        Parameters
+        ----------
+        path : str
+            the (dotted) name of the field in the document, e.g.
+            `_dict.generator`
+        objs : list of :class:`mongodb.StorableMixin`
+            the objects that can be referenced
+
+        Returns
+        -------
+        dict
+            the mongodb filter
+
+        """
+        if self._binary_ids():
+            return {path + '._bin_uuid': {
+                '$in': [uuid_to_binary(obj.__uuid__) for obj in objs]}}
+        else:
+            return {path + '._hex_uuid': {
+                '$in': [hex(obj.__uuid__) for obj in objs]}}
+
+    def value_filter(self, path, value):
+        """
+        Return a DB filter for documents where a field is equal to a value
+
+        In contrast to :meth:`simplify` storable objects are not saved. They
+        are matched by a reference to their id.
+
+        Parameters
+        ----------
+        path : str
+            the (dotted) name of the field in the document, e.g.
+            `_dict.location`
+        value : object
+            the value to be matched
+
+        Returns
+        -------
+        dict or None
+            the mongodb filter or None if the stored form of `value` is
+            not known, e.g. for lists, dicts or arrays
+
+        """
+        if value is None or type(value) in \
+                (bool, str, six.text_type) + six.integer_types:
+            return {path: value}
+        elif type(value) is float and not math.isinf(value):
+            return {path: value}
+        elif type(value) is UUID:
+            return {path: self.db_id(value.int)}
+        elif value.__class__ in self.storage._obj_store:
+            return self.reference_filter(path, [value])
+
+        return None
+
+    @staticmethod
+    def _reference_uuid(obj):
+        if '_bin_uuid' in obj:
+            return uuid_from_db(obj['_bin_uuid'])
+        elif '_hex_uuid' in obj:
+            return uuid_from_db(obj['_hex_uuid'])
+        else:
+            return uuid_from_db(obj['_obj_uuid'])
+
+    @staticmethod
+    def _is_reference(obj):
+        return '_store' in obj and (
+            '_bin_uuid' in obj or '_hex_uuid' in obj or '_obj_uuid' in obj)
+
+    def _collect_references(self, obj, refs):
+        if type(obj) is dict:
+            if self._is_reference(obj):
+                refs.setdefault(obj['_store'], set()).add(
+                    self._reference_uuid(obj))
+            else:
+                for o in obj.values():
+                    self._collect_references(o, refs)
+
+        elif type(obj) is list:
+            for o in obj:
+                self._collect_references(o, refs)
+
+    def prefetch(self, docs):
+        """
+        Fetch all documents referenced from the given ones in bulk
+
+        References are followed for `prefetch_depth` levels. For each level
+        and store only one query is sent for all referenced objects that are
+        neither cached nor prefetched already. The documents are kept until
+        the outermost build finishes and are used by `ObjectStore.load`
+        instead of querying each object separately.
+
+        Parameters
+        ----------
+        docs : list of dict
+            the (simplified) documents to be built
+
+        Returns
+        -------
+        int
+            the number of prefetched documents
+
+        """
+        prefetched = self._prefetched
+        stores = self.storage._stores
+        count = 0
+        level = list(docs)
+
+        for _ in range(self.prefetch_depth):
+            refs = {}
+            for doc in level:
+                self._collect_references(doc, refs)
+
+            level = []
+            for name, idxs in refs.items():
+                store = stores.get(name)
+                if store is None:
+                    continue
+
+                pending = prefetched.setdefault(name, {})
+                idxs = [
+                    idx for idx in idxs
+                    if idx not in pending and idx not in store.cache]
+
+                if idxs:
+                    found = store._load_batch(idxs)
+                    pending.update(found)
+                    level.extend(found.values())
+                    count += len(found)
+
+            if not level:
+                break
+
+        return count
+
+    def pop_prefetched(self, store_name, idx):
+        """
+        Return and forget a prefetched document, None if it is not present
+
+        """
+        return self._prefetched.get(store_name, {}).pop(idx, None)
+
+    @contextmanager
+    def prefetching(self, docs):
+        """
+        Context to build the given documents with prefetched references
+
+        Prefetched documents are discarded when the outermost context exits
+        so they cannot be used later when they might be outdated.
+
+        Parameters
+        ----------
+        docs : list of dict
+            the (simplified) documents to be built in this context
+
+        """
+        prefetched = self._prefetched
+        self._local.level += 1
+        try:
+            if self.prefetch_depth > 0:
+                self.prefetch(docs)
+
+            yield
+
+        finally:
+            self._local.level -= 1
+            if self._local.level == 0:
+                prefetched.clear()
+
+    @property
+    def array_grid(self):
+        """
+        `gridfs.GridFS` : the file system that holds large numpy arrays
+        """
+        if self._array_grid is None:
+            self._array_grid = self.storage.create_grid('arrays')
+
+        return self._array_grid
+
+    def _store_array_bytes(self, dct, data):
+        if len(data) < self.array_gridfs_min_size:
+            super(UUIDObjectJSON, self)._store_array_bytes(dct, data)
+            return
+
+        # content addressed, so saving an array again does not duplicate it
+        _id = hashlib.sha1(data).hexdigest()
+        grid = self.array_grid
+        if not grid.exists(_id):
+            try:
+                grid.put(data, _id=_id)
+            except gridfs.errors.FileExists:
+                # stored at the same time from somewhere else
+                pass
+
+        dct['_gridfs'] = _id
+
+    def _load_array_bytes(self, obj):
+        if '_gridfs' in obj:
+            return self.array_grid.get(obj['_gridfs']).read()
+
+        return super(UUIDObjectJSON, self)._load_array_bytes(obj)
 
     def simplify(self, obj, base_type=''):
+        if type(obj) in _plain_types:
+            return obj
+
         if obj is self.storage:
             return {'_storage': 'self'}
 
@@ -574,10 +1118,12 @@ class UUIDObjectJSON(ObjectJSON):
                 if not obj._ignore:
                     store = self.storage._obj_store[obj.__class__]
                     store.save(obj)
-                    return {
-                        '_hex_uuid': hex(obj.__uuid__),
-                        '_store': store.name
-                        }
+                    return self.reference(obj, store.name)
+
+            elif type(obj) is UUID and not getattr(self._local, 'text', 0):
+                # ids used in queries like `Task.waiting_on` are stored
+                # like the `_id` of documents
+                return self.db_id(obj.int)
 
         return super(UUIDObjectJSON, self).simplify(obj, base_type)
 
@@ -589,17 +1135,13 @@ class UUIDObjectJSON(ObjectJSON):
 
             elif '_obj_uuid' in obj and '_store' in obj:
                 store = self.storage._stores[obj['_store']]
-                result = store.load(int(UUID(obj['_obj_uuid'])))
+                result = store.load(uuid_from_db(obj['_obj_uuid']))
 
                 return result
 
-            elif '_hex_uuid' in obj and '_store' in obj:
+            elif '_store' in obj and ('_hex_uuid' in obj or '_bin_uuid' in obj):
                 store = self.storage._stores[obj['_store']]
-                hex_uuid = obj['_hex_uuid']
-                if six.PY3:
-                    hex_uuid = hex_uuid.rstrip("L")
-
-                _long = long_t(hex_uuid, 16)
+                _long = self._reference_uuid(obj)
                 # FIXME extend to check for infinite
                 #       recursion via any cycle of builders
                 # FIXME this condition check will result in
@@ -0,0 +1,1042 @@
+##############################################################################
+# adaptiveMD: A Python Framework to Run Adaptive Molecular Dynamics (MD)
+#             Simulations on HPC Resources
+# Copyright 2017 FU Berlin and the Authors
+#
+# Authors: Jan-Hendrik Prinz
+# Contributors:
+#
+# `adaptiveMD` is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with MDTraj. If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+"""
+An embedded, single node replacement for a MongoDB server
+
+The classes mimic the parts of the `pymongo` and `gridfs` APIs used by
+:class:`MongoDBStorage`. Each database is a SQLite file and each collection a
+table that holds the BSON encoded documents. Queries and updates are
+evaluated in python, writes that read and modify a document are done in a
+single exclusive SQLite transaction, so these stay atomic also between
+processes that share the files.
+
+Each indexed field has its own column with a SQLite index. Equality, `$in`
+and range conditions on indexed fields, also within `$and` and `$or`, select
+the candidate documents through these, so only the candidates are decoded
+and matched. Queries without such conditions scan the whole collection.
+
+Use it by setting a DB url with a `sqlite` scheme
+
+>>> Project.set_dburl('sqlite:///path/to/folder')  # doctest: +SKIP
+
+or `sqlite://` for an in-memory DB that lives as long as the process.
+"""
+from __future__ import absolute_import
+
+import datetime
+import functools
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+
+import six
+from bson import BSON
+from bson.binary import Binary
+from gridfs.errors import FileExists, NoFile
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from pymongo.results import UpdateResult, DeleteResult, InsertManyResult, \
+    InsertOneResult, BulkWriteResult
+
+from .matching import codec_options, encode, plain, path_values, compare, \
+    match_condition, match
+
+
+_missing = object()
+
+
+def _quote(name):
+    return '"%s"' % name.replace('"', '""')
+
+# =============================================================================
+# Indexed columns
+# =============================================================================
+
+# the column value of documents where an indexed field is missing or null
+_index_null = u'\x00'
+
+_range_operators = {'$gt': '>', '$gte': '>=', '$lt': '<', '$lte': '<='}
+
+
+def _index_value(value):
+    # the column value of a field, None if it cannot be indexed. Values that
+    # are equal in python have the same column value, different values can
+    # share one
+    value = plain(value)
+    if value is None:
+        return _index_null
+    elif isinstance(value, bool):
+        return int(value)
+    elif isinstance(value, six.integer_types):
+        if -2 ** 63 <= value < 2 ** 63:
+            return value
+        return float(value)
+    elif isinstance(value, (float, six.string_types)):
+        return value
+    elif isinstance(value, uuid.UUID):
+        return u'uuid:' + value.hex
+    elif isinstance(value, datetime.datetime):
+        # fixed width, so the text is ordered like the dates
+        return u'date:' + value.strftime('%Y-%m-%dT%H:%M:%S.%f')
+
+    return None
+
+
+def _index_entry(doc, key):
+    # the column value for a document. Arrays and documents cannot be
+    # indexed and are stored as NULL, these are candidates for all queries
+    values = path_values(doc, key)
+    if not values:
+        return _index_null
+    elif len(values) == 1:
+        return _index_value(values[0])
+
+    return None
+
+
+def _index_condition(column, condition):
+    # a SQL condition that is true for all documents that can match the
+    # condition on the field, None if the index cannot help
+    if isinstance(condition, dict):
+        if not condition or \
+                not all(key.startswith('$') for key in condition):
+            # embedded documents are not indexed
+            return None
+    else:
+        condition = {'$eq': condition}
+
+    clauses = []
+    args = []
+    for op, arg in condition.items():
+        if op == '$eq':
+            value = _index_value(arg)
+            if value is not None:
+                clauses.append('%s = ?' % column)
+                args.append(value)
+
+        elif op == '$in':
+            values = [_index_value(target) for target in arg]
+            if all(value is not None for value in values):
+                clauses.append('%s IN (%s)' % (
+                    column, ','.join('?' * len(values))))
+                args.extend(values)
+
+        elif op in _range_operators and \
+                isinstance(arg, six.integer_types + (float,) +
+                           six.string_types + (datetime.datetime,)):
+            clauses.append('%s %s ?' % (column, _range_operators[op]))
+            args.append(_index_value(arg))
+
+    if not clauses:
+        return None
+
+    return '(%s OR %s IS NULL)' % (' AND '.join(clauses), column), args
+
+
+# =============================================================================
+# Updates and projections
+# =============================================================================
+
+def _set_path(doc, key, value):
+    parts = key.split('.')
+    for part in parts[:-1]:
+        if isinstance(doc, list):
+            doc = doc[int(part)]
+        else:
+            doc = doc.setdefault(part, {})
+
+    if isinstance(doc, list):
+        doc[int(parts[-1])] = value
+    else:
+        doc[parts[-1]] = value
+
+
+def _get_path(doc, key, default=None):
+    for part in key.split('.'):
+        if isinstance(doc, dict):
+            doc = doc.get(part, _missing)
+        elif isinstance(doc, list) and part.isdigit() \
+                and int(part) < len(doc):
+            doc = doc[int(part)]
+        else:
+            return default
+
+        if doc is _missing:
+            return default
+
+    return doc
+
+
+def _unset_path(doc, key):
+    parts = key.split('.')
+    parent = _get_path(doc, '.'.join(parts[:-1])) if len(parts) > 1 else doc
+    if isinstance(parent, dict):
+        parent.pop(parts[-1], None)
+
+
+def apply_update(doc, update):
+    """
+    Apply a MongoDB update document in place
+
+    Supports `$set`, `$unset`, `$inc`, `$push`, `$addToSet`, `$pull` and
+    `$currentDate` or a replacement document.
+
+    Parameters
+    ----------
+    doc : dict
+        the document to be changed
+    update : dict
+        the update
+
+    Returns
+    -------
+    bool
+        True if the document was changed
+
+    """
+    before = encode(doc)
+
+    if not any(key.startswith('$') for key in update):
+        _id = doc['_id']
+        doc.clear()
+        doc.update(update)
+        doc['_id'] = _id
+        return encode(doc) != before
+
+    for op, fields in update.items():
+        for key, arg in fields.items():
+            if op == '$set':
+                _set_path(doc, key, arg)
+            elif op == '$unset':
+                _unset_path(doc, key)
+            elif op == '$inc':
+                _set_path(doc, key, _get_path(doc, key, 0) + arg)
+            elif op in ('$push', '$addToSet'):
+                current = _get_path(doc, key)
+                if current is None:
+                    current = []
+                    _set_path(doc, key, current)
+
+                if isinstance(arg, dict) and '$each' in arg:
+                    items = arg['$each']
+                else:
+                    items = [arg]
+
+                for item in items:
+                    if op == '$push' or item not in current:
+                        current.append(item)
+            elif op == '$pull':
+                current = _get_path(doc, key)
+                if isinstance(current, list):
+                    current[:] = [
+                        item for item in current
+                        if not match_condition([item], arg)]
+            elif op == '$currentDate':
+                # BSON dates have millisecond precision
+                now = datetime.datetime.utcnow()
+                _set_path(doc, key, now.replace(
+                    microsecond=now.microsecond // 1000 * 1000))
+            else:
+                raise OperationFailure('unknown update operator: %s' % op)
+
+    return encode(doc) != before
+
+
+def apply_projection(doc, projection):
+    """
+    Return a copy of a document restricted to a projection
+
+    Parameters
+    ----------
+    doc : dict
+        the document
+    projection : dict or list or None
+        the fields to be included (`True`) or excluded (`False`)
+
+    Returns
+    -------
+    dict
+        the projected document
+
+    """
+    if not projection:
+        return doc
+
+    if isinstance(projection, (list, tuple)):
+        projection = {key: True for key in projection}
+
+    include_id = projection.get('_id', True)
+    fields = {
+        key: value for key, value in projection.items() if key != '_id'}
+
+    if fields and any(fields.values()):
+        result = {}
+        for key in fields:
+            value = _get_path(doc, key, _missing)
+            if value is not _missing:
+                _set_path(result, key, value)
+    else:
+        result = dict(doc)
+        for key in fields:
+            parts = key.split('.')
+            if len(parts) > 1:
+                # copy the path before removing from it
+                parent = result
+                for part in parts[:-1]:
+                    if not isinstance(parent.get(part), dict):
+                        parent = None
+                        break
+                    parent[part] = dict(parent[part])
+                    parent = parent[part]
+                if parent is not None:
+                    parent.pop(parts[-1], None)
+            else:
+                result.pop(key, None)
+
+    if include_id and '_id' in doc:
+        result['_id'] = doc['_id']
+    elif not include_id:
+        result.pop('_id', None)
+
+    return result
+
+
+def _sort_docs(docs, sort):
+    if not sort:
+        return docs
+
+    def _cmp(a, b):
+        for key, direction in sort:
+            va = _get_path(a, key)
+            vb = _get_path(b, key)
+            if va is None or vb is None:
+                cmp = (va is not None) - (vb is not None)
+            else:
+                cmp = compare(va, vb) or 0
+
+            if cmp:
+                return cmp * direction
+
+        return 0
+
+    return sorted(docs, key=functools.cmp_to_key(_cmp))
+
+
+# =============================================================================
+# Client, database and collections
+# =============================================================================
+
+class SQLiteClient(object):
+    """
+    A replacement of `pymongo.MongoClient` that uses local SQLite files
+
+    Parameters
+    ----------
+    url : str
+        `sqlite:///path/to/folder` to keep one file per database in the
+        folder or `sqlite://` for in-memory databases
+    """
+
+    # in-memory databases are shared by all clients of a process
+    _memory = {}
+
+    def __init__(self, url='sqlite://'):
+        path = url.split('://', 1)[1] if '://' in url else url
+        self.path = os.path.expanduser(path) if path else None
+        self._databases = {}
+
+        if self.path and not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+    def _filename(self, name):
+        return os.path.join(self.path, name + '.sqlite')
+
+    def __getitem__(self, name):
+        if name not in self._databases:
+            if self.path:
+                self._databases[name] = SQLiteDatabase(
+                    self, name, self._filename(name))
+            else:
+                if name not in self._memory:
+                    self._memory[name] = SQLiteDatabase(self, name, None)
+
+                self._databases[name] = self._memory[name]
+
+        return self._databases[name]
+
+    def database_names(self):
+        if self.path:
+            return sorted(
+                f[:-7] for f in os.listdir(self.path)
+                if f.endswith('.sqlite'))
+        else:
+            return sorted(self._memory)
+
+    list_database_names = database_names
+
+    def drop_database(self, name):
+        db = self._databases.pop(name, None)
+        if db is None and not self.path:
+            db = self._memory.get(name)
+
+        if db is not None:
+            db.drop()
+
+        if self.path:
+            for ext in ['', '-wal', '-shm']:
+                filename = self._filename(name) + ext
+                if os.path.exists(filename):
+                    os.remove(filename)
+        else:
+            self._memory.pop(name, None)
+
+    def close(self):
+        if self.path:
+            for db in self._databases.values():
+                db.close()
+
+        self._databases = {}
+
+
+class SQLiteDatabase(object):
+    """
+    A SQLite file that holds collections like a MongoDB database
+    """
+
+    def __init__(self, client, name, filename):
+        self.client = client
+        self.name = name
+        self.filename = filename
+        self._lock = threading.RLock()
+        self._collections = {}
+
+        if filename is None:
+            self._connection = sqlite3.connect(
+                ':memory:', check_same_thread=False, isolation_level=None)
+        else:
+            self._connection = sqlite3.connect(
+                filename, timeout=60.0,
+                check_same_thread=False, isolation_level=None)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS "_indexes" '
+            '(collection TEXT, name TEXT, key TEXT, '
+            'PRIMARY KEY (collection, name))')
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = SQLiteCollection(self, name)
+
+        return self._collections[name]
+
+    def collection_names(self):
+        cursor = self._connection.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' "
+            "AND name != '_indexes'")
+        return [row[0] for row in cursor]
+
+    list_collection_names = collection_names
+
+    @contextmanager
+    def transaction(self):
+        """
+        Context of an exclusive transaction
+
+        Other threads and processes cannot write until it is finished.
+        """
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._connection
+            except:
+                self._connection.execute('ROLLBACK')
+                raise
+            else:
+                self._connection.execute('COMMIT')
+
+    @contextmanager
+    def reading(self):
+        """
+        Context to read without blocking other processes
+        """
+        with self._lock:
+            yield self._connection
+
+    def execute(self, sql, args=()):
+        with self._lock:
+            return self._connection.execute(sql, args).fetchall()
+
+    def drop(self):
+        with self._lock:
+            for name in self.collection_names():
+                self._connection.execute('DROP TABLE "%s"' % name)
+            self._connection.execute('DELETE FROM "_indexes"')
+
+        self._collections = {}
+
+    def close(self):
+        self._connection.close()
+
+
+class SQLiteCollection(object):
+    """
+    A table of BSON documents with the `pymongo.Collection` methods used by
+    the stores
+    """
+
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self._table = _quote(name)
+        self._created = False
+
+        # the indexed fields and their columns, reloaded when the schema of
+        # the database is changed, also by other processes
+        self._columns = {}
+        self._schema = None
+
+    def _ensure_table(self, connection=None):
+        if not self._created:
+            (connection or self.database).execute(
+                'CREATE TABLE IF NOT EXISTS %s '
+                '(_id TEXT PRIMARY KEY, doc BLOB)' % self._table)
+            self._created = True
+
+    def _load_columns(self, connection):
+        schema = connection.execute('PRAGMA schema_version').fetchone()[0]
+        if schema != self._schema:
+            self._columns = {
+                row[1][2:]: _quote(row[1])
+                for row in connection.execute(
+                    'PRAGMA table_info(%s)' % self._table)
+                if row[1].startswith('k_')}
+            self._schema = schema
+
+        return self._columns
+
+    def _index_clauses(self, query):
+        # SQL conditions for all top level conditions on the primary key and
+        # indexed fields
+        result = []
+        for key, condition in (query or {}).items():
+            if key == '$and':
+                for subquery in condition:
+                    result.extend(self._index_clauses(subquery))
+            elif key == '$or':
+                # only if every alternative can use an index
+                branches = [self._index_clauses(q) for q in condition]
+                if branches and all(branches):
+                    result.append((
+                        '(%s)' % ' OR '.join(
+                            '(%s)' % ' AND '.join(c for c, _ in branch)
+                            for branch in branches),
+                        [arg for branch in branches
+                         for _, args in branch for arg in args]))
+            elif key == '_id':
+                if isinstance(condition, dict) and list(condition) == ['$in']:
+                    keys = [self._key(k) for k in condition['$in']]
+                    result.append((
+                        '_id IN (%s)' % ','.join('?' * len(keys)), keys))
+                elif not isinstance(condition, dict):
+                    result.append(('_id = ?', [self._key(condition)]))
+            elif key in self._columns:
+                clause = _index_condition(self._columns[key], condition)
+                if clause is not None:
+                    result.append(clause)
+
+        return result
+
+    @staticmethod
+    def _encode(doc):
+        return sqlite3.Binary(encode(doc))
+
+    @staticmethod
+    def _decode(blob):
+        return BSON(bytes(blob)).decode(codec_options=codec_options)
+
+    @staticmethod
+    def _key(_id):
+        _id = plain(_id)
+        if isinstance(_id, uuid.UUID):
+            # differs from the key of the same id as string
+            return repr(_id)
+
+        return str(_id)
+
+    def _index_order(self, connection, where, args, sort):
+        # a SQL order of the candidates equal to `_sort_docs`, None if the
+        # sort has to be done in python
+        columns = []
+        for key, direction in sort or []:
+            if key not in self._columns or '.' in key:
+                return None
+            columns.append((self._columns[key], direction))
+
+        order = []
+        order_args = []
+        if columns:
+            # unindexed values, like dates or arrays, are sorted in python
+            test = ['(%s)' % ' OR '.join(
+                '%s IS NULL' % column for column, _ in columns)]
+            if connection.execute(
+                    'SELECT 1 FROM %s WHERE %s LIMIT 1' % (
+                        self._table, ' AND '.join(where + test)),
+                    args).fetchone() is not None:
+                return None
+
+            for column, direction in columns:
+                # missing and null values come first
+                order.append('(%s = ?) %s' % (
+                    column, 'DESC' if direction > 0 else 'ASC'))
+                order_args.append(_index_null)
+                order.append('%s %s' % (
+                    column, 'ASC' if direction > 0 else 'DESC'))
+
+        # equal documents keep the order of insertion. `+rowid` lets SQLite
+        # search the indexes instead of scanning the table in rowid order
+        order.append('+rowid' if where else 'rowid')
+        return ', '.join(order), order_args
+
+    def _select(self, connection, query, sort=None, limit=0):
+        # use the primary key for direct lookups and the indexed columns to
+        # find candidates, scan otherwise. Candidates are matched in python.
+        # The result is sorted and limited in SQL if the index allows it
+        self._ensure_table(connection)
+        self._load_columns(connection)
+        where = []
+        args = []
+        for clause, clause_args in self._index_clauses(query):
+            where.append(clause)
+            args.extend(clause_args)
+
+        sql = 'SELECT doc FROM %s' % self._table
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+
+        order = self._index_order(connection, where, args, sort)
+        if order is None:
+            rows = connection.execute(
+                sql + (' ORDER BY +rowid' if where else ' ORDER BY rowid'),
+                args)
+            docs = _sort_docs([
+                doc for doc in (self._decode(row[0]) for row in rows)
+                if match(doc, query)], sort)
+
+            return docs[:limit] if limit else docs
+
+        docs = []
+        for row in connection.execute(
+                sql + ' ORDER BY ' + order[0], args + order[1]):
+            doc = self._decode(row[0])
+            if match(doc, query):
+                docs.append(doc)
+                if len(docs) == limit:
+                    break
+
+        return docs
+
+    def _write(self, connection, doc):
+        columns = self._load_columns(connection)
+        keys = list(columns)
+        connection.execute(
+            'UPDATE %s SET %s WHERE _id = ?' % (
+                self._table,
+                ', '.join(['doc = ?'] + [
+                    '%s = ?' % columns[key] for key in keys])),
+            [self._encode(doc)] + [_index_entry(doc, key) for key in keys] +
+            [self._key(doc['_id'])])
+
+    def _insert(self, connection, doc):
+        if '_id' not in doc:
+            doc['_id'] = str(uuid.uuid4())
+
+        columns = self._load_columns(connection)
+        keys = list(columns)
+        try:
+            connection.execute(
+                'INSERT INTO %s (%s) VALUES (%s)' % (
+                    self._table,
+                    ', '.join(['_id', 'doc'] + [columns[k] for k in keys]),
+                    ','.join('?' * (len(keys) + 2))),
+                [self._key(doc['_id']), self._encode(doc)] +
+                [_index_entry(doc, key) for key in keys])
+        except sqlite3.IntegrityError:
+            raise DuplicateKeyError(
+                'duplicate key %s in %s' % (doc['_id'], self.name))
+
+        return doc['_id']
+
+    # reading
+
+    def find(self, filter=None, projection=None, sort=None, limit=0,
+             **kwargs):
+        with self.database.reading() as connection:
+            docs = self._select(connection, filter, sort, limit)
+
+        return iter([apply_projection(doc, projection) for doc in docs])
+
+    def find_one(self, filter=None, projection=None, sort=None, **kwargs):
+        if filter is not None and not isinstance(filter, dict):
+            filter = {'_id': filter}
+
+        for doc in self.find(filter, projection, sort=sort, limit=1):
+            return doc
+
+        return None
+
+    def count_documents(self, filter, **kwargs):
+        if not filter:
+            return self.estimated_document_count()
+
+        with self.database.reading() as connection:
+            return len(self._select(connection, filter))
+
+    def estimated_document_count(self, **kwargs):
+        self._ensure_table()
+        return self.database.execute(
+            'SELECT COUNT(*) FROM %s' % self._table)[0][0]
+
+    def count(self, filter=None, **kwargs):
+        return self.count_documents(filter)
+
+    def aggregate(self, pipeline, **kwargs):
+        raise OperationFailure('aggregation is not supported by SQLite')
+
+    def watch(self, pipeline=None, **kwargs):
+        raise OperationFailure('change streams are not supported by SQLite')
+
+    # writing
+
+    def insert_one(self, document, **kwargs):
+        with self.database.transaction() as connection:
+            self._ensure_table(connection)
+            return InsertOneResult(self._insert(connection, document), True)
+
+    def insert_many(self, documents, ordered=True, **kwargs):
+        with self.database.transaction() as connection:
+            self._ensure_table(connection)
+            ids = [self._insert(connection, doc) for doc in documents]
+
+        return InsertManyResult(ids, True)
+
+    def insert(self, doc_or_docs, **kwargs):
+        if isinstance(doc_or_docs, list):
+            return self.insert_many(doc_or_docs).inserted_ids
+        else:
+            return self.insert_one(doc_or_docs).inserted_id
+
+    def _update(self, connection, filter, update, upsert, multi):
+        docs = self._select(connection, filter, limit=0 if multi else 1)
+
+        modified = 0
+        for doc in docs:
+            if apply_update(doc, update):
+                self._write(connection, doc)
+                modified += 1
+
+        upserted = None
+        if not docs and upsert:
+            doc = {
+                key: value for key, value in (filter or {}).items()
+                if not key.startswith('$') and not isinstance(value, dict)}
+            apply_update(doc, update)
+            upserted = self._insert(connection, doc)
+
+        return {
+            'n': len(docs) or (1 if upserted is not None else 0),
+            'nModified': modified,
+            'upserted': upserted,
+            'ok': 1.0,
+            'updatedExisting': bool(docs)}
+
+    def update_one(self, filter, update, upsert=False, **kwargs):
+        with self.database.transaction() as connection:
+            raw = self._update(connection, filter, update, upsert, False)
+
+        return UpdateResult(raw, True)
+
+    def update_many(self, filter, update, upsert=False, **kwargs):
+        with self.database.transaction() as connection:
+            raw = self._update(connection, filter, update, upsert, True)
+
+        return UpdateResult(raw, True)
+
+    def update(self, spec, document, upsert=False, multi=False, **kwargs):
+        with self.database.transaction() as connection:
+            return self._update(connection, spec, document, upsert, multi)
+
+    def find_one_and_update(
+            self, filter, update, projection=None, sort=None, upsert=False,
+            return_document=ReturnDocument.BEFORE, **kwargs):
+        with self.database.transaction() as connection:
+            docs = self._select(connection, filter, sort, 1)
+            if not docs:
+                if upsert:
+                    self._update(connection, filter, update, True, False)
+                    if return_document == ReturnDocument.AFTER:
+                        docs = self._select(connection, filter)
+                        if docs:
+                            return apply_projection(docs[0], projection)
+                return None
+
+            doc = docs[0]
+            before = apply_projection(self._decode(self._encode(doc)),
+                                      projection)
+            if apply_update(doc, update):
+                self._write(connection, doc)
+
+        if return_document == ReturnDocument.AFTER:
+            return apply_projection(doc, projection)
+
+        return before
+
+    def find_and_modify(self, query=None, update=None, upsert=False,
+                        sort=None, new=False, fields=None, remove=False,
+                        **kwargs):
+        if remove:
+            with self.database.transaction() as connection:
+                docs = self._select(connection, query, sort, 1)
+                if not docs:
+                    return None
+                self._delete(connection, [docs[0]])
+                return apply_projection(docs[0], fields)
+
+        return self.find_one_and_update(
+            query or {}, update, projection=fields, sort=sort, upsert=upsert,
+            return_document=(
+                ReturnDocument.AFTER if new else ReturnDocument.BEFORE))
+
+    def _delete(self, connection, docs):
+        for doc in docs:
+            connection.execute(
+                'DELETE FROM %s WHERE _id = ?' % self._table,
+                (self._key(doc['_id']),))
+
+        return len(docs)
+
+    def delete_one(self, filter, **kwargs):
+        with self.database.transaction() as connection:
+            n = self._delete(
+                connection, self._select(connection, filter, limit=1))
+
+        return DeleteResult({'n': n, 'ok': 1.0}, True)
+
+    def delete_many(self, filter, **kwargs):
+        with self.database.transaction() as connection:
+            n = self._delete(connection, self._select(connection, filter))
+
+        return DeleteResult({'n': n, 'ok': 1.0}, True)
+
+    def remove(self, spec_or_id=None, multi=True, **kwargs):
+        if spec_or_id is not None and not isinstance(spec_or_id, dict):
+            spec_or_id = {'_id': spec_or_id}
+
+        with self.database.transaction() as connection:
+            docs = self._select(
+                connection, spec_or_id, limit=0 if multi else 1)
+            n = self._delete(connection, docs)
+
+        return {'n': n, 'ok': 1.0}
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        matched = 0
+        modified = 0
+        with self.database.transaction() as connection:
+            for request in requests:
+                # pymongo keeps the arguments of write operations private
+                raw = self._update(
+                    connection, request._filter, request._doc,
+                    request._upsert, type(request).__name__ == 'UpdateMany')
+                matched += raw['n']
+                modified += raw['nModified']
+
+        return BulkWriteResult({
+            'nMatched': matched, 'nModified': modified,
+            'nInserted': 0, 'nUpserted': 0, 'nRemoved': 0,
+            'upserted': []}, True)
+
+    def drop(self):
+        with self.database.transaction() as connection:
+            connection.execute('DROP TABLE IF EXISTS %s' % self._table)
+            connection.execute(
+                'DELETE FROM "_indexes" WHERE collection = ?', (self.name,))
+
+        self._created = False
+        self._schema = None
+
+    # each indexed field has a column with a SQLite index
+
+    def _sql_index(self, name):
+        return _quote('%s.%s' % (self.name, name))
+
+    def create_index(self, keys, **kwargs):
+        if isinstance(keys, six.string_types):
+            keys = [(keys, 1)]
+
+        keys = [(key, direction) for key, direction in keys if key != '_id']
+        if not keys:
+            # the primary key
+            return '_id_'
+
+        name = kwargs.get('name') or '_'.join(
+            '%s_%s' % (key, direction) for key, direction in keys)
+
+        with self.database.transaction() as connection:
+            self._ensure_table(connection)
+            columns = self._load_columns(connection)
+            for key, _ in keys:
+                if key not in columns:
+                    column = _quote('k_' + key)
+                    connection.execute('ALTER TABLE %s ADD COLUMN %s' % (
+                        self._table, column))
+                    rows = connection.execute(
+                        'SELECT rowid, doc FROM %s' % self._table).fetchall()
+                    connection.executemany(
+                        'UPDATE %s SET %s = ? WHERE rowid = ?' % (
+                            self._table, column),
+                        [(_index_entry(self._decode(doc), key), rowid)
+                         for rowid, doc in rows])
+                    columns = self._load_columns(connection)
+
+            connection.execute('CREATE INDEX IF NOT EXISTS %s ON %s (%s)' % (
+                self._sql_index(name), self._table,
+                ', '.join(columns[key] for key, _ in keys)))
+
+            connection.execute(
+                'INSERT OR REPLACE INTO "_indexes" VALUES (?, ?, ?)',
+                (self.name, name, json.dumps(keys)))
+
+        return name
+
+    def drop_index(self, name):
+        # the column is kept and stays up to date
+        with self.database.transaction() as connection:
+            connection.execute(
+                'DROP INDEX IF EXISTS %s' % self._sql_index(name))
+            connection.execute(
+                'DELETE FROM "_indexes" WHERE collection = ? AND name = ?',
+                (self.name, name))
+
+    def index_information(self):
+        info = {'_id_': {'key': [('_id', 1)]}}
+        with self.database.reading() as connection:
+            self._ensure_table(connection)
+            columns = self._load_columns(connection)
+            indexes = connection.execute(
+                'SELECT name, key FROM "_indexes" WHERE collection = ?',
+                (self.name,)).fetchall()
+
+        for name, key in indexes:
+            key = [tuple(k) for k in json.loads(key)]
+            # indexes recorded by older versions have no columns yet
+            if all(k in columns for k, _ in key):
+                info[name] = {'key': key}
+
+        return info
+
+
+# =============================================================================
+# GridFS
+# =============================================================================
+
+class SQLiteGridOut(object):
+    """
+    A stored file returned by :class:`SQLiteGridFS`
+    """
+
+    def __init__(self, grid, doc):
+        self._grid = grid
+        self._file = doc
+
+    def __getattr__(self, item):
+        try:
+            return self.__dict__['_file'][item]
+        except KeyError:
+            raise AttributeError(item)
+
+    def read(self):
+        chunk = self._grid._chunks.find_one({'_id': self._file['_id']})
+        return bytes(chunk['data']) if chunk is not None else b''
+
+
+class SQLiteGridFS(object):
+    """
+    A replacement of `gridfs.GridFS` for :class:`SQLiteDatabase`
+
+    The file documents are stored in `<collection>.files` like GridFS does, so
+    they can be queried in the same way. The content is kept in one piece.
+    """
+
+    def __init__(self, database, collection='fs'):
+        self._files = database[collection + '.files']
+        self._chunks = database[collection + '.chunks']
+
+    def put(self, data, **kwargs):
+        if isinstance(data, six.text_type):
+            data = data.encode(kwargs.get('encoding', 'utf8'))
+
+        doc = dict(kwargs)
+        doc.setdefault('_id', str(uuid.uuid4()))
+        doc['length'] = len(data)
+        doc['uploadDate'] = datetime.datetime.utcnow()
+
+        try:
+            self._files.insert_one(doc)
+        except DuplicateKeyError:
+            raise FileExists('file with id %r already exists' % doc['_id'])
+
+        self._chunks.insert_one({'_id': doc['_id'], 'data': Binary(data)})
+        return doc['_id']
+
+    def get(self, file_id):
+        doc = self._files.find_one({'_id': file_id})
+        if doc is None:
+            raise NoFile('no file in gridfs with _id %r' % file_id)
+
+        return SQLiteGridOut(self, doc)
+
+    def find_one(self, filter=None, *args, **kwargs):
+        doc = self._files.find_one(filter)
+        if doc is None:
+            return None
+
+        return SQLiteGridOut(self, doc)
+
+    def find(self, filter=None, *args, **kwargs):
+        return (SQLiteGridOut(self, doc) for doc in self._files.find(filter))
+
+    def exists(self, document_or_id=None, **kwargs):
+        if document_or_id is not None and \
+                not isinstance(document_or_id, dict):
+            document_or_id = {'_id': document_or_id}
+
+        query = dict(document_or_id or {}, **kwargs)
+        return self._files.find_one(query) is not None
+
+    def delete(self, file_id):
+        self._files.delete_one({'_id': file_id})
+        self._chunks.delete_one({'_id': file_id})
@@ -1,12 +1,10 @@
 from __future__ import absolute_import, print_function
 
 import logging
-import gridfs
-from uuid import UUID
 import time
 import six
 
-from .base import StorableMixin, long_t, hex_t
+from .base import StorableMixin, long_t, uuid_from_db, uuid_to_binary
 from .object import ObjectStore
 from .proxy import LoaderProxy
 
@@ -15,16 +13,30 @@ logger = logging.getLogger(__name__)
 
 class FileStore(ObjectStore):
 
+    # GridFS only stores these fields on the file documents
+    default_index_keys = ['_time', '_saved', 'filename']
+
     def __init__(self, name, content_class):
         super(FileStore, self).__init__(name, content_class)
         self.grid = None
+        self._files = None
 
     def initialize(self):
-        self.grid = gridfs.GridFS(self.storage.db)
+        self.grid = self.storage.create_grid()
+        self._files = self.storage.db['fs.files']
         self._created = True
 
     def restore(self):
-        self.grid = gridfs.GridFS(self.storage.db)
+        self.grid = self.storage.create_grid()
+        self._files = self.storage.db['fs.files']
+        self.load_indices()
+
+    def _index_collection(self):
+        return self.storage.db['fs.files']
+
+    def index_keys(self):
+        # search fields of the content are not stored with GridFS files
+        return list(self.default_index_keys)
 
     def consume_one(self, test_fnc=None):
         raise NotImplementedError()
@@ -35,19 +47,57 @@ class FileStore(ObjectStore):
     def modify_test_one(self, test_fnc, key, value, update):
         raise NotImplementedError()
 
-    def load_indices(self):
-        self.index = [long_t(x, 16) for x in self.grid.list()]
+    def claim_one(self, query, key, value, update, test_fnc=None,
+                  sort=None):
+        raise NotImplementedError()
 
-    def __len__(self):
-        if self.grid:
-            return len(list(self.grid.find()))
+    def claim_many(self, query, key, value, update, n, test_fnc=None,
+                   sort=None, fields=None):
+        raise NotImplementedError()
 
-        return 0
+    def release_many(self, idxs, key, value, update, fields=None):
+        raise NotImplementedError()
 
-    def _load(self, idx):
-        _id = hex_t(idx)
+    def find(self, query):
+        raise NotImplementedError()
+
+    def count_matching(self, query):
+        raise NotImplementedError()
 
-        f = self.grid.find_one({'_id': _id})
+    def view(self, query, max_age=None):
+        raise NotImplementedError()
+
+    def watch(self, query, callback, poll_interval=None):
+        raise NotImplementedError()
+
+    def class_filter(self, cls):
+        # GridFS files do not store the class or the content as fields
+        return None
+
+    def attribute_filter(self, key, value):
+        return None, False
+
+    def _index_documents(self, query):
+        return self._files.find(query, self._index_projection())
+
+    def _count_documents(self, exact):
+        if self._files is None:
+            return None
+
+        if exact:
+            return self._files.count_documents({})
+        else:
+            return self._files.estimated_document_count()
+
+    def _file_id(self, idx):
+        # GridFS files use hex strings instead of UUID strings
+        if self.storage.id_format == 'binary':
+            return uuid_to_binary(idx)
+
+        return hex(idx)
+
+    def _load(self, idx):
+        f = self.grid.find_one({'_id': self._file_id(idx)})
 
         obj = self.storage.simplifier.from_json(f.read())
         obj.__store__ = self
@@ -59,8 +109,16 @@ class FileStore(ObjectStore):
     def cache_all(self):
         pass
 
+    def _load_batch(self, idxs):
+        # the content lives in GridFS chunks and cannot be prefetched
+        return {}
+
+    def load_many(self, idxs, batch_size=None):
+        # GridFS files are read one by one anyway
+        return [self.load(idx) for idx in idxs]
+
     def _save(self, obj):
-        _id = hex(obj.__uuid__)
+        _id = self._file_id(obj.__uuid__)
 
         s = self.storage.simplifier.to_json_object(obj)
         if hasattr(obj, 'name'):
@@ -69,6 +127,7 @@ class FileStore(ObjectStore):
                 filename=obj.name,
                 _id=_id,
                 _time=obj.__time__,
+                _saved=time.time(),
                 encoding='utf8',
                 **{x: getattr(obj, x) for x in self._find_by})  # add search indices
         else:
@@ -76,6 +135,7 @@ class FileStore(ObjectStore):
                 s,
                 _id=_id,
                 _time=obj.__time__,
+                _saved=time.time(),
                 encoding='utf8',
                 **{x: getattr(obj, x) for x in self._find_by})  # add search indices
 
@@ -88,7 +148,7 @@ class FileStore(ObjectStore):
 
     def find_one(self, dct):
         idx = self.grid.find_one(dct)['filename']
-        return self.load(int(UUID(idx)))
+        return self.load(uuid_from_db(idx))
 
     def load(self, idx):
         """
@@ -106,7 +166,7 @@ class FileStore(ObjectStore):
         """
 
         if type(idx) is str:
-            idx = long_t(UUID(self.grid.find_one({'filename': idx})['_id']), 16)
+            idx = uuid_from_db(self.grid.find_one({'filename': idx})['_id'])
 
         if type(idx) is long_t:
             pass
@@ -178,7 +238,7 @@ class FileStore(ObjectStore):
         n_idx = len(self.index)
         self.index.append(uuid)
 
-        q = self.grid.find_one({'_id': hex(uuid)})
+        q = self.grid.find_one({'_id': self._file_id(uuid)})
 
         if q is not None:
             # exists
@@ -209,6 +269,7 @@ class FileStore(ObjectStore):
 
         try:
             self._save(obj)
+            self._change_count(1)
             self.cache[uuid] = obj
 
         except:
@@ -224,7 +285,7 @@ class FileStore(ObjectStore):
         if item.__uuid__ in self.index:
             return True
 
-        q = self.grid.find_one({'_id': hex(uuid)})
+        q = self.grid.find_one({'_id': self._file_id(uuid)})
 
         if q is not None:
             # exists
@@ -0,0 +1,199 @@
+##############################################################################
+# adaptiveMD: A Python Framework to Run Adaptive Molecular Dynamics (MD)
+#             Simulations on HPC Resources
+# Copyright 2017 FU Berlin and the Authors
+#
+# Authors: Jan-Hendrik Prinz
+# Contributors:
+#
+# `adaptiveMD` is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with MDTraj. If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+from __future__ import absolute_import
+
+import itertools
+
+
+class UUIDIndex(object):
+    """
+    An ordered set of object uuids with constant time membership tests
+
+    The order is the order in which uuids were added. Positional access
+    is supported so that it can be used like the plain list that stores used
+    before, but `in` checks use a hash set instead of a linear scan.
+
+    Attributes
+    ----------
+    high_water : float or None
+        the largest save time (`_saved`) of a document that was seen during the
+        last refresh from the DB. Used to only fetch newer documents. None
+        means the index has never been synced.
+    """
+
+    def __init__(self, iterable=None):
+        self._list = []
+        # a number increasing with the position for each uuid
+        self._order = {}
+        self._counter = itertools.count()
+        self.high_water = None
+
+        if iterable is not None:
+            self.extend(iterable)
+
+    def __contains__(self, item):
+        return item in self._order
+
+    def __len__(self):
+        return len(self._list)
+
+    def __iter__(self):
+        return iter(self._list)
+
+    def __reversed__(self):
+        return reversed(self._list)
+
+    def __getitem__(self, item):
+        return self._list[item]
+
+    def __delitem__(self, item):
+        if isinstance(item, slice):
+            removed = self._list[item]
+        else:
+            removed = [self._list[item]]
+
+        del self._list[item]
+        for uuid in removed:
+            del self._order[uuid]
+
+    def __repr__(self):
+        return '%s(%d uuids)' % (self.__class__.__name__, len(self))
+
+    def append(self, uuid):
+        """
+        Add a uuid to the end of the index if it is not present yet
+
+        Parameters
+        ----------
+        uuid : int
+            the uuid to be added
+
+        Returns
+        -------
+        bool
+            True if the uuid was new
+
+        """
+        if uuid in self._order:
+            return False
+
+        self._order[uuid] = next(self._counter)
+        self._list.append(uuid)
+        return True
+
+    def extend(self, uuids):
+        """
+        Add several uuids skipping the ones already present
+
+        Parameters
+        ----------
+        uuids : iterable of int
+            the uuids to be added
+
+        Returns
+        -------
+        int
+            the number of actually added uuids
+
+        """
+        return len([None for uuid in uuids if self.append(uuid)])
+
+    def remove(self, uuid):
+        """
+        Remove a uuid from the index
+
+        Raises a `ValueError` if the uuid is not present, like `list.remove`.
+
+        Parameters
+        ----------
+        uuid : int
+            the uuid to be removed
+
+        """
+        if uuid not in self._order:
+            raise ValueError('uuid %s not in index' % uuid)
+
+        del self._order[uuid]
+        self._list.remove(uuid)
+
+    def index(self, uuid):
+        """
+        Return the position of a uuid in the index
+
+        Parameters
+        ----------
+        uuid : int
+            the uuid to be found
+
+        Returns
+        -------
+        int
+            the position of the uuid
+
+        """
+        if uuid not in self._order:
+            raise ValueError('uuid %s not in index' % uuid)
+
+        return self._list.index(uuid)
+
+    def order(self, uuid):
+        """
+        Return a number that increases with the position of a uuid
+
+        Unlike :meth:`index` this does not need to search the index, so it
+        can be used to sort uuids in the order of the index.
+
+        Parameters
+        ----------
+        uuid : int
+            the uuid to be found
+
+        Returns
+        -------
+        int or None
+            the number, None if the uuid is not in the index
+
+        """
+        return self._order.get(uuid)
+
+    def clear(self):
+        """
+        Remove all uuids and reset the high water mark
+
+        """
+        self._list = []
+        self._order = {}
+        self.high_water = None
+
+    def update_high_water(self, value):
+        """
+        Advance the high water mark, it is never decreased
+
+        Parameters
+        ----------
+        value : float or None
+            a save time seen in the DB
+
+        """
+        if value is not None:
+            if self.high_water is None or value > self.high_water:
+                self.high_water = value
@@ -0,0 +1,274 @@
+##############################################################################
+# adaptiveMD: A Python Framework to Run Adaptive Molecular Dynamics (MD)
+#             Simulations on HPC Resources
+# Copyright 2017 FU Berlin and the Authors
+#
+# Authors: Jan-Hendrik Prinz
+# Contributors:
+#
+# `adaptiveMD` is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with MDTraj. If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+"""
+Evaluation of MongoDB filters on documents in python
+
+Used by the embedded SQLite backend to run queries and by materialized
+views to update their result from known document values without asking the
+DB.
+"""
+from __future__ import absolute_import
+
+import re
+import uuid
+
+import six
+from bson import BSON
+from bson.binary import Binary, STANDARD, UUID_SUBTYPE
+from bson.codec_options import CodecOptions
+from pymongo.errors import OperationFailure
+
+
+# binary UUIDs (subtype 4) are decoded as `uuid.UUID` and encoded back
+codec_options = CodecOptions(uuid_representation=STANDARD)
+
+
+def encode(doc):
+    """
+    Return the BSON encoding of a document
+
+    Parameters
+    ----------
+    doc : dict
+        the document
+
+    Returns
+    -------
+    bytes
+        the BSON data
+
+    """
+    return BSON.encode(doc, codec_options=codec_options)
+
+
+def as_stored(doc):
+    """
+    Return a document like it is read from the DB
+
+    Values are converted like in a round trip through BSON, e.g. binary
+    UUIDs become `uuid.UUID`. Use it before matching documents that were
+    not read from the DB.
+
+    Parameters
+    ----------
+    doc : dict
+        the document
+
+    Returns
+    -------
+    dict
+        the converted copy
+
+    """
+    return BSON(encode(doc)).decode(codec_options)
+
+
+def plain(value):
+    """
+    Return a query value like the decoded document value it compares to
+
+    """
+    if isinstance(value, Binary) and value.subtype == UUID_SUBTYPE:
+        return uuid.UUID(bytes=bytes(value))
+
+    return value
+
+
+def _path_values(value, parts):
+    # all values reachable by a dotted path. Arrays are traversed like
+    # MongoDB does, numeric parts can also index into them
+    if not parts:
+        return [value]
+
+    key, rest = parts[0], parts[1:]
+    if isinstance(value, dict):
+        if key in value:
+            return _path_values(value[key], rest)
+        return []
+
+    elif isinstance(value, list):
+        result = []
+        if key.isdigit():
+            pos = int(key)
+            if pos < len(value):
+                result.extend(_path_values(value[pos], rest))
+
+        for element in value:
+            if isinstance(element, dict):
+                result.extend(_path_values(element, parts))
+
+        return result
+
+    return []
+
+
+def path_values(doc, key):
+    """
+    Return all values of a document reachable by a dotted field name
+
+    Parameters
+    ----------
+    doc : dict
+        the document
+    key : str
+        the field name like `_dict.created`
+
+    Returns
+    -------
+    list
+        the values, empty if the field is missing
+
+    """
+    return _path_values(doc, key.split('.'))
+
+
+def _expand(values):
+    # array values match by themselves and by their elements
+    result = []
+    for value in values:
+        result.append(value)
+        if isinstance(value, list):
+            result.extend(value)
+
+    return result
+
+
+def compare(a, b):
+    """
+    Compare two values like `cmp`, None if they cannot be ordered
+
+    """
+    try:
+        return (a > b) - (a < b)
+    except TypeError:
+        return None
+
+
+def _equal(values, target):
+    target = plain(target)
+    if target is None and not values:
+        return True
+
+    return any(value == target for value in _expand(values))
+
+
+def _match_operator(values, op, arg):
+    if op == '$eq':
+        return _equal(values, arg)
+    elif op == '$ne':
+        return not _equal(values, arg)
+    elif op == '$in':
+        return any(_equal(values, target) for target in arg)
+    elif op == '$nin':
+        return not any(_equal(values, target) for target in arg)
+    elif op == '$exists':
+        return bool(values) == bool(arg)
+    elif op == '$size':
+        return any(
+            isinstance(value, list) and len(value) == arg for value in values)
+    elif op in ('$gt', '$gte', '$lt', '$lte'):
+        for value in _expand(values):
+            cmp = compare(value, arg)
+            if cmp is None:
+                continue
+            if (op == '$gt' and cmp > 0) or (op == '$gte' and cmp >= 0) or \
+                    (op == '$lt' and cmp < 0) or (op == '$lte' and cmp <= 0):
+                return True
+        return False
+    elif op == '$all':
+        return all(_equal(values, target) for target in arg)
+    elif op == '$elemMatch':
+        return any(
+            isinstance(element, dict) and match(element, arg)
+            for value in values if isinstance(value, list)
+            for element in value)
+    elif op == '$not':
+        return not match_condition(values, arg)
+    elif op == '$regex':
+        pattern = re.compile(arg)
+        return any(
+            isinstance(value, six.string_types) and pattern.search(value)
+            for value in _expand(values))
+    else:
+        raise OperationFailure('unknown operator: %s' % op)
+
+
+def match_condition(values, condition):
+    """
+    Test if the values of a field match the condition of a MongoDB filter
+
+    Parameters
+    ----------
+    values : list
+        the values of the field, see :func:`path_values`
+    condition : object
+        a value or a dict of operators like `$gt`
+
+    Returns
+    -------
+    bool
+        True if the values match
+
+    """
+    if isinstance(condition, dict) and condition and \
+            all(key.startswith('$') for key in condition):
+        return all(
+            _match_operator(values, op, arg)
+            for op, arg in condition.items())
+
+    return _equal(values, condition)
+
+
+def match(doc, query):
+    """
+    Test if a document matches a MongoDB filter
+
+    Parameters
+    ----------
+    doc : dict
+        the document
+    query : dict or None
+        the filter
+
+    Returns
+    -------
+    bool
+        True if the document matches
+
+    """
+    if not query:
+        return True
+
+    for key, condition in query.items():
+        if key == '$and':
+            if not all(match(doc, q) for q in condition):
+                return False
+        elif key == '$or':
+            if not any(match(doc, q) for q in condition):
+                return False
+        elif key == '$nor':
+            if any(match(doc, q) for q in condition):
+                return False
+        elif not match_condition(path_values(doc, key), condition):
+            return False
+
+    return True
@@ -0,0 +1,220 @@
+##############################################################################
+# adaptiveMD: A Python Framework to Run Adaptive Molecular Dynamics (MD)
+#             Simulations on HPC Resources
+# Copyright 2017 FU Berlin and the Authors
+#
+# Authors: Jan-Hendrik Prinz
+# Contributors:
+#
+# `adaptiveMD` is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with MDTraj. If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+"""
+Conversion of the object ids of an existing project DB
+
+Object ids are stored either as UUID strings or as 16 byte BSON UUIDs, see
+`MongoDBStorage.default_id_format`. :func:`migrate_ids` rewrites all
+document ids, references and id lists of a DB from one format to the other.
+"""
+from __future__ import absolute_import, print_function
+
+import re
+import uuid
+
+import six
+from bson.binary import Binary, UUID_SUBTYPE
+
+from .base import uuid_from_db, uuid_to_str, uuid_to_binary
+
+_uuid_string = re.compile(
+    r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+_hex_string = re.compile(r'^0x[0-9a-f]+L?$')
+
+# collections that do not contain object ids. GridFS arrays use hashes
+_skipped_prefixes = ('system.', 'arrays.')
+
+
+def _is_binary(value):
+    return isinstance(value, (Binary, uuid.UUID))
+
+
+def _is_id(value):
+    # true for all representations of object ids used in the DB
+    if isinstance(value, Binary):
+        return value.subtype == UUID_SUBTYPE
+    elif isinstance(value, uuid.UUID):
+        return True
+    elif isinstance(value, six.string_types):
+        return bool(_uuid_string.match(value) or _hex_string.match(value))
+
+    return False
+
+
+class _Converter(object):
+    def __init__(self, id_format, files):
+        self.binary = id_format == 'binary'
+        # GridFS files use hex strings instead of UUID strings
+        self.files = files
+
+    def id(self, value):
+        if not _is_id(value) or (self.binary and _is_binary(value)):
+            return value
+
+        idx = uuid_from_db(value)
+        if self.binary:
+            return uuid_to_binary(idx)
+        elif self.files:
+            return hex(idx)
+        else:
+            return uuid_to_str(idx)
+
+    def reference(self, obj):
+        if self.binary and '_bin_uuid' in obj:
+            return obj
+
+        idx = uuid_from_db(obj.get('_bin_uuid', obj.get('_hex_uuid')))
+        if self.binary:
+            return {'_bin_uuid': uuid_to_binary(idx), '_store': obj['_store']}
+        else:
+            return {'_hex_uuid': hex(idx), '_store': obj['_store']}
+
+    def value(self, obj):
+        if type(obj) is dict:
+            if '_store' in obj and ('_hex_uuid' in obj or '_bin_uuid' in obj):
+                return self.reference(obj)
+
+            return {key: self.value(value) for key, value in obj.items()}
+        elif type(obj) is list:
+            return [self.value(value) for value in obj]
+
+        return obj
+
+    def document(self, doc):
+        doc = self.value(doc)
+        doc['_id'] = self.id(doc['_id'])
+
+        if 'files_id' in doc:
+            doc['files_id'] = self.id(doc['files_id'])
+
+        if 'waiting_on' in doc:
+            doc['waiting_on'] = [self.id(idx) for idx in doc['waiting_on']]
+
+        if '_cls' in doc and '_dict' in doc:
+            # `_obj_uuid` of stored objects repeats `_id` for string ids
+            doc.pop('_obj_uuid', None)
+            if not self.binary:
+                doc['_obj_uuid'] = doc['_id']
+
+        return doc
+
+
+def _key(_id):
+    # compare ids independent of how they were decoded
+    if _is_id(_id):
+        return uuid_from_db(_id)
+
+    return _id
+
+
+def _migrate_collection(collection, converter, batch_size):
+    count = 0
+    batch = []
+    for doc in collection.find():
+        batch.append(doc)
+        if len(batch) == batch_size:
+            count += _migrate_batch(collection, converter, batch)
+            batch = []
+
+    if batch:
+        count += _migrate_batch(collection, converter, batch)
+
+    return count
+
+
+def _migrate_batch(collection, converter, docs):
+    moved = []
+    updated = []
+    for doc in docs:
+        new = converter.document(dict(doc))
+        if new['_id'] != doc['_id']:
+            moved.append((doc, new))
+        elif new != doc:
+            updated.append((doc, new))
+
+    if moved:
+        # the new documents are written first, so an interrupted migration
+        # can be run again
+        existing = set(
+            _key(doc['_id']) for doc in collection.find(
+                {'_id': {'$in': [new['_id'] for _, new in moved]}},
+                {'_id': True}))
+
+        inserts = [
+            new for _, new in moved if _key(new['_id']) not in existing]
+        if inserts:
+            collection.insert_many(inserts)
+
+        collection.delete_many(
+            {'_id': {'$in': [doc['_id'] for doc, _ in moved]}})
+
+    for doc, new in updated:
+        changes = {'$set': {
+            key: value for key, value in new.items()
+            if key != '_id' and doc.get(key) != value}}
+        removed = [key for key in doc if key not in new]
+        if removed:
+            changes['$unset'] = {key: '' for key in removed}
+
+        collection.update_one({'_id': doc['_id']}, changes)
+
+    return len(moved) + len(updated)
+
+
+def migrate_ids(db, id_format='binary', batch_size=1000):
+    """
+    Convert all object ids of a project DB to another format
+
+    Document ids, references to stored objects and the id lists used in
+    queries (e.g. `Task.waiting_on`) are rewritten. The project must not be
+    used while the migration runs. An interrupted migration can be
+    started again.
+
+    Parameters
+    ----------
+    db : `pymongo.database.Database`
+        the DB of the project, usually named `storage-<project name>`
+    id_format : str
+        the new format, `binary` for 16 byte BSON UUIDs or `string` for
+        UUID strings
+    batch_size : int
+        the number of documents that are converted together
+
+    Returns
+    -------
+    dict
+        the number of changed documents for each collection
+
+    """
+    if id_format not in ['binary', 'string']:
+        raise ValueError(
+            'Unknown id format `%s`. Use `string` or `binary`' % id_format)
+
+    counts = {}
+    for name in sorted(db.list_collection_names()):
+        if name.startswith(_skipped_prefixes):
+            continue
+
+        converter = _Converter(id_format, name.startswith('fs.'))
+        counts[name] = _migrate_collection(db[name], converter, batch_size)
+
+    return counts
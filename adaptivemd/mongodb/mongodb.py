@@ -28,11 +28,20 @@ from __future__ import absolute_import, print_function
 
 import abc
 import logging
+import threading
 from collections import OrderedDict
+from contextlib import contextmanager
+from .base import uuid_to_str, uuid_to_binary
+from .cache import ByteLRUCache, parse_bytes
 from .dictify import UUIDObjectJSON
-from .object import ObjectStore
+from .object import ObjectStore, BulkSave
+from .syncvar import WriteBuffer
+from .embedded import SQLiteDatabase, SQLiteGridFS
+from .clients import get_client
 
-from pymongo import MongoClient
+import gridfs
+import six
+from bson.binary import Binary
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +52,12 @@ class MongoDBStorage(object):
     """
     _db_url = 'mongodb://localhost:27017/'
 
+    # the representation of object ids in new storages. `string` uses UUID
+    # strings, `binary` 16 byte BSON UUIDs which need less space in
+    # documents and indexes. Existing storages keep their format, see
+    # :func:`mongodb.migrate.migrate_ids` to convert them
+    default_id_format = 'string'
+
     @classmethod
     def set_host(cls, host):
         #cls._db_url = cls._db_url.replace('localhost', host)
@@ -50,7 +65,22 @@ class MongoDBStorage(object):
 
     @classmethod
     def set_location(cls, location):
-        cls._db_url = 'mongodb://' + location
+        if '://' in location:
+            # a full url, e.g. `sqlite:///path` for the embedded backend
+            cls._db_url = location
+        else:
+            cls._db_url = 'mongodb://' + location
+
+    @classmethod
+    def _create_client(cls):
+        """
+        Return the shared client for the DB at `_db_url`
+
+        Urls with a `sqlite` scheme use the embedded backend
+        :class:`mongodb.embedded.SQLiteClient`, all others a MongoDB server.
+        See :func:`mongodb.clients.get_client`.
+        """
+        return get_client(cls._db_url)
 
     @classmethod
     def set_port(cls, port):
@@ -135,7 +165,7 @@ class MongoDBStorage(object):
 
         self.mode = mode
 
-        self._client = MongoClient(self._db_url)
+        self._client = self._create_client()
         self._db_name = 'storage-' + filename
 
         self.filename = filename
@@ -143,6 +173,11 @@ class MongoDBStorage(object):
         # this can be set to false to re-store proxies from other stores
         self.exclude_proxy_from_other = False
 
+        # if set, sync variable writes are collected and sent in bulk
+        self.write_buffer = None
+
+        self._local = threading.local()
+
         super(MongoDBStorage, self).__init__()
 
         self._setup_class()
@@ -152,6 +187,7 @@ class MongoDBStorage(object):
 
             self._client.drop_database(self._db_name)
             self.db = self._client[self._db_name]
+            self._set_id_format(self.default_id_format)
             self._create_simplifier()
 
             # create the store that holds stores
@@ -173,6 +209,7 @@ class MongoDBStorage(object):
             self.db = self._client[self._db_name]
 
             # self.check_version()
+            self._set_id_format(self._stored_id_format())
             self._create_simplifier()
 
             # open the store that contains all stores
@@ -198,28 +235,156 @@ class MongoDBStorage(object):
                     key_store = self.attributes.key_store(attribute)
                     key_store.attribute_list[attribute] = store
 
+    def _set_id_format(self, id_format):
+        # `db_id` returns the `_id` of a document for an object id
+        if id_format == 'string':
+            self.db_id = uuid_to_str
+        elif id_format == 'binary':
+            self.db_id = uuid_to_binary
+        else:
+            raise ValueError(
+                'Unknown id format `%s`. Use `string` or `binary`' % id_format)
+
+        self.id_format = id_format
+
+    def _stored_id_format(self):
+        # the format used by the documents in the store of stores
+        doc = self.db['stores'].find_one({}, {'_id': True})
+        if doc is None:
+            return self.default_id_format
+
+        _id = doc['_id']
+        if isinstance(_id, six.string_types) and not isinstance(_id, Binary):
+            return 'string'
+
+        return 'binary'
+
     def close(self):
         """
         Close the DB connection
 
         """
-        self._client.close()
+        self.set_write_behind(False)
+        # the client is shared with other storages of this process
+        self._client = None
+
+    def set_write_behind(self, enabled=True, interval=None):
+        """
+        Enable or disable buffering of sync variable writes
+
+        If enabled, writes to sync variables like `Worker.seen` are collected,
+        repeated writes to the same attribute are merged and all updates
+        are sent with one `bulk_write` per store. Variables created with
+        `buffered=False`, like `Task.state`, are always written immediately.
+
+        Parameters
+        ----------
+        enabled : bool
+            if False, pending writes are flushed and buffering is stopped
+        interval : float or None
+            the maximal time in seconds a write is kept in the buffer. If None
+            writes are only sent on :meth:`flush`
+
+        """
+        if self.write_buffer is not None:
+            self.write_buffer.close()
+            self.write_buffer = None
+
+        if enabled:
+            self.write_buffer = WriteBuffer(interval)
+
+    @property
+    def bulk(self):
+        """
+        :class:`mongodb.object.BulkSave` or None : the collector of new
+        documents if :meth:`bulk_save` is active in the current thread
+        """
+        return getattr(self._local, 'bulk', None)
+
+    @contextmanager
+    def bulk_save(self):
+        """
+        Context in which new objects are inserted with one call per store
+
+        Saving an object also saves all new objects it references, usually
+        spread over several stores. Inside this context the documents are
+        collected and inserted with one ordered `insert_many` per store when
+        the outermost context exits. If that fails or the context exits with
+        an exception, no pending object is marked as saved. Sync variables
+        set on pending objects are inserted with their latest values.
+
+        Examples
+        --------
+        >>> with storage.bulk_save():
+        ...     storage.tasks.save(tasks)  # doctest: +SKIP
+
+        """
+        bulk = self.bulk
+        if bulk is not None:
+            # nested contexts are part of the outer one
+            yield bulk
+            return
+
+        bulk = BulkSave()
+        self._local.bulk = bulk
+        try:
+            yield bulk
+        except BaseException:
+            self._local.bulk = None
+            bulk.rollback()
+            raise
+
+        self._local.bulk = None
+        bulk.commit()
+
+    def flush(self):
+        """
+        Write all buffered sync variable updates to the DB
+
+        Returns
+        -------
+        int
+            the number of updated documents
+
+        """
+        if self.write_buffer is not None:
+            return self.write_buffer.flush()
+
+        return 0
+
+    def create_grid(self, collection='fs'):
+        """
+        Return a GridFS instance for this storage
+
+        Parameters
+        ----------
+        collection : str
+            the prefix of the GridFS collections
+
+        Returns
+        -------
+        `gridfs.GridFS` or :class:`mongodb.embedded.SQLiteGridFS`
+            the file system that fits the DB backend
+
+        """
+        if isinstance(self.db, SQLiteDatabase):
+            return SQLiteGridFS(self.db, collection)
+
+        return gridfs.GridFS(self.db, collection)
 
     def _create_simplifier(self):
         self.simplifier = UUIDObjectJSON(self)
 
     @classmethod
     def list_storages(cls):
-        c = MongoClient(cls._db_url)
-        names = c.database_names()
-        c.close()
+        c = cls._create_client()
+        names = c.list_database_names()
         return [n[8:] for n in names if n.startswith('storage-')]
 
     @classmethod
     def delete_storage(cls, name):
-        c = MongoClient(cls._db_url)
+        c = cls._create_client()
         c.drop_database('storage-' + name)
-        c.close()
 
     @staticmethod
     def _cmp_version(v1, v2):
@@ -314,7 +479,9 @@ class MongoDBStorage(object):
         Add a object store to the file
 
         An object store is a special type of variable that allows to store
-        python objects
+        python objects. Missing DB indexes for the fields listed in
+        :meth:`mongodb.ObjectStore.index_keys` are created unless the storage
+        is opened read-only.
 
         Parameters
         ----------
@@ -327,6 +494,9 @@ class MongoDBStorage(object):
         name = store.name
         store.register(self)
 
+        # make sure all fields used in queries are indexed
+        store.ensure_indexes(create=self.mode != 'r')
+
         if register_attr:
             if hasattr(self, name):
                 raise ValueError('Attribute name %s is already in use!' % name)
@@ -488,13 +658,70 @@ class MongoDBStorage(object):
 
         # need to update
         for store in self.objects.values():
-            store.check_size()
+            store.check_size(True)
             if uuid in store.index:
                 return store[uuid]
 
         # nothing found.
         raise KeyError("UUID %s not found in storage" % uuid)
 
+    def snapshot(self, store, fields=None, query=None, max_age=None):
+        """
+        Return a context in which sync variables of a store are read in bulk
+
+        Parameters
+        ----------
+        store : :class:`mongodb.ObjectStore` or str
+            the store (or its name) to take the snapshot of
+        fields : list of str or None
+            the names of the sync variables to be read. If None all sync
+            variables of the content class are used
+        query : dict or None
+            a mongodb filter to restrict the snapshot to some documents
+        max_age : float or None
+            if set, the snapshot is reloaded on access once it is older
+            than this number of seconds
+
+        Examples
+        --------
+        >>> with storage.snapshot('tasks', fields=['state', 'worker']):
+        ...     states = [t.state for t in storage.tasks]  # doctest: +SKIP
+
+        See Also
+        --------
+        :meth:`mongodb.ObjectStore.snapshot`
+
+        """
+        if not isinstance(store, ObjectStore):
+            store = self._stores[store]
+
+        return store.snapshot(fields, query, max_age)
+
+    def index_report(self):
+        """
+        Return the usage of DB indexes and the missing indexes of all stores
+
+        Returns
+        -------
+        dict of str, dict
+            for each store name a dict with the number of operations per
+            index in `usage`, the fields without index in `missing` and the
+            indexes on fields that are not queried in `unneeded`
+
+        Examples
+        --------
+        >>> report = storage.index_report()  # doctest: +SKIP
+        >>> report['tasks']['missing']  # doctest: +SKIP
+        []
+
+        """
+        return {
+            name: {
+                'usage': store.index_usage(),
+                'missing': store.missing_indexes(),
+                'unneeded': store.unneeded_indexes()
+            } for name, store in self._stores.items()}
+
     def cache_image(self):
         """
         Return an dict containing information about all caches
@@ -503,14 +730,17 @@ class MongoDBStorage(object):
         -------
         dict
             a nested dict containing information about the number and types of
-            cached objects
+            cached objects, and the hits, misses and evictions of each cache
         """
         image = {
             'weak': {},
             'strong': {},
             'total': {},
             'file': {},
-            'index': {}
+            'index': {},
+            'hits': {},
+            'misses': {},
+            'evictions': {}
         }
 
         total_strong = 0
@@ -529,6 +759,11 @@ class MongoDBStorage(object):
                 'size_strong': size[0],
                 'size_weak': size[1],
             }
+            stats = store.cache.stats
+            profile.update(stats)
+            for key in ['hits', 'misses', 'evictions']:
+                image[key][name] = stats[key]
+
             total_strong += count[0]
             total_weak += count[1]
             total_file += len(store)
@@ -545,5 +780,30 @@ class MongoDBStorage(object):
         image['total_weak'] = total_weak
         image['file'] = total_file
         image['index'] = total_index
+        for key in ['hits', 'misses', 'evictions']:
+            image['total_' + key] = sum(image[key].values())
 
         return image
+
+    def set_cache_budget(self, max_bytes, stores=None):
+        """
+        Limit the memory of cached objects
+
+        Each store gets its own :class:`mongodb.ByteLRUCache`. Objects beyond
+        the budget are only kept as long as they are referenced elsewhere.
+
+        Parameters
+        ----------
+        max_bytes : int or str
+            the budget per store in bytes or as a string like `'64MB'`
+        stores : list of str or None
+            the names of the stores to be changed. If None all object stores
+            are changed
+
+        """
+        if stores is None:
+            stores = list(self.objects)
+
+        max_bytes = parse_bytes(max_bytes)
+        for name in stores:
+            self.objects[name].set_caching(ByteLRUCache(max_bytes))
@@ -26,18 +26,29 @@
 # for details and license
 from __future__ import absolute_import, print_function
 
+import itertools
 import logging
-from uuid import UUID
-from weakref import WeakValueDictionary
-
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from weakref import WeakValueDictionary, WeakSet
+
+from bson import BSON
 from numpy.random import randint
+from pymongo.errors import OperationFailure, BulkWriteError
 
 import six
 
-from .base import StorableMixin, long_t
+from .base import StorableMixin, long_t, uuid_from_db, modified_update
 from .cache import MaxCache, Cache, NoCache, \
-    WeakLRUCache
-from .proxy import LoaderProxy
+    WeakLRUCache, ByteLRUCache, parse_bytes
+from .index import UUIDIndex
+from .proxy import LoaderProxy, FieldLoaderProxy
+from .syncvar import SyncSnapshot
+from .view import MaterializedView
+from .watch import StoreWatch
 
 logger = logging.getLogger(__name__)
 
@@ -72,6 +83,22 @@ class ObjectStore(StorableMixin):
     default_store_chunk_size = 256
     default_cache = 10000
 
+    # documents saved up to this many seconds before the last seen save time
+    # are re-read when refreshing the index. Covers clock differences between
+    # the hosts that write to the same DB
+    index_refresh_slack = 60.0
+
+    # document fields that are indexed in every store in addition to the
+    # `_find_by`, `_query_by` and `_index_by` fields of the content classes
+    default_index_keys = ['_time', '_cls', '_saved', '_modified']
+
+    # if True the `_lazy_fields` of objects are only loaded on access
+    lazy_loading = True
+
+    # number of seconds a cached document count is used before it is synced
+    # with the DB again. Use `0` to always ask the DB
+    count_staleness = 2.0
+
     def __init__(self, name, content_class):
         """
 
@@ -108,8 +135,15 @@ class ObjectStore(StorableMixin):
 
         self.index = None
 
+        self._count = None
+        self._count_time = 0.0
+
+        self._local = threading.local()
+
         self.proxy_index = WeakValueDictionary()
 
+        self._views = WeakSet()
+
         if self.content_class is not None \
                 and not issubclass(self.content_class, StorableMixin):
             raise ValueError(
@@ -125,18 +159,25 @@ class ObjectStore(StorableMixin):
             'name': self.name
         }
 
-    def check_size(self):
+    def check_size(self, exact=False):
         """
         Perform an update in case the DB has been extended by an external source
 
+        Parameters
+        ----------
+        exact : bool
+            if True the number of documents is requested from the DB, otherwise
+            a cached count that is at most `count_staleness` seconds old
+            is used
+
         Returns
         -------
         bool
             returns True if an update was performed
 
         """
-        if len(self) > len(self.index):
-            self.load_indices()
+        if self.count(exact) > len(self.index):
+            self.refresh_indices()
             return True
 
         return False
@@ -159,15 +200,186 @@ class ObjectStore(StorableMixin):
 
     @staticmethod
     def create_uuid_index():
-        return []
+        return UUIDIndex()
 
     def restore(self):
         self.load_indices()
 
+    @staticmethod
+    def _index_projection():
+        return {'_id': True, '_saved': True}
+
+    @staticmethod
+    def _index_uuid(doc):
+        return uuid_from_db(doc['_id'])
+
+    def _index_documents(self, query):
+        return self._document.find(query, self._index_projection())
+
+    def _add_to_index(self, docs):
+        index = self.index
+        for doc in docs:
+            index.append(self._index_uuid(doc))
+            index.update_high_water(doc.get('_saved'))
+
+    def _index_collection(self):
+        return self._document
+
+    def index_keys(self):
+        """
+        Return the document fields that should have a DB index
+
+        These are the `default_index_keys` and all `_find_by`, `_query_by`
+        and `_index_by` fields of the content class and its subclasses,
+        except the `_no_index` fields of the class that lists them
+
+        Returns
+        -------
+        list of str
+            the field names
+
+        """
+        keys = list(self.default_index_keys)
+        if self.content_class is not None:
+            for cls in [self.content_class] + \
+                    self.content_class.descendants():
+                for key in cls._find_by + cls._query_by + cls._index_by:
+                    if key not in keys and key not in cls._no_index:
+                        keys.append(key)
+
+        return keys
+
+    def unneeded_indexes(self):
+        """
+        Return the names of DB indexes on fields that are not queried
+
+        These are single field indexes on `_no_index` fields that are not in
+        :meth:`index_keys`, e.g. created by older versions.
+
+        Returns
+        -------
+        list of str
+            the index names
+
+        """
+        if self.content_class is None:
+            return []
+
+        excluded = set()
+        for cls in [self.content_class] + self.content_class.descendants():
+            excluded.update(cls._no_index)
+
+        excluded.difference_update(self.index_keys())
+
+        info = self._index_collection().index_information()
+        return [
+            name for name, index in info.items()
+            if len(index['key']) == 1 and index['key'][0][0] in excluded]
+
+    def missing_indexes(self):
+        """
+        Return the fields of :meth:`index_keys` without a DB index
+
+        Returns
+        -------
+        list of str
+            the field names without an index on the collection
+
+        """
+        info = self._index_collection().index_information()
+        indexed = set(
+            index['key'][0][0] for index in info.values())
+
+        return [key for key in self.index_keys() if key not in indexed]
+
+    def ensure_indexes(self, create=True):
+        """
+        Check that all fields in :meth:`index_keys` have a DB index
+
+        Parameters
+        ----------
+        create : bool
+            if True missing indexes are created. Otherwise they are only
+            reported in the log
+
+        Returns
+        -------
+        list of str
+            the fields that were missing an index
+
+        """
+        missing = self.missing_indexes()
+        collection = self._index_collection()
+        for key in missing:
+            if create:
+                logger.info(
+                    'Creating index on `%s` for store `%s`' % (key, self.name))
+                collection.create_index(key, background=True)
+            else:
+                logger.info(
+                    'Store `%s` has no index on `%s`' % (self.name, key))
+
+        if create:
+            for name in self.unneeded_indexes():
+                logger.info(
+                    'Dropping index `%s` of store `%s`' % (name, self.name))
+                collection.drop_index(name)
+
+        return missing
+
+    def index_usage(self):
+        """
+        Return the number of accesses of all DB indexes of the store
+
+        Returns
+        -------
+        dict of str, int or None
+            the number of operations that used each index since the DB
+            server started. None if the server does not report it
+
+        """
+        collection = self._index_collection()
+        usage = {
+            name: None for name in collection.index_information()}
+
+        try:
+            for stat in collection.aggregate([{'$indexStats': {}}]):
+                usage[stat['name']] = stat['accesses']['ops']
+        except (OperationFailure, NotImplementedError):
+            logger.debug(
+                'Index statistics not available for `%s`' % self.name)
+
+        return usage
+
     def load_indices(self):
-        # self.index.clear()
-        # self.index.extend(
-        self.index = [int(UUID(x)) for x in self._document.distinct('_id')]
+        """
+        Reload the full index of stored uuids from the DB
+
+        """
+        self.index.clear()
+        self._add_to_index(self._index_documents({}))
+
+    def refresh_indices(self):
+        """
+        Add uuids of documents that were saved since the last refresh
+
+        Only documents with a save time (`_saved`) later than the high water
+        mark of the index (minus `index_refresh_slack`) are fetched. If that
+        does not explain the number of documents in the DB, e.g. because an
+        older version without save times wrote to it, the full index is
+        reloaded.
+
+        """
+        high_water = self.index.high_water
+        if high_water is None:
+            self.load_indices()
+            return
+
+        self._add_to_index(self._index_documents(
+            {'_saved': {'$gte': high_water - self.index_refresh_slack}}))
+
+        if len(self) > len(self.index):
+            self.load_indices()
 
     @property
     def storage(self):
@@ -218,7 +430,12 @@ class ObjectStore(StorableMixin):
 
         Parameters
         ----------
-        caching : :class:`mongodb.Cache`
+        caching : :class:`mongodb.Cache` or bool or int or str or None
+            the cache to be used. `True` keeps all objects, `False` none
+            and an `int` the given number of recently used objects. A
+            string like `'64MB'` creates a :class:`mongodb.ByteLRUCache`
+            with this budget, where the size of an object is the length of
+            its stored document. `None` uses `default_cache`
 
         """
         if caching is None:
@@ -230,6 +447,8 @@ class ObjectStore(StorableMixin):
             caching = NoCache()
         elif type(caching) is int:
             caching = WeakLRUCache(caching)
+        elif isinstance(caching, six.string_types):
+            caching = ByteLRUCache(parse_bytes(caching))
 
         if isinstance(caching, Cache):
             self.cache = caching.transfer(self.cache)
@@ -257,24 +476,68 @@ class ObjectStore(StorableMixin):
         Add iteration over all elements in the storage
         """
         self.check_size()
-        for uuid in list(self.index):
-            yield self.load(uuid)
+        uuids = list(self.index)
+        batch_size = self.default_store_chunk_size
+        for pos in range(0, len(uuids), batch_size):
+            for obj in self.load_many(uuids[pos:pos + batch_size]):
+                yield obj
 
     def __len__(self):
         """
         Return the number of stored objects
 
+        The count is cached for `count_staleness` seconds. Use
+        :meth:`count` with `exact=True` if you need the current number.
+
+        Returns
+        -------
+        int
+            number of stored objects
+
+        """
+        return self.count()
+
+    def _count_documents(self, exact):
+        if getattr(self, '_document', None) is None:
+            return None
+
+        if exact:
+            return self._document.count_documents({})
+        else:
+            return self._document.estimated_document_count()
+
+    def count(self, exact=False):
+        """
+        Return the number of stored objects
+
+        Parameters
+        ----------
+        exact : bool
+            if True the DB is always asked. Otherwise a count cached for at
+            most `count_staleness` seconds and updated with all saves and
+            deletes from this store is returned.
+
         Returns
         -------
         int
             number of stored objects
 
         """
-        if hasattr(self, '_document'):
-            if self._document:
-                return self._document.count_documents({})
+        now = time.time()
+        if exact or self._count is None or \
+                now - self._count_time > self.count_staleness:
+            count = self._count_documents(exact)
+            if count is None:
+                return 0
 
-        return 0
+            self._count = count
+            self._count_time = now
+
+        return self._count
+
+    def _change_count(self, n):
+        if self._count is not None:
+            self._count = max(0, self._count + n)
 
     def proxy(self, item):
         """
@@ -299,7 +562,7 @@ class ObjectStore(StorableMixin):
         elif tt in set([six.text_type]):
             if item[0] == '-':
                 return None
-            idx = int(UUID(item))
+            idx = uuid_from_db(item)
         else:
             idx = item.__uuid__
 
@@ -309,7 +572,7 @@ class ObjectStore(StorableMixin):
         if item.__uuid__ in self.index:
             return True
 
-        if self.check_size():
+        if self.check_size(True):
             if item.__uuid__ in self.index:
                 return True
 
@@ -337,7 +600,7 @@ class ObjectStore(StorableMixin):
         try:
             return self[item]
         except KeyError:
-            if self.check_size():
+            if self.check_size(True):
                 try:
                     return self[item]
                 except KeyError:
@@ -361,6 +624,8 @@ class ObjectStore(StorableMixin):
             is returned
 
         """
+        self.flush()
+
         consumed = None
         while consumed is None and len(self) > 0:
             if test_fnc is None:
@@ -373,7 +638,7 @@ class ObjectStore(StorableMixin):
                     break
 
             idx = one.__uuid__
-            erg = self._document.remove({'_id': str(UUID(int=idx))})
+            erg = self._document.remove({'_id': self.storage.db_id(idx)})
             if erg['ok']:
                 consumed = one
             else:
@@ -383,7 +648,9 @@ class ObjectStore(StorableMixin):
                 pass
 
         if consumed is not None:
+            self._change_count(-1)
             self.index.remove(consumed.__uuid__)
+            self._notify('removed', consumed.__uuid__)
             if consumed.__uuid__ in self.cache:
                 del self.cache[consumed.__uuid__]
 
@@ -409,23 +676,26 @@ class ObjectStore(StorableMixin):
             is returned
 
         """
+        self.flush()
+
         modified = None
         while modified is None and len(self) > 0:
 
             erg = self._document.find_and_modify(
                 query={key: value},
-                update={"$set": {key: update}},
+                update=modified_update({"$set": {key: update}}),
                 upsert=False
                 )
 
             if erg is not None:
                 # success, we got it
-                idx = int(UUID(erg['_id']))
+                idx = uuid_from_db(erg['_id'])
 
                 # remove from cache
                 if idx in self.cache:
                     del self.cache[idx]
 
+                self._notify('modified', idx, key, update)
                 modified = self.load(idx)
 
         return modified
@@ -452,12 +722,14 @@ class ObjectStore(StorableMixin):
             is returned
 
         """
+        self.flush()
+
         modified = None
         while modified is None and len(self) > 0:
             try:
                 found_ones = self._document.find({key: value})
                 one = next(t for t in (
-                    self.load(int(UUID(f['_id']))) for f in found_ones) if test_fnc(t))
+                    self.load(uuid_from_db(f['_id'])) for f in found_ones) if test_fnc(t))
 
             except StopIteration:
                 break
@@ -465,8 +737,8 @@ class ObjectStore(StorableMixin):
             idx = one.__uuid__
 
             erg = self._document.find_and_modify(
-                query={key: value, '_id': str(UUID(int=idx))},
-                update={"$set": {key: update}},
+                query={key: value, '_id': self.storage.db_id(idx)},
+                update=modified_update({"$set": {key: update}}),
                 upsert=False
                 )
 
@@ -477,16 +749,460 @@ class ObjectStore(StorableMixin):
                 if idx in self.cache:
                     del self.cache[idx]
 
+                self._notify('modified', idx, key, update)
                 modified = self.load(idx)
 
         return modified
 
+    def claim_one(self, query, key, value, update, test_fnc=None,
+                  sort=None):
+        """
+        Atomically change an attribute of one object matching a DB query
+
+        In contrast to :meth:`modify_test_one` the candidates are selected on
+        the DB side, so the cost does not depend on the number of matching
+        objects. An additional test function can be used for conditions that
+        cannot be expressed as a query. A claimed object that fails the test
+        is reset to `value` and skipped.
+
+        Parameters
+        ----------
+        query : dict
+            a mongodb filter the document has to match in addition to
+            `{key: value}`
+        key : str
+            the attributes name to be changed
+        value : object
+            the old value to be found and changed
+        update : object
+            the new value to the changed into
+        test_fnc : function or None
+            if given the claimed object must also pass this test
+        sort : list of (str, int) or None
+            the order in which candidates are claimed. Default is the oldest
+            first using `_time`
+
+        Returns
+        -------
+        None or `StorableMixin`
+            if None then no object was altered, otherwise the changed object
+            is returned
+
+        """
+        self.flush()
+
+        if sort is None:
+            sort = [('_time', 1), ('_saved', 1)]
+
+        skipped = []
+        while True:
+            dct = dict(query)
+            dct[key] = value
+            if skipped:
+                dct['_id'] = {'$nin': skipped}
+
+            erg = self._document.find_one_and_update(
+                dct,
+                modified_update({'$set': {key: update}}),
+                projection={'_id': True},
+                sort=sort
+            )
+
+            if erg is None:
+                return None
+
+            idx = uuid_from_db(erg['_id'])
+
+            # remove from cache
+            if idx in self.cache:
+                del self.cache[idx]
+
+            self._notify('modified', idx, key, update)
+            obj = self.load(idx)
+
+            if test_fnc is None or test_fnc(obj):
+                return obj
+
+            # give it back, someone else might be able to use it
+            self._document.update_one(
+                {'_id': erg['_id'], key: update},
+                modified_update({'$set': {key: value}})
+            )
+            self._notify('modified', idx, key, value)
+            skipped.append(erg['_id'])
+
+    def claim_many(self, query, key, value, update, n, test_fnc=None,
+                   sort=None, fields=None):
+        """
+        Atomically change an attribute of up to `n` objects matching a query
+
+        Like :meth:`claim_one` for many objects at once. The candidates are
+        found with one query and changed with one `update_many`. Only if
+        some are rejected by `test_fnc` another batch is claimed to replace
+        them, at most one per accepted object. Each document is only
+        changed if it still has `key == value`, so objects claimed at the
+        same time by another process are skipped. A mark unique to this
+        call tells which ones were claimed here.
+
+        Parameters
+        ----------
+        query : dict
+            a mongodb filter the documents have to match in addition to
+            `{key: value}`
+        key : str
+            the attributes name to be changed
+        value : object
+            the old value to be found and changed
+        update : object
+            the new value to the changed into
+        n : int
+            the maximal number of objects to be claimed
+        test_fnc : function or None
+            if given the claimed objects must also pass this test. Objects
+            that fail are given back, see :meth:`release_many`. Claiming
+            stops after a batch in which all objects failed, so put
+            conditions into `query` where possible
+        sort : list of (str, int) or None
+            the order in which candidates are claimed. Default is the oldest
+            first using `_time`
+        fields : dict or None
+            other values set together with `key`, e.g. the reference to the
+            claiming worker. These are set to None if an object is given back
+
+        Returns
+        -------
+        list of `StorableMixin`
+            the changed objects in the order of `sort`
+
+        """
+        self.flush()
+
+        if sort is None:
+            sort = [('_time', 1), ('_saved', 1)]
+
+        fields = fields or {}
+
+        claimed = []
+        skipped = []
+        while len(claimed) < n:
+            dct = dict(query)
+            dct[key] = value
+            if skipped:
+                dct = {'$and': [dct, {'_id': {'$nin': skipped}}]}
+
+            requested = n - len(claimed)
+            candidates = [doc['_id'] for doc in self._document.find(
+                dct, {'_id': True}, sort=sort, limit=requested)]
+
+            if not candidates:
+                break
+
+            mark = str(uuid.uuid4())
+            changes = dict(fields)
+            changes[key] = update
+
+            self._document.update_many(
+                {'$and': [dct, {'_id': {'$in': candidates}}]},
+                modified_update({'$set': dict(changes, _claim=mark)}))
+
+            # the order of the candidates is kept
+            ours = set(uuid_from_db(doc['_id']) for doc in self._document.find(
+                {'_id': {'$in': candidates}, '_claim': mark}, {'_id': True}))
+            idxs = [
+                idx for idx in map(uuid_from_db, candidates) if idx in ours]
+
+            for idx in idxs:
+                # remove from cache
+                if idx in self.cache:
+                    del self.cache[idx]
+
+                for name, change in changes.items():
+                    self._notify('modified', idx, name, change)
+
+            rejected = []
+            for obj in self.load_many(idxs):
+                if test_fnc is None or test_fnc(obj):
+                    claimed.append(obj)
+                else:
+                    rejected.append(obj.__uuid__)
+
+            if rejected:
+                # give it back, someone else might be able to use it
+                self.release_many(rejected, key, update, value, list(fields))
+                skipped.extend(self.storage.db_id(idx) for idx in rejected)
+
+                if len(rejected) == len(idxs):
+                    # the rest of the queue is likely rejected as well
+                    break
+
+            if len(candidates) < requested:
+                # there are no more candidates
+                break
+
+        return claimed
+
+    def release_many(self, idxs, key, value, update, fields=None):
+        """
+        Give back objects that were claimed with :meth:`claim_many`
+
+        Only objects that still have `key == value` are changed. All of them
+        are changed with a single `update_many`.
+
+        Parameters
+        ----------
+        idxs : list of int
+            the ids of the objects
+        key : str
+            the attributes name to be changed
+        value : object
+            the value of claimed objects, e.g. `queued`
+        update : object
+            the value to be set, e.g. `created`
+        fields : list of str or None
+            the names of other values to be reset to None, e.g. the worker
+
+        """
+        idxs = list(idxs)
+        if not idxs:
+            return
+
+        changes = {name: None for name in fields or []}
+        changes[key] = update
+
+        buffer = self.storage.write_buffer
+        if buffer is not None:
+            # these writes supersede buffered ones
+            for idx in idxs:
+                for name in changes:
+                    buffer.discard(self, idx, name)
+
+        self._document.update_many(
+            {'_id': {'$in': [self.storage.db_id(idx) for idx in idxs]},
+             key: value},
+            modified_update({'$set': changes}))
+
+        snapshot = self.sync_snapshot
+        for idx in idxs:
+            for name, change in changes.items():
+                if snapshot is not None:
+                    snapshot.set(idx, name, change)
+
+                self._notify('modified', idx, name, change)
+
+    def lazy_fields(self):
+        """
+        Return the fields that are left out when documents are loaded
+
+        These are the `_lazy_fields` of the content class and its subclasses.
+
+        Returns
+        -------
+        list of str
+            the names of the attributes in `to_dict` that are loaded on access
+
+        """
+        if not self.lazy_loading or self.content_class is None:
+            return []
+
+        fields = []
+        for cls in [self.content_class] + self.content_class.descendants():
+            for field in cls._lazy_fields:
+                if field not in fields:
+                    fields.append(field)
+
+        return fields
+
+    def _load_projection(self):
+        fields = self.lazy_fields()
+        if not fields:
+            return None
+
+        return {'_dict.' + field: False for field in fields}
+
+    def load_field(self, idx, field):
+        """
+        Load a single attribute of a stored object
+
+        Used to resolve attributes that were left out when the object was
+        loaded, see :meth:`lazy_fields`.
+
+        Parameters
+        ----------
+        idx : int
+            the uuid of the object
+        field : str
+            the name of the attribute in `to_dict`
+
+        Returns
+        -------
+        object
+            the value of the attribute
+
+        """
+        doc = self._document.find_one(
+            {'_id': self.storage.db_id(idx)},
+            {'_dict.' + field: True})
+
+        if doc is None:
+            raise KeyError('UUID %s not found in store `%s`' % (idx, self.name))
+
+        value = doc.get('_dict', {}).get(field)
+        simplifier = self.simplifier
+        with simplifier.prefetching([value]):
+            return simplifier.build(value)
+
     def _load(self, idx, builders=[]):
-        one = self._document.find_one({'_id': str(UUID(int=idx))})
-        obj = self.storage.simplifier.from_simple_dict(one, builders)
+        simplifier = self.simplifier
+        one = simplifier.pop_prefetched(self.name, idx)
+        if one is None:
+            one = self._document.find_one(
+                {'_id': self.storage.db_id(idx)}, self._load_projection())
+
+        with simplifier.prefetching([one]):
+            return self._build(one, builders)
+
+    def _build(self, doc, builders=[]):
+        simplifier = self.storage.simplifier
+        # measure before lazy fields put proxies into the document
+        size = self._doc_size(doc)
+        cls = simplifier.class_list.get(doc.get('_cls'))
+        if cls is not None and cls._lazy_fields:
+            idx = uuid_from_db(doc['_id'])
+            attributes = doc['_dict']
+            for field in cls._lazy_fields:
+                if field not in attributes:
+                    # left out by the projection, load when accessed
+                    attributes[field] = FieldLoaderProxy(self, idx, field)
+
+        obj = simplifier.from_simple_dict(doc, builders)
         obj.__store__ = self
+        if size is not None:
+            self._cache_object(obj, size)
+
         return obj
 
+    def _cache_object(self, obj, size=None):
+        if size is None:
+            self.cache[obj.__uuid__] = obj
+        else:
+            self.cache.__setitem__(obj.__uuid__, obj, size=size)
+
+    def _doc_size(self, doc):
+        # the number of bytes used by a document if the cache needs it
+        if self.cache.sized:
+            return len(BSON.encode(doc))
+
+    def _load_batch(self, idxs):
+        docs = self._document.find(
+            {'_id': {'$in': [self.storage.db_id(idx) for idx in idxs]}},
+            self._load_projection())
+
+        return {uuid_from_db(doc['_id']): doc for doc in docs}
+
+    def flush(self):
+        """
+        Write buffered sync variable updates of this store to the DB
+
+        """
+        buffer = self.storage.write_buffer
+        if buffer is not None:
+            buffer.flush(self)
+
+    @property
+    def sync_snapshot(self):
+        """
+        :class:`mongodb.syncvar.SyncSnapshot` or None : the snapshot used
+        to read sync variables in the current thread
+        """
+        return getattr(self._local, 'snapshot', None)
+
+    @contextmanager
+    def snapshot(self, fields=None, query=None, max_age=None):
+        """
+        Context in which sync variables are read from one bulk query
+
+        Parameters
+        ----------
+        fields : list of str or None
+            the names of the sync variables to be read. If None all sync
+            variables of the content class are used
+        query : dict or None
+            a mongodb filter to restrict the snapshot to some documents
+        max_age : float or None
+            if set, the snapshot is reloaded on access once it is older
+            than this number of seconds
+
+        See Also
+        --------
+        :class:`mongodb.syncvar.SyncSnapshot`
+
+        """
+        previous = self.sync_snapshot
+        snapshot = SyncSnapshot(self, fields, query, max_age)
+        self._local.snapshot = snapshot
+        try:
+            yield snapshot
+        finally:
+            self._local.snapshot = previous
+
+    def view(self, query, max_age=None):
+        """
+        Return a view of the objects matching a DB query
+
+        The view is updated from the saves and sync variable writes of
+        this process and from recently saved or modified documents, so it
+        only queries all matching documents again if the result is older
+        than `max_age`.
+
+        Parameters
+        ----------
+        query : dict
+            a mongodb filter for the documents of this store
+        max_age : float or None
+            if set the ids are requested again on access after this number
+            of seconds. Use it to see deletions from other processes
+
+        Returns
+        -------
+        :class:`mongodb.view.MaterializedView`
+            the view. It is updated as long as it is referenced
+
+        """
+        view = MaterializedView(self, query, max_age)
+        self._views.add(view)
+        return view
+
+    def watch(self, query, callback, poll_interval=None):
+        """
+        Call a function for changes of documents matching a DB query
+
+        This includes changes from other processes. See
+        :class:`mongodb.watch.StoreWatch` for how changes are found and what
+        is passed to `callback`
+
+        Parameters
+        ----------
+        query : dict or None
+            a mongodb filter for the changed documents. None reports all
+        callback : function
+            called from a background thread with a dict for each change
+        poll_interval : float or None
+            the seconds between polls if change streams are not available
+
+        Returns
+        -------
+        :class:`mongodb.watch.StoreWatch`
+            the running watch. Call `close` to stop it
+
+        """
+        return StoreWatch(
+            self._document, query, callback, poll_interval).start()
+
+    def _notify(self, event, *args):
+        # let all views know about changes done in this process
+        for view in list(self._views):
+            getattr(view, event)(*args)
+
     def clear_cache(self):
         """Clear the cache and force reloading"""
 
@@ -496,12 +1212,8 @@ class ObjectStore(StorableMixin):
     def cache_all(self):
         """Load all samples as fast as possible into the cache"""
         if not self._cached_all:
-            idxs = range(len(self))
-            jsons = self.variables['json'][:]
-
-            [self.add_single_to_cache(i, j) for i, j in zip(
-                idxs,
-                jsons)]
+            self.check_size(True)
+            self.load_many(list(self.index))
 
             self._cached_all = True
 
@@ -529,9 +1241,17 @@ class ObjectStore(StorableMixin):
 
         try:
             l_dct = [self.storage.simplifier.to_simple_dict(o) for o in obj]
-            self._document.insert_many(l_dct)
-            [setattr(o,'__store__',self) for o in obj]
-            [self.cache.update({o.__uuid__: o}) for o in obj]
+            saved = time.time()
+            for dct in l_dct:
+                dct['_saved'] = saved
+
+            bulk = self.storage.bulk
+            if bulk is not None:
+                # inserted together with the rest of the object graph
+                bulk.add(self, obj, l_dct)
+            else:
+                self._document.insert_many(l_dct)
+                self._set_saved(obj, l_dct)
 
         except Exception as e:
             # in case we did not succeed remove the mark as being saved
@@ -540,6 +1260,21 @@ class ObjectStore(StorableMixin):
 
         return [self.reference(o) for o in obj]
 
+    def _set_saved(self, objs, docs):
+        # register objects that are now in the DB
+        self._change_count(len(objs))
+        for o, doc in zip(objs, docs):
+            o.__store__ = self
+            self._cache_object(o, self._doc_size(doc))
+
+        self._notify('saved', docs)
+
+    def _set_unsaved(self, objs):
+        # remove the marks of objects that did not make it into the DB
+        for o in objs:
+            if o.__uuid__ in self.index:
+                self.index.remove(o.__uuid__)
+
 
     @property
     def last(self):
@@ -575,7 +1310,7 @@ class ObjectStore(StorableMixin):
         `StorableMixin`
             the content of the store
         """
-        idx = int(UUID(self._document.find_one()['_id']))
+        idx = uuid_from_db(self._document.find_one()['_id'])
         return self.load(idx)
 
     def pick(self):
@@ -590,7 +1325,8 @@ class ObjectStore(StorableMixin):
         #       number argument to get multiple.
         #       use/implement bulk pull&load for
         #       for this
-        length = len(self)
+        self.check_size()
+        length = len(self.index)
         if length:
             idx = randint(length)
             return self.load(self.index[idx])
@@ -610,7 +1346,7 @@ class ObjectStore(StorableMixin):
         `StorableMixin`
             the content of the store
         """
-        idx = int(UUID(self._document.find_one(sort=[("_time", -1)])['_id']))
+        idx = uuid_from_db(self._document.find_one(sort=[("_time", -1)])['_id'])
         return self.load(idx)
 
     @property
@@ -625,7 +1361,7 @@ class ObjectStore(StorableMixin):
         `StorableMixin`
             the content of the store
         """
-        idx = int(UUID(self._document.find_one(sort=[("_time", 1)])['_id']))
+        idx = uuid_from_db(self._document.find_one(sort=[("_time", 1)])['_id'])
         return self.load(idx)
 
     def free(self):
@@ -657,7 +1393,209 @@ class ObjectStore(StorableMixin):
 
     def find_one(self, dct):
         idx = self._document.find_one(dct)['_id']
-        return self.load(int(UUID(idx)))
+        return self.load(uuid_from_db(idx))
+
+    def find(self, query):
+        """
+        Iterate over all objects whose documents match a DB query
+
+        Only the ids are requested from the DB first. The objects are then
+        loaded in batches using :meth:`load_many`.
+
+        Parameters
+        ----------
+        query : dict
+            a mongodb filter for the documents of this store
+
+        Returns
+        -------
+        Iterator of :py:class:`mongodb.base.StorableMixin`
+            the matching objects, the oldest first
+
+        """
+        uuids = self.find_uuids(query)
+
+        batch_size = self.default_store_chunk_size
+        for pos in range(0, len(uuids), batch_size):
+            for obj in self.load_many(uuids[pos:pos + batch_size]):
+                yield obj
+
+    def find_documents(self, query, fields=None):
+        """
+        Return the documents that match a DB query, the oldest first
+
+        `_time` has only a resolution of seconds, so documents with the same
+        `_time` are ordered by their save time and then by their position in
+        the index. This keeps objects in the order they were stored in.
+
+        Parameters
+        ----------
+        query : dict
+            a mongodb filter for the documents of this store
+        fields : iterable of str or None
+            the fields to be returned in addition to `_id`
+
+        Returns
+        -------
+        list of dict
+            the matching documents
+
+        """
+        self.flush()
+        projection = {'_id': True, '_time': True, '_saved': True}
+        projection.update((field, True) for field in fields or [])
+        docs = self._document.find(
+            query, projection, sort=[('_time', 1), ('_saved', 1)])
+
+        def tie_key(doc):
+            # documents without a save time come first as in the DB sort,
+            # uuids not (yet) in the index keep their DB order at the end
+            saved = doc.get('_saved')
+            pos = order(uuid_from_db(doc['_id']))
+            return saved is not None, saved or 0, pos is None, pos or 0
+
+        result = []
+        order = self.index.order
+        for _, group in itertools.groupby(docs, lambda d: d.get('_time')):
+            tied = list(group)
+            if len(tied) > 1:
+                tied.sort(key=tie_key)
+
+            result.extend(tied)
+
+        return result
+
+    def find_uuids(self, query):
+        """
+        Return the uuids of all documents that match a DB query
+
+        Parameters
+        ----------
+        query : dict
+            a mongodb filter for the documents of this store
+
+        Returns
+        -------
+        list of int
+            the uuids of the matching documents in the order of
+            :meth:`find_documents`
+
+        """
+        return [uuid_from_db(doc['_id']) for doc in self.find_documents(query)]
+
+    def count_matching(self, query):
+        """
+        Return the number of objects whose documents match a DB query
+
+        Parameters
+        ----------
+        query : dict
+            a mongodb filter for the documents of this store
+
+        Returns
+        -------
+        int
+            the number of matching documents
+
+        """
+        self.flush()
+        return self._document.count_documents(query)
+
+    def _content_classes(self):
+        if self.content_class is None:
+            return []
+
+        return [self.content_class] + self.content_class.descendants()
+
+    def class_filter(self, cls):
+        """
+        Return a DB filter for objects that are instances of a class
+
+        Parameters
+        ----------
+        cls : type
+            the class. Instances of subclasses match as well
+
+        Returns
+        -------
+        dict or None
+            the mongodb filter on the stored `_cls` or None if `cls` is not
+            a storable class
+
+        """
+        if not isinstance(cls, type) or not issubclass(cls, StorableMixin):
+            return None
+
+        names = [c.__name__ for c in [cls] + cls.descendants()]
+        return {'_cls': {'$in': sorted(set(names))}}
+
+    def attribute_filter(self, key, value):
+        """
+        Return a DB filter for objects with an attribute equal to a value
+
+        Attributes in `_find_by` or `_query_by` of all content classes are
+        stored as fields of their own and are matched exactly. For all
+        other attributes the stored `to_dict` content is used. Documents
+        without the attribute in `to_dict` match as well, so the loaded
+        objects still need to be compared in python.
+
+        Parameters
+        ----------
+        key : str
+            the name of the attribute
+        value : object
+            the value to match
+
+        Returns
+        -------
+        dict or None
+            the mongodb filter or None if `value` cannot be queried
+        exact : bool
+            if True the filter selects only matching objects
+
+        """
+        classes = self._content_classes()
+        if classes and all(
+                key in cls._find_by + cls._query_by for cls in classes):
+            return self.simplifier.value_filter(key, value), True
+
+        path = '_dict.' + key
+        query = self.simplifier.value_filter(path, value)
+        if query is None:
+            return None, False
+
+        return {'$or': [query, {path: {'$exists': False}}]}, False
+
+    def find_all_by(self, key, value):
+        """
+        Return all objects with an attribute equal to a value
+
+        The candidates are selected on the DB side if possible, see
+        :meth:`attribute_filter`. Otherwise all objects are loaded.
+
+        Parameters
+        ----------
+        key : str
+            the name of the attribute
+        value : object
+            the value to match against using `==`
+
+        Returns
+        -------
+        list of :py:class:`mongodb.base.StorableMixin`
+            the matching objects. Objects without the attribute do not match
+
+        """
+        def matches(x):
+            return hasattr(x, key) and getattr(x, key) == value
+
+        query, exact = self.attribute_filter(key, value)
+        if query is None:
+            return [x for x in self if matches(x)]
+        elif exact:
+            return list(self.find(query))
+        else:
+            return [x for x in self.find(query) if matches(x)]
 
     def load(self, idx, builders=[], force_load=False):
         """
@@ -675,11 +1613,11 @@ class ObjectStore(StorableMixin):
         """
 
         if type(idx) is str:
-            idx = int(UUID(self._document.find_one({'name': idx})['_id']))
+            idx = uuid_from_db(self._document.find_one({'name': idx})['_id'])
 
         if type(idx) is long_t:
             if idx not in self.index:
-                self.check_size()
+                self.check_size(True)
                 if idx not in self.index:
                     raise ValueError(
                         'str %s not found in storage for class %s' % (idx, self.content_class.__name__))
@@ -733,6 +1671,69 @@ class ObjectStore(StorableMixin):
 
         return obj
 
+    def load_many(self, idxs, batch_size=None):
+        """
+        Returns several objects from the storage.
+
+        Objects not in the cache are fetched with a single query per batch
+        instead of one query per object.
+
+        Parameters
+        ----------
+        idxs : list of int
+            the integer indices of the objects to be loaded
+        batch_size : int or None
+            the maximal number of documents requested per query. If None the
+            `default_store_chunk_size` is used
+
+        Returns
+        -------
+        list of :py:class:`mongodb.base.StorableMixin`
+            the loaded objects in the order of `idxs`. Indices that do not
+            exist in the DB are skipped
+
+        """
+        if batch_size is None:
+            batch_size = self.default_store_chunk_size
+
+        idxs = list(idxs)
+
+        # keep strong references here, the cache might not hold them
+        loaded = {}
+        for idx in idxs:
+            try:
+                loaded[idx] = self.cache[idx]
+            except KeyError:
+                pass
+
+        missing = [idx for idx in idxs if idx not in loaded]
+
+        for pos in range(0, len(missing), batch_size):
+            batch = missing[pos:pos + batch_size]
+
+            logger.debug(
+                'Calling load_many of type `%s` for %d objects' %
+                (self.content_class.__name__, len(batch)))
+
+            docs = self._load_batch(batch)
+
+            with self.simplifier.prefetching(docs.values()):
+                for idx in batch:
+                    if idx in loaded or idx not in docs:
+                        continue
+
+                    # a previous object in the batch might have loaded this
+                    # one already as a reference
+                    try:
+                        obj = self.cache[idx]
+                    except KeyError:
+                        obj = self._build(docs[idx])
+                        self.cache[idx] = obj
+
+                    self.index.append(idx)
+                    loaded[idx] = obj
+
+        return [loaded[idx] for idx in idxs if idx in loaded]
 
     @staticmethod
     def reference(obj):
@@ -862,6 +1863,104 @@ class ObjectStore(StorableMixin):
             # self._get_id(idx, obj)
 
             self.cache[idx] = obj
-            self.index[obj.__uuid__] = idx
+            self.index.append(obj.__uuid__)
 
             return obj
+
+
+class BulkSave(object):
+    """
+    Collects the documents of new objects to insert them store by store
+
+    While active (see :meth:`MongoDBStorage.bulk_save`) objects are marked as
+    saved in their store index and simplified as usual, but the documents are
+    only inserted on :meth:`commit` with one ordered `insert_many` per store.
+    Stores are written in the order they were first used. Since referenced
+    objects are simplified before the referencing ones, these are usually
+    in the DB first.
+
+    Objects are only attached to their store on commit, so sync variables
+    set in between change the object alone. Their values are copied into
+    the documents right before the insert.
+    """
+
+    def __init__(self):
+        self._pending = OrderedDict()
+
+    def __len__(self):
+        return sum(len(docs) for objs, docs in self._pending.values())
+
+    def add(self, store, objs, docs):
+        """
+        Add simplified objects to be inserted into a store
+
+        Parameters
+        ----------
+        store : :class:`ObjectStore`
+            the target store
+        objs : list of :class:`mongodb.base.StorableMixin`
+            the objects, already marked in the store index
+        docs : list of dict
+            the documents to be inserted
+
+        """
+        pending_objs, pending_docs = self._pending.setdefault(
+            store, ([], []))
+        pending_objs.extend(objs)
+        pending_docs.extend(docs)
+
+    def commit(self):
+        """
+        Insert all pending documents
+
+        If an insert fails the index marks of all objects that were not
+        inserted are removed and the error is raised.
+
+        Returns
+        -------
+        int
+            the number of inserted documents
+
+        """
+        pending = list(self._pending.items())
+        self._pending = OrderedDict()
+
+        count = 0
+        for pos, (store, (objs, docs)) in enumerate(pending):
+            try:
+                simplifier = store.storage.simplifier
+                for obj, doc in zip(objs, docs):
+                    doc.update(simplifier.search_fields(obj))
+
+                store._document.insert_many(docs, ordered=True)
+
+            except BulkWriteError as e:
+                # an ordered insert stops at the first error
+                inserted = e.details.get('nInserted', 0)
+                store._set_saved(objs[:inserted], docs[:inserted])
+                store._set_unsaved(objs[inserted:])
+                self._rollback(pending[pos + 1:])
+                raise
+
+            except Exception:
+                self._rollback(pending[pos:])
+                raise
+
+            store._set_saved(objs, docs)
+            count += len(objs)
+
+        return count
+
+    def rollback(self):
+        """
+        Forget all pending documents and remove their index marks
+
+        """
+        pending = list(self._pending.items())
+        self._pending = OrderedDict()
+        self._rollback(pending)
+
+    @staticmethod
+    def _rollback(pending):
+        for store, (objs, docs) in pending:
+            store._set_unsaved(objs)
@@ -27,7 +27,6 @@
 from __future__ import absolute_import
 
 
-import functools
 import weakref
 
 
@@ -110,16 +109,60 @@ class LoaderProxy(object):
                     self._idx)
 
 
+class FieldLoaderProxy(object):
+    """
+    A placeholder for a large attribute that was not loaded with its object
+
+    Stores leave out the fields listed in `_lazy_fields` of a class when
+    loading an object and put a proxy in their place. The field is loaded
+    from the DB when it is first accessed, see :class:`DelayedLoader`.
+    """
+    __slots__ = ['_store', '_idx', '_field']
+
+    def __init__(self, store, idx, field):
+        self._store = store
+        self._idx = idx
+        self._field = field
+
+    def __repr__(self):
+        return '%s(%s.%s)' % (
+            self.__class__.__name__, self._store.name, self._field)
+
+    def _load_(self):
+        """
+        Load the field from the store
+        """
+        return self._store.load_field(self._idx, self._field)
+
+
+def resolve_field(value):
+    """
+    Return the loaded value if `value` is a :class:`FieldLoaderProxy`
+
+    """
+    if isinstance(value, FieldLoaderProxy):
+        return value._load_()
+
+    return value
+
+
 class DelayedLoader(object):
     """
     Descriptor class to handle proxy objects in attributes
 
-    If a proxy is stored in an attribute then the full object will be returned
+    If a proxy is stored in an attribute then the full object will be returned.
+    A :class:`FieldLoaderProxy` is replaced by the loaded value on first access
     """
     def __get__(self, instance, owner):
         if instance is not None:
-            obj = instance._lazy[self]
-            if hasattr(obj, '_idx'):
+            lazy = instance.__dict__.setdefault('_lazy', {})
+            obj = lazy[self]
+            if isinstance(obj, FieldLoaderProxy):
+                # load once and keep the real value
+                obj = obj._load_()
+                lazy[self] = obj
+                return obj
+            elif hasattr(obj, '_idx'):
                 return obj.__subject__
             else:
                 return obj
@@ -127,7 +170,7 @@ class DelayedLoader(object):
             return self
 
     def __set__(self, instance, value):
-        instance._lazy[self] = value
+        instance.__dict__.setdefault('_lazy', {})[self] = value
 
 
 def lazy_loading_attributes(*attributes):
@@ -142,31 +185,14 @@ def lazy_loading_attributes(*attributes):
     automatically remove the real object and turn the stored object into
     a proxy
 
-    Notes
-    -----
-    This decorator will obfuscate the __init__ signature in Python 2.
-    This is fixed in Python 3.4+
+    The `__init__` of the class is not changed, so the signature used to
+    restore objects from the DB is preserved.
 
     """
     def _decorator(cls):
         for attr in attributes:
             setattr(cls, attr, DelayedLoader())
 
-        _super_init = cls.__init__
-
-        code = 'def _init(self, %s):'
-
-        source_code = '\n'.join(code)
-        from six import exec_
-        cc = compile(source_code, '<string>', 'exec')
-        exec_(cc in locals())
-
-        @functools.wraps(cls.__init__)
-        def _init(self, *args, **kwargs):
-            self._lazy = {}
-            _super_init(self, *args, **kwargs)
-
-        cls.__init__ = _init
         return cls
 
     return _decorator
@@ -27,39 +27,102 @@
 from __future__ import absolute_import
 
 
-import uuid
+import logging
+import threading
+import time
+from collections import OrderedDict
 
-from adaptivemd.mongodb.base import long_t
+from pymongo import UpdateOne
+
+from adaptivemd.mongodb.base import uuid_from_db, modified_update
 from .dictify import ObjectJSON
+from .proxy import FieldLoaderProxy
+
+logger = logging.getLogger(__name__)
 
 
 class SyncVariable(object):
-    def __init__(self, name, fix_fnc=None):
+    def __init__(self, name, fix_fnc=None, buffered=True):
+        """
+        Parameters
+        ----------
+        name : str
+            the name of the attribute in the DB document
+        fix_fnc : function or None
+            if this returns True for the current local value it is
+            considered final and never synced again
+        buffered : bool
+            if False, writes always go to the DB immediately, even if the
+            storage uses a write-behind buffer. Use this for values
+            other processes use to coordinate.
+        """
         self.name = name
         self.fix_fnc = fix_fnc
+        self.buffered = buffered
         self.key = '_' + self.name + '_'
 
     @staticmethod
     def _idx(instance):
-        return str(uuid.UUID(int=instance.__uuid__))
-
-    @staticmethod
-    def _hex(instance):
-        return hex(instance.__uuid__)
+        return instance.__uuid__
 
     def _update(self, store, idx):
         if store is not None:
-            return store._document.find_one(
-                {'_id': idx})
+            dct = None
+            snapshot = store.sync_snapshot
+            if snapshot is not None:
+                dct = snapshot.get(idx, self.name)
+
+            if dct is None:
+                # sync variables are never part of the (large) object dict
+                dct = store._document.find_one(
+                    {'_id': store.storage.db_id(idx)}, {'_dict': False})
+
+            # values not yet written to the DB are more recent
+            buffer = store.storage.write_buffer
+            if buffer is not None:
+                pending = buffer.pending(store, idx)
+                if pending:
+                    dct = dict(dct or {})
+                    dct.update(pending)
+
+            return dct
 
         return None
 
+    def _store_value(self, store, idx, value):
+        buffer = store.storage.write_buffer
+        if buffer is not None and self.buffered:
+            buffer.set(store, idx, self.name, value)
+        else:
+            if buffer is not None:
+                # this write supersedes a buffered one
+                buffer.discard(store, idx, self.name)
+
+            store._document.find_and_modify(
+                query={'_id': store.storage.db_id(idx)},
+                update=modified_update({"$set": {self.name: value}}),
+                upsert=False
+                )
+
+        snapshot = store.sync_snapshot
+        if snapshot is not None:
+            snapshot.set(idx, self.name, value)
+
+        store._notify('modified', idx, self.name, value)
+
     def read(self, instance):
         try:
-            return getattr(instance, self.key)
+            value = getattr(instance, self.key)
         except AttributeError:
             return None
 
+        if isinstance(value, FieldLoaderProxy):
+            # the initial value was not loaded with the object
+            value = value._load_()
+            self.write(instance, value)
+
+        return value
+
     def write(self, instance, v):
         setattr(instance, self.key, v)
 
@@ -89,12 +152,8 @@ class SyncVariable(object):
                 if val is not None and self.fix_fnc(val):
                     return
 
-            idx = str(uuid.UUID(int=instance.__uuid__))
-            instance.__store__._document.find_and_modify(
-                query={'_id': idx},
-                update={"$set": {self.name: value}},
-                upsert=False
-                )
+            idx = self._idx(instance)
+            self._store_value(instance.__store__, idx, value)
 
         self.write(instance, value)
 
@@ -160,8 +219,8 @@ class SyncVariable(object):
 
 
 class ObjectSyncVariable(SyncVariable):
-    def __init__(self, name, store, fix_fnc=None):
-        super(ObjectSyncVariable, self).__init__(name, fix_fnc)
+    def __init__(self, name, store, fix_fnc=None, buffered=True):
+        super(ObjectSyncVariable, self).__init__(name, fix_fnc, buffered)
         self.store = store
 
     def __get__(self, instance, owner):
@@ -183,8 +242,9 @@ class ObjectSyncVariable(SyncVariable):
                     if data is None:
                         value = None
                     else:
-                        obj_idx = long_t(data['_hex_uuid'], 16)
-                        value = getattr(instance.__store__.storage, self.store).load(obj_idx)
+                        storage = instance.__store__.storage
+                        obj_idx = storage.simplifier._reference_uuid(data)
+                        value = getattr(storage, self.store).load(obj_idx)
 
                     self.write(instance, value)
                     return value
@@ -200,29 +260,64 @@ class ObjectSyncVariable(SyncVariable):
 
             idx = self._idx(instance)
             if value is not None:
-                instance.__store__._document.find_and_modify(
-                    query={'_id': idx},
-                    update={"$set": {self.name: {
-                        '_hex_uuid': self._hex(value),
-                        '_store': self.store}}},
-                    upsert=False
-                    )
+                self._store_value(
+                    instance.__store__, idx,
+                    instance.__store__.storage.simplifier.reference(
+                        value, self.store))
             else:
-                instance.__store__._document.find_and_modify(
-                    query={'_id': idx},
-                    update={"$set": {self.name: None}},
-                    upsert=False
-                    )
+                self._store_value(instance.__store__, idx, None)
 
         self.write(instance, value)
 
+    def uuid(self, instance):
+        """
+        Return the UUID of the referenced object without loading it
+
+        Parameters
+        ----------
+        instance : :class:`mongodb.base.StorableMixin`
+            the object that holds the reference
+
+        Returns
+        -------
+        int or None
+            the UUID of the referenced object, None if there is none
+        """
+        value = getattr(instance, self.key, None)
+
+        if value is not None and not isinstance(value, FieldLoaderProxy):
+            return value.__uuid__
+
+        store = instance.__store__
+        if store is None:
+            return None
+
+        data = None
+        dct = self._update(store, self._idx(instance))
+        if dct and self.name in dct:
+            data = dct[self.name]
+
+        elif isinstance(value, FieldLoaderProxy):
+            # the initial value is only in the object dict
+            doc = store._document.find_one(
+                {'_id': store.storage.db_id(value._idx)},
+                {'_dict.' + value._field: True})
+            if doc is not None:
+                data = doc.get('_dict', {}).get(value._field)
+
+        simplifier = store.storage.simplifier
+        if isinstance(data, dict) and simplifier._is_reference(data):
+            return simplifier._reference_uuid(data)
+
+        return None
+
 
 _json_sync_simplifier = ObjectJSON()
 
 
 class JSONDataSyncVariable(SyncVariable):
-    def __init__(self, name, fix_fnc=None):
-        super(JSONDataSyncVariable, self).__init__(name, fix_fnc)
+    def __init__(self, name, fix_fnc=None, buffered=True):
+        super(JSONDataSyncVariable, self).__init__(name, fix_fnc, buffered)
 
     def __get__(self, instance, owner):
         if instance is None:
@@ -259,16 +354,277 @@ class JSONDataSyncVariable(SyncVariable):
 
             idx = self._idx(instance)
             if value is not None:
-                instance.__store__._document.find_and_modify(
-                    query={'_id': idx},
-                    update={"$set": {self.name: _json_sync_simplifier.simplify(value)}},
-                    upsert=False
-                    )
+                self._store_value(
+                    instance.__store__, idx,
+                    _json_sync_simplifier.simplify(value))
             else:
-                instance.__store__._document.find_and_modify(
-                    query={'_id': idx},
-                    update={"$set": {self.name: None}},
-                    upsert=False
-                    )
+                self._store_value(instance.__store__, idx, None)
 
         self.write(instance, value)
+
+
+def sync_variable_names(cls):
+    """
+    Return the names of all sync variables of a class and its subclasses
+
+    Parameters
+    ----------
+    cls : type
+        the storable class
+
+    Returns
+    -------
+    list of str
+        the names of the sync variables as used in the DB documents
+    """
+    names = set()
+    for klass in [cls] + cls.descendants():
+        for c in klass.__mro__:
+            for attr in vars(c).values():
+                if isinstance(attr, SyncVariable):
+                    names.add(attr.name)
+
+    return sorted(names)
+
+
+class SyncSnapshot(object):
+    """
+    A bulk read of sync variables for all documents in a store
+
+    While a snapshot is active for a store all reads of the contained sync
+    variables are served from it instead of querying each document
+    separately.
+
+    The values represent the state of the DB when the snapshot was taken or
+    last refreshed. Writes done through sync variables in this process are
+    applied to the snapshot as well, writes from other processes are only
+    visible after :meth:`refresh` or after `max_age` seconds have passed.
+    Documents created after the snapshot was taken are read from the DB.
+
+    """
+    def __init__(self, store, fields=None, query=None, max_age=None):
+        """
+        Parameters
+        ----------
+        store : :class:`ObjectStore`
+            the store to take the snapshot of
+        fields : list of str or None
+            the names of the sync variables in the snapshot. If None all
+            sync variables of the content class of the store are used
+        query : dict or None
+            a mongodb filter to restrict the snapshot to some documents
+        max_age : float or None
+            if set the snapshot is refreshed on a read after it is older than
+            the given number of seconds
+        """
+        if fields is None:
+            fields = sync_variable_names(store.content_class)
+
+        self.store = store
+        self.fields = set(fields)
+        self.query = query if query is not None else {}
+        self.max_age = max_age
+        self.time = None
+        self._docs = {}
+
+        self.refresh()
+
+    def refresh(self):
+        """
+        Reload all values of the snapshot with one query
+
+        """
+        projection = {name: True for name in self.fields}
+        projection['_id'] = True
+
+        self._docs = {
+            uuid_from_db(doc['_id']): doc
+            for doc in self.store._document.find(self.query, projection)}
+        self.time = time.time()
+
+    def get(self, idx, name):
+        """
+        Return the snapshot document for an id if it contains a variable
+
+        Parameters
+        ----------
+        idx : int
+            the object id
+        name : str
+            the name of the sync variable to be read
+
+        Returns
+        -------
+        dict or None
+            the projected document, None if it is not in the snapshot
+        """
+        if name not in self.fields:
+            return None
+
+        if self.max_age is not None and time.time() - self.time > self.max_age:
+            self.refresh()
+
+        return self._docs.get(idx)
+
+    def set(self, idx, name, value):
+        """
+        Update a value in the snapshot after it has been written to the DB
+
+        """
+        doc = self._docs.get(idx)
+        if doc is not None and name in self.fields:
+            doc[name] = value
+
+
+class WriteBuffer(object):
+    """
+    Collects sync variable writes and sends them to the DB in bulk
+
+    Repeated writes to the same attribute of a document are merged so that
+    only the last value is sent. All pending updates of a store are written
+    with a single `bulk_write` when :meth:`flush` is called or, if an
+    `interval` is set, at the latest `interval` seconds after the first
+    pending write.
+
+    """
+    def __init__(self, interval=None):
+        """
+        Parameters
+        ----------
+        interval : float or None
+            the maximal time in seconds a write is kept in the buffer. If None
+            writes are only sent on explicit :meth:`flush` calls
+        """
+        self.interval = interval
+        self._pending = OrderedDict()
+        self._lock = threading.RLock()
+        self._timer = None
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(docs) for docs in self._pending.values())
+
+    def set(self, store, idx, name, value):
+        """
+        Add a pending `$set` of a single attribute
+
+        Parameters
+        ----------
+        store : :class:`ObjectStore`
+            the store that contains the document
+        idx : int
+            the object id
+        name : str
+            the attribute name
+        value : object
+            the (simplified) value to be written
+
+        """
+        with self._lock:
+            docs = self._pending.setdefault(store, OrderedDict())
+            docs.setdefault(idx, {})[name] = value
+            self._schedule()
+
+    def discard(self, store, idx, name):
+        """
+        Forget a pending write, e.g. because it was written directly
+
+        """
+        with self._lock:
+            fields = self._pending.get(store, {}).get(idx)
+            if fields is not None:
+                fields.pop(name, None)
+
+    def pending(self, store, idx):
+        """
+        Return the pending attribute values of a document
+
+        Returns
+        -------
+        dict or None
+            a copy of the pending values or None if there are none
+        """
+        with self._lock:
+            fields = self._pending.get(store, {}).get(idx)
+            if fields:
+                return dict(fields)
+
+        return None
+
+    def flush(self, store=None):
+        """
+        Write all pending updates to the DB
+
+        Parameters
+        ----------
+        store : :class:`ObjectStore` or None
+            if given only the updates for this store are written
+
+        Returns
+        -------
+        int
+            the number of updated documents
+
+        """
+        with self._lock:
+            if store is None:
+                stores = list(self._pending)
+            elif store in self._pending:
+                stores = [store]
+            else:
+                stores = []
+
+            count = 0
+            for st in stores:
+                docs = self._pending.pop(st)
+                requests = [
+                    UpdateOne(
+                        {'_id': st.storage.db_id(idx)},
+                        modified_update({'$set': fields}))
+                    for idx, fields in docs.items() if fields]
+
+                if not requests:
+                    continue
+
+                try:
+                    st._document.bulk_write(requests, ordered=False)
+                except Exception:
+                    # keep the updates so they can be sent again
+                    # unless they have been replaced in the meantime
+                    remaining = self._pending.setdefault(st, OrderedDict())
+                    for idx, fields in docs.items():
+                        for name, value in fields.items():
+                            remaining.setdefault(idx, {}).setdefault(
+                                name, value)
+                    raise
+
+                count += len(requests)
+
+            return count
+
+    def _schedule(self):
+        if self.interval is not None and self._timer is None:
+            self._timer = threading.Timer(self.interval, self._timed_flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _timed_flush(self):
+        with self._lock:
+            self._timer = None
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error('Could not write buffered updates: %s' % e)
+                self._schedule()
+
+    def close(self):
+        """
+        Stop the timer and write all pending updates
+
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            self.flush()
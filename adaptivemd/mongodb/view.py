@@ -0,0 +1,320 @@
+##############################################################################
+# adaptiveMD: A Python Framework to Run Adaptive Molecular Dynamics (MD)
+#             Simulations on HPC Resources
+# Copyright 2017 FU Berlin and the Authors
+#
+# Authors: Jan-Hendrik Prinz
+# Contributors:
+#
+# `adaptiveMD` is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with MDTraj. If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+from __future__ import absolute_import
+
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+from .base import uuid_from_db
+from .matching import match, as_stored
+
+# `_modified` is a date set by the DB server, all dates are later
+_epoch = datetime.datetime(1970, 1, 1)
+
+
+def query_fields(query):
+    """
+    Return the top-level document fields used in a DB query
+
+    Parameters
+    ----------
+    query : dict
+        a mongodb filter
+
+    Returns
+    -------
+    set of str
+        the first part of all (dotted) field names in the query
+
+    """
+    fields = set()
+    for key, condition in query.items():
+        if key in ('$and', '$or', '$nor'):
+            for q in condition:
+                fields.update(query_fields(q))
+        elif not key.startswith('$'):
+            fields.add(key.split('.')[0])
+
+    return fields
+
+
+def latest_value(collection, field):
+    """
+    Return the largest value of a field in a collection
+
+    Parameters
+    ----------
+    collection : `pymongo.collection.Collection`
+        the collection
+    field : str
+        the name of an indexed field
+
+    Returns
+    -------
+    object or None
+        the largest value, None if no document has the field
+
+    """
+    doc = collection.find_one(
+        {field: {'$exists': True}}, {field: True}, sort=[(field, -1)])
+
+    return doc[field] if doc is not None else None
+
+
+class MaterializedView(object):
+    """
+    The ids of all objects in a store whose documents match a DB query
+
+    The ids are requested once together with the fields used in the query.
+    After that, the result is updated incrementally from the events of the
+    store in this process: saved objects, writes of sync variables and
+    removed objects. The view keeps the query fields of the documents it
+    has seen, so a write is matched without asking the DB.
+
+    On access, at most every `update_interval` seconds, the view requests
+    the documents of other processes with a `_saved` or `_modified` time
+    after the latest one it has seen. Both fields are indexed, so this does
+    not scan the collection. Objects deleted by other processes are only
+    removed by :meth:`refresh`. It is called automatically when the result
+    is older than `max_age` seconds.
+
+    """
+
+    # documents saved up to this many seconds before the latest seen save
+    # time are checked again. Covers clock differences between hosts
+    saved_slack = 10.0
+
+    # documents modified up to this many seconds before the latest seen
+    # change are checked again. Covers writes that commit after a write
+    # with a later `_modified` time was seen
+    modified_slack = 5.0
+
+    # the minimal number of seconds between two requests of changes
+    update_interval = 0.5
+
+    def __init__(self, store, query, max_age=None):
+        """
+        Parameters
+        ----------
+        store : :class:`ObjectStore`
+            the store of the objects
+        query : dict
+            the mongodb filter the documents have to match
+        max_age : float or None
+            if set the ids are requested again on access after this number
+            of seconds. If None deletions of other processes are only seen
+            after :meth:`refresh`
+        """
+        self.store = store
+        self.query = query
+        self.fields = query_fields(query)
+        self.max_age = max_age
+        self.time = None
+        self.updated = None
+
+        self._stale = False
+        self._ids = OrderedDict()
+        # the query fields of known documents
+        self._docs = {}
+        self._saved = 0.0
+        self._modified = _epoch
+        self._lock = threading.RLock()
+
+        self.refresh()
+
+    def refresh(self):
+        """
+        Request the ids of all matching documents from the DB
+
+        """
+        collection = self.store._document
+        # later changes are found by `update`
+        saved = latest_value(collection, '_saved') or 0.0
+        modified = latest_value(collection, '_modified') or _epoch
+
+        docs = self.store.find_documents(self.query, self.fields)
+
+        with self._lock:
+            self._ids = OrderedDict()
+            self._docs = {}
+            for doc in docs:
+                idx = uuid_from_db(doc['_id'])
+                self._ids[idx] = True
+                self._docs[idx] = self._known(doc)
+
+            self._saved = saved
+            self._modified = modified
+            self.time = time.time()
+            self.updated = self.time
+            self._stale = False
+
+    def update(self):
+        """
+        Apply the documents saved or changed since the last request
+
+        """
+        self.store.flush()
+        self.updated = time.time()
+        recent = [
+            {'_saved': {'$gt': self._saved - self.saved_slack}},
+            {'_modified': {'$gte': self._modified - datetime.timedelta(
+                seconds=self.modified_slack)}}]
+
+        projection = {field: True for field in self.fields}
+        projection.update({'_id': True, '_saved': True, '_modified': True})
+
+        docs = list(self.store._document.find({'$or': recent}, projection))
+
+        with self._lock:
+            for doc in docs:
+                saved = doc.get('_saved')
+                if saved is not None and saved > self._saved:
+                    self._saved = saved
+
+                modified = doc.get('_modified')
+                if modified is not None and modified > self._modified:
+                    self._modified = modified
+
+                idx = uuid_from_db(doc['_id'])
+                known = self._known(doc)
+                self._docs[idx] = known
+                self._set(idx, match(known, self.query))
+
+    def invalidate(self):
+        """
+        Request the ids again on the next access
+
+        Use this if the DB was changed by another process, e.g. from
+        :meth:`ObjectStore.watch`
+        """
+        self._stale = True
+
+    def _check_age(self):
+        now = time.time()
+        if self._stale or (self.max_age is not None and
+                           now - self.time > self.max_age):
+            self.refresh()
+        elif now - self.updated >= self.update_interval:
+            self.update()
+
+    def __len__(self):
+        self._check_age()
+        return len(self._ids)
+
+    def __contains__(self, idx):
+        self._check_age()
+        return idx in self._ids
+
+    def __iter__(self):
+        self._check_age()
+        with self._lock:
+            return iter(list(self._ids))
+
+    def _known(self, doc):
+        return {
+            key: value for key, value in doc.items() if key in self.fields}
+
+    def _set(self, idx, member):
+        with self._lock:
+            if member:
+                self._ids[idx] = True
+            else:
+                self._ids.pop(idx, None)
+
+    def saved(self, docs):
+        """
+        Add newly saved objects that match
+
+        Parameters
+        ----------
+        docs : list of dict
+            the documents that were inserted
+
+        """
+        for doc in docs:
+            # compare like documents read from the DB, e.g. binary ids as
+            # UUIDs
+            known = as_stored(self._known(doc))
+            idx = uuid_from_db(doc['_id'])
+            with self._lock:
+                self._docs[idx] = known
+                self._set(idx, match(known, self.query))
+
+    def modified(self, idx, name, value):
+        """
+        Update the membership of an object after a field was changed
+
+        The DB is only asked for documents the view has not seen yet.
+
+        Parameters
+        ----------
+        idx : int
+            the id of the changed object
+        name : str
+            the name of the changed field
+        value : object
+            the new value as stored in the DB
+
+        """
+        if name not in self.fields:
+            return
+
+        with self._lock:
+            known = self._docs.get(idx)
+
+        if known is None:
+            projection = {field: True for field in self.fields}
+            doc = self.store._document.find_one(
+                {'_id': self.store.storage.db_id(idx)}, projection)
+
+            if doc is None:
+                # not inserted yet. It is added once it is saved
+                return
+
+            buffer = self.store.storage.write_buffer
+            if buffer is not None:
+                doc.update(as_stored(buffer.pending(self.store, idx) or {}))
+
+            known = self._known(doc)
+
+        known = dict(known)
+        known.update(as_stored({name: value}))
+
+        with self._lock:
+            self._docs[idx] = known
+            self._set(idx, match(known, self.query))
+
+    def removed(self, idx):
+        """
+        Remove a deleted object
+
+        Parameters
+        ----------
+        idx : int
+            the id of the deleted object
+
+        """
+        with self._lock:
+            self._docs.pop(idx, None)
+            self._set(idx, False)
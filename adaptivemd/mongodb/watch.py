@@ -0,0 +1,274 @@
+##############################################################################
+# adaptiveMD: A Python Framework to Run Adaptive Molecular Dynamics (MD)
+#             Simulations on HPC Resources
+# Copyright 2017 FU Berlin and the Authors
+#
+# Authors: Jan-Hendrik Prinz
+# Contributors:
+#
+# `adaptiveMD` is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with MDTraj. If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+from __future__ import absolute_import
+
+import logging
+import threading
+
+from pymongo.errors import PyMongoError
+
+from .base import uuid_from_db
+from .view import query_fields, latest_value
+
+logger = logging.getLogger(__name__)
+
+_operations = {
+    'insert': 'insert',
+    'update': 'update',
+    'replace': 'update',
+    'delete': 'delete'}
+
+
+def _prefixed(query, prefix):
+    # the same filter for a sub document, e.g. `fullDocument` in changes
+    result = {}
+    for key, condition in query.items():
+        if key in ('$and', '$or', '$nor'):
+            result[key] = [_prefixed(q, prefix) for q in condition]
+        elif key.startswith('$'):
+            result[key] = condition
+        else:
+            result[prefix + key] = condition
+
+    return result
+
+
+class StoreWatch(object):
+    """
+    Calls a function for changed documents in a collection
+
+    MongoDB change streams are used if the server supports them, i.e. for
+    replica sets. Changes are then reported within milliseconds. Otherwise
+    the collection is polled every `poll_interval` seconds for documents
+    with a recent `_saved` or `_modified` time. Both fields are indexed, so
+    a poll does not scan the collection. Deletions are only reported by
+    change streams.
+
+    The function is called from a background thread with a dict that
+    contains
+
+    - `operation` : `insert`, `update` or `delete`
+    - `id` : the object id
+    - `document` : the changed document or None for deletions. When
+      polling only `_id`, `_saved`, `_modified` and the fields used in
+      the query are included
+
+    Attributes
+    ----------
+    mode : str or None
+        `stream` or `poll` once started
+
+    """
+
+    # seconds between two polls if change streams are not available
+    poll_interval = 0.5
+
+    # documents saved up to this many seconds before the last seen save
+    # time are checked again. Covers clock differences between hosts
+    saved_slack = 10.0
+
+    # seconds a read from a change stream blocks before `close` is checked
+    stream_wait = 0.5
+
+    def __init__(self, collection, query, callback, poll_interval=None):
+        """
+        Parameters
+        ----------
+        collection : `pymongo.collection.Collection`
+            the collection to be watched
+        query : dict or None
+            only changed documents that match this filter are reported
+        callback : function
+            called with a dict for each change
+        poll_interval : float or None
+            if set, replaces the default `poll_interval`
+        """
+        self.collection = collection
+        self.query = query or {}
+        self.callback = callback
+        if poll_interval is not None:
+            self.poll_interval = poll_interval
+
+        self.mode = None
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._stream = None
+
+        self._saved = 0.0
+        self._modified = None
+        self._seen = {}
+
+    def start(self):
+        """
+        Start reporting changes
+
+        Returns
+        -------
+        `StoreWatch`
+            this watch
+        """
+        try:
+            self._stream = self.collection.watch(
+                self._pipeline(),
+                full_document='updateLookup',
+                max_await_time_ms=int(self.stream_wait * 1000))
+            self.mode = 'stream'
+        except Exception as e:
+            logger.info(
+                'Change streams not available for `%s` (%s). Polling instead'
+                % (self.collection.name, e))
+            self._start_polling()
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def close(self):
+        """
+        Stop reporting changes
+        """
+        self._stop.set()
+        if self._thread is not None and \
+                self._thread is not threading.current_thread():
+            self._thread.join()
+
+    @property
+    def active(self):
+        """
+        bool : True if changes are reported
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def _pipeline(self):
+        if not self.query:
+            return []
+
+        return [{'$match': {'$or': [
+            {'operationType': 'delete'},
+            _prefixed(self.query, 'fullDocument.')]}}]
+
+    def _emit(self, operation, _id, document):
+        try:
+            self.callback({
+                'operation': operation,
+                'id': uuid_from_db(_id),
+                'document': document})
+        except Exception:
+            logger.exception(
+                'Watch callback failed for `%s`' % self.collection.name)
+
+    def _run(self):
+        if self.mode == 'stream':
+            self._run_stream()
+
+        if self.mode == 'poll':
+            self._run_polling()
+
+    def _run_stream(self):
+        try:
+            with self._stream as stream:
+                while not self._stop.is_set() and stream.alive:
+                    change = stream.try_next()
+                    operation = _operations.get(
+                        change.get('operationType')) if change else None
+
+                    if operation is not None:
+                        self._emit(
+                            operation,
+                            change['documentKey']['_id'],
+                            change.get('fullDocument'))
+
+        except PyMongoError as e:
+            if self._stop.is_set():
+                return
+
+            logger.warning(
+                'Change stream of `%s` failed (%s). Polling instead'
+                % (self.collection.name, e))
+            self._start_polling()
+
+    # polling
+
+    def _start_polling(self):
+        self._saved = latest_value(self.collection, '_saved') or 0.0
+        self._modified = latest_value(self.collection, '_modified')
+        self._seen = {}
+        # remember the recent documents without reporting them
+        self._poll(emit=False)
+        self.mode = 'poll'
+
+    def _poll_query(self):
+        recent = [{'_saved': {'$gte': self._saved - self.saved_slack}}]
+        if self._modified is None:
+            recent.append({'_modified': {'$exists': True}})
+        else:
+            recent.append({'_modified': {'$gte': self._modified}})
+
+        if self.query:
+            return {'$and': [self.query, {'$or': recent}]}
+
+        return {'$or': recent}
+
+    def _poll(self, emit=True):
+        projection = {field: True for field in query_fields(self.query)}
+        projection.update({'_id': True, '_saved': True, '_modified': True})
+
+        for doc in self.collection.find(self._poll_query(), projection):
+            idx = uuid_from_db(doc['_id'])
+            stamp = (doc.get('_saved'), doc.get('_modified'))
+            if self._seen.get(idx) == stamp:
+                continue
+
+            if idx not in self._seen and stamp[1] is None:
+                operation = 'insert'
+            else:
+                operation = 'update'
+
+            self._seen[idx] = stamp
+
+            saved, modified = stamp
+            if saved is not None and saved > self._saved:
+                self._saved = saved
+            if modified is not None and (
+                    self._modified is None or modified > self._modified):
+                self._modified = modified
+
+            if emit:
+                self._emit(operation, doc['_id'], doc)
+
+        # documents outside of both windows are not returned again
+        limit = self._saved - self.saved_slack
+        self._seen = {
+            idx: (saved, modified)
+            for idx, (saved, modified) in self._seen.items()
+            if (saved is not None and saved >= limit) or
+            (modified is not None and modified >= self._modified)}
+
+    def _run_polling(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self._poll()
+            except PyMongoError as e:
+                logger.warning(
+                    'Polling `%s` failed (%s)' % (self.collection.name, e))
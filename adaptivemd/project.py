@@ -25,6 +25,7 @@
 
 import threading
 import time
+import weakref
 import numpy as np
 import os
 import types
@@ -78,10 +79,13 @@ class Project(object):
         a set of file objects that are available in the project and are
         believed to be available within the resource as long as the project
         lives
-    trajectories : `ViewBundle`
+    trajectories : `MaterializedBundle`
         all `File` object that are of `Trajectory` type and which have a
         positive `created` attribute. This means the file was really created
-        and has not been altered yet.
+        and has not been altered yet. The set is updated from changes in
+        this process right away and from recently saved or changed files
+        in the DB at most twice a second. Deleted files are removed every
+        `view_max_age` seconds
     workers : `Bundle`
         a set of all registered `Worker` instanced in the project
     files : `Bundle`
@@ -112,6 +116,14 @@ class Project(object):
         if a worker is dead then its tasks are assigned this state. Default is
         ``created`` which means the task will be restarted by another worker.
         You can also chose ``halt`` or ``cancelled``. See `Task` for details
+    cache_budget : int or str or None
+        if set, the caches of files and tasks keep at most this many bytes
+        of objects, e.g. ``'256MB'``. Default is None which keeps all loaded
+        files and tasks in memory
+    view_max_age : float or None
+        the number of seconds after which materialized bundles like
+        `trajectories` are requested from the DB again. Only needed to see
+        objects deleted by other processes
 
     See also
     --------
@@ -119,6 +131,9 @@ class Project(object):
 
     """
 
+    cache_budget = None
+    view_max_age = 60.0
+
     @classmethod
     def set_dburl(cls, dburl):
         MongoDBStorage._db_url = dburl
@@ -265,7 +280,8 @@ class Project(object):
         self.resources = StoredBundle()
 
         self._all_trajectories = self.files.c(Trajectory)
-        self.trajectories = self._all_trajectories.v(lambda x: x.exists)
+        self.trajectories = self._all_trajectories.materialize(
+            {'created': {'$gt': 0}}, self.view_max_age)
 
         self._events = []
 
@@ -287,6 +303,14 @@ class Project(object):
         self._event_timer = None
         self._stop_event = None
 
+        # set by watches on the DB if tasks, files or models change. Each
+        # waiting thread has its own event, so none takes the wakeup of
+        # another
+        self._change_events = weakref.WeakSet()
+        self._change_local = threading.local()
+        self._change_lock = threading.Lock()
+        self._watches = []
+
         # timeout if a worker is not changing its heartbeat in the last n seconds
         self._worker_dead_time = 60
 
@@ -412,15 +436,21 @@ class Project(object):
             self.storage.data.set_caching(WeakValueCache())
             self.storage.logs.set_caching(WeakValueCache())
 
+            if self.cache_budget is not None:
+                self.storage.set_cache_budget(
+                    self.cache_budget, ['files', 'tasks'])
+
             # make sure that the file number will be new
             # TODO This may note work...
-            self.traj_name.initialize_from_files(self.trajectories)
+            with self.storage.snapshot(self.storage.files, ['created']):
+                self.traj_name.initialize_from_files(self.trajectories)
 
     def reconnect(self):
         """
         Reconnect the DB
 
         """
+        self._close_watches()
         self._open_db()
 
     def _close_db(self):
@@ -465,6 +495,7 @@ class Project(object):
 
         """
         self.stop()
+        self._close_watches()
         self._close_db()
 
     def __enter__(self):
@@ -538,7 +569,9 @@ class Project(object):
             elif isinstance(ta, Task):
                     _task.append(ta)
 
-        self.tasks.add(_task)
+        # tasks, their files and generators are inserted store by store
+        with self.storage.bulk_save():
+            self.tasks.add(_task)
 
     def new_trajectory(self, frame, length, engine=None, number=1):
         """
@@ -843,21 +876,24 @@ class Project(object):
 
             # check worker status and mark as dead if not responding for long times
             now = time.time()
-            for w in self.workers:
-                if w.state not in ['dead', 'down'] and now - w.seen > self._worker_dead_time:
-                    # make sure it will end and not finish any jobs, just in case
-                    w.command = 'kill'
+            with self.storage.snapshot(self.storage.workers, ['state', 'seen']):
+                for w in self.workers:
+                    if w.state not in ['dead', 'down'] and now - w.seen > self._worker_dead_time:
+                        # make sure it will end and not finish any jobs, just in case
+                        w.command = 'kill'
 
-                    # and mark it dead
-                    w.state = 'dead'
+                        # and mark it dead
+                        w.state = 'dead'
 
-                    # search for abandoned tasks and do something with them
-                    if self._set_task_state_from_dead_workers:
-                        for t in self.tasks:
-                            if t.worker == w and t.state in ['queued', 'running']:
-                                t.state = self._set_task_state_from_dead_workers
+                        # search for abandoned tasks and do something with them
+                        if self._set_task_state_from_dead_workers:
+                            with self.storage.snapshot(
+                                    self.storage.tasks, ['state', 'worker']):
+                                for t in self.tasks:
+                                    if t.worker == w and t.state in ['queued', 'running']:
+                                        t.state = self._set_task_state_from_dead_workers
 
-                    w.current = None
+                        w.current = None
 
     def run(self):
         """
@@ -882,9 +918,71 @@ class Project(object):
         """
         if self._event_timer:
             self._stop_event.set()
+            self._notify_change()
             self._event_timer = None
             self._stop_event = None
 
+    def _watch_changes(self):
+        if self._watches:
+            return
+
+        def changed(event):
+            self._notify_change()
+
+        # `trajectories` requests changed files by itself
+        self._watches = [
+            self.storage.tasks.watch(None, changed),
+            self.storage.files.watch(None, changed),
+            self.storage.models.watch(None, changed)]
+
+    def _change_event(self):
+        # the event of the current thread
+        event = getattr(self._change_local, 'event', None)
+        if event is None:
+            event = threading.Event()
+            self._change_local.event = event
+            with self._change_lock:
+                self._change_events.add(event)
+
+        return event
+
+    def _notify_change(self):
+        with self._change_lock:
+            events = list(self._change_events)
+
+        for event in events:
+            event.set()
+
+    def _close_watches(self):
+        for watch in self._watches:
+            watch.close()
+
+        self._watches = []
+
+    def wait_for_change(self, timeout=None):
+        """
+        Block until tasks, files or models change in the DB
+
+        Changes from all processes, e.g. workers, are noticed. See
+        :meth:`mongodb.ObjectStore.watch`
+
+        Parameters
+        ----------
+        timeout : float or None
+            the maximal number of seconds to wait
+
+        Returns
+        -------
+        bool
+            True if something changed, False if the timeout was reached
+
+        """
+        self._watch_changes()
+        event = self._change_event()
+        changed = event.wait(timeout)
+        event.clear()
+        return changed
+
     def wait_until(self, condition):
         """
         Block until the given condition evaluates to true
@@ -899,7 +997,8 @@ class Project(object):
         def check_condition(c):
             while not c():
                 self.trigger()
-                time.sleep(5.0)
+                # returns early if tasks, files or models change
+                self.wait_for_change(5.0)
 
         if not isinstance(condition, list):
             condition = [condition]
@@ -927,9 +1026,10 @@ class Project(object):
             self.tasks._set.clear_cache()
             self.tasks._set.load_indices()
 
-        for task in self.tasks:
-            if task.state not in taskstates: taskstates[task.state] = 1
-            else: taskstates[task.state] += 1
+        with self.storage.snapshot(self.storage.tasks, ['state']):
+            for task in self.tasks:
+                if task.state not in taskstates: taskstates[task.state] = 1
+                else: taskstates[task.state] += 1
 
         return taskstates
 
@@ -946,8 +1046,10 @@ class Project(object):
             self.project = project
 
         def run(self):
-            while not self.stopped.wait(5.0):
-                self.project.trigger()
+            while not self.stopped.is_set():
+                self.project.wait_for_change(5.0)
+                if not self.stopped.is_set():
+                    self.project.trigger()
 
 
 class NTrajectories(Condition):
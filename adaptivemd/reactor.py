@@ -0,0 +1,316 @@
+##############################################################################
+# adaptiveMD: A Python Framework to Run Adaptive Molecular Dynamics (MD)
+#             Simulations on HPC Resources
+# Copyright 2017 FU Berlin and the Authors
+#
+# Authors: Jan-Hendrik Prinz
+# Contributors:
+#
+# `adaptiveMD` is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with MDTraj. If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+"""
+A small event loop for the worker
+
+The worker has to react to very different things: output of running tasks,
+their exit, timers like the heartbeat and changes in the DB that are reported
+from other threads. The `Reactor` waits for all of these in a single
+`select` call instead of sleeping for a fixed interval.
+
+"""
+from __future__ import print_function, absolute_import
+
+import errno
+import heapq
+import itertools
+import os
+import select
+import signal
+import threading
+import time
+
+from fcntl import fcntl, F_GETFL, F_SETFL
+
+try:
+    import selectors
+except ImportError:
+    # python 2 only has `select`
+    selectors = None
+
+
+def _set_nonblocking(fd):
+    flags = fcntl(fd, F_GETFL)
+    fcntl(fd, F_SETFL, flags | os.O_NONBLOCK)
+
+
+class Reactor(object):
+    """
+    Wait for readable files, exiting child processes, timers and wakeups
+
+    All callbacks are run in the thread that calls :meth:`run_once`. Only
+    :meth:`wakeup` may be called from other threads or signal handlers.
+
+    The exit of a child process is noticed through a `pidfd` where the OS
+    supports it (Linux >= 5.3 and Python >= 3.9), otherwise through `SIGCHLD`
+    if the reactor was created in the main thread. In any case the processes
+    are checked whenever the reactor wakes up, e.g. when their output pipes
+    are closed.
+
+    """
+    def __init__(self):
+        self._readers = {}
+        self._processes = {}
+        self._timers = []
+        self._counter = itertools.count()
+
+        if selectors is not None:
+            self._selector = selectors.DefaultSelector()
+        else:
+            self._selector = None
+
+        # the self-pipe to wake up a waiting `select` from anywhere
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        _set_nonblocking(self._wakeup_read)
+        _set_nonblocking(self._wakeup_write)
+        self.add_reader(self._wakeup_read, self._drain_wakeup)
+
+        # signal handlers can only be set from the main thread
+        self._sigchld = None
+        if not hasattr(os, 'pidfd_open') and \
+                isinstance(threading.current_thread(), threading._MainThread):
+            self._sigchld = signal.signal(
+                signal.SIGCHLD, lambda sig, frame: self.wakeup())
+            # restart interrupted system calls, e.g. reads in `communicate`
+            signal.siginterrupt(signal.SIGCHLD, False)
+
+    def wakeup(self):
+        """
+        Make a running or the next :meth:`run_once` return immediately
+
+        Safe to call from other threads and signal handlers.
+        """
+        try:
+            os.write(self._wakeup_write, b'x')
+        except OSError:
+            # the pipe is full, so a wakeup is pending anyway, or closed
+            pass
+
+    def _drain_wakeup(self, fd):
+        try:
+            while os.read(fd, 4096):
+                pass
+        except OSError:
+            pass
+
+    def add_reader(self, fd, callback):
+        """
+        Call a function when a file descriptor is readable
+
+        Parameters
+        ----------
+        fd : int
+            the file descriptor
+        callback : function
+            called as `callback(fd)`. It should read all data available and
+            call :meth:`remove_reader` once the file is closed
+
+        """
+        self._readers[fd] = callback
+        if self._selector is not None:
+            self._selector.register(fd, selectors.EVENT_READ)
+
+    def remove_reader(self, fd):
+        """
+        Stop watching a file descriptor
+
+        Parameters
+        ----------
+        fd : int
+            the file descriptor
+
+        """
+        if self._readers.pop(fd, None) is not None and \
+                self._selector is not None:
+            self._selector.unregister(fd)
+
+    def add_process(self, process, callback=None):
+        """
+        Wake up and call a function once when a child process exits
+
+        The process is reaped, so its `returncode` is set.
+
+        Parameters
+        ----------
+        process : `subprocess.Popen`
+            the child process
+        callback : function or None
+            called as `callback(process)`
+
+        """
+        pidfd = None
+        if hasattr(os, 'pidfd_open'):
+            try:
+                pidfd = os.pidfd_open(process.pid)
+            except OSError:
+                # the kernel does not support it
+                pass
+
+        self._processes[process.pid] = (process, callback, pidfd)
+        if pidfd is not None:
+            self.add_reader(pidfd, lambda fd: self._exited(process.pid))
+
+    def remove_process(self, process):
+        """
+        Stop watching a child process
+
+        Parameters
+        ----------
+        process : `subprocess.Popen`
+            the child process
+
+        """
+        _, _, pidfd = self._processes.pop(process.pid, (None, None, None))
+        if pidfd is not None:
+            self.remove_reader(pidfd)
+            os.close(pidfd)
+
+    def _exited(self, pid):
+        process, callback, _ = self._processes[pid]
+        self.remove_process(process)
+        process.poll()
+        if callback is not None:
+            callback(process)
+
+    def call_later(self, delay, callback, interval=None):
+        """
+        Call a function after some time
+
+        Parameters
+        ----------
+        delay : float
+            the time in seconds until the first call
+        callback : function
+            called without arguments
+        interval : float or None
+            if set the function is called again every `interval` seconds
+
+        """
+        heapq.heappush(
+            self._timers,
+            (time.time() + delay, next(self._counter), callback, interval))
+
+    def call_every(self, interval, callback):
+        """
+        Call a function in regular intervals
+
+        Parameters
+        ----------
+        interval : float
+            the time in seconds between calls
+        callback : function
+            called without arguments
+
+        """
+        self.call_later(interval, callback, interval)
+
+    def _select(self, timeout):
+        if self._selector is not None:
+            return [key.fd for key, _ in self._selector.select(timeout)]
+
+        try:
+            fds, _, _ = select.select(list(self._readers), [], [], timeout)
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            fds = []
+
+        return fds
+
+    def run_once(self, timeout=None):
+        """
+        Wait for the next events and run their callbacks
+
+        Parameters
+        ----------
+        timeout : float or None
+            the maximal time to wait in seconds. The time until the next
+            timer is due is used if it is shorter. None waits until an
+            event happens
+
+        """
+        if self._timers:
+            due = max(0., self._timers[0][0] - time.time())
+            timeout = due if timeout is None else min(timeout, due)
+
+        for fd in self._select(timeout):
+            callback = self._readers.get(fd)
+            if callback is not None:
+                callback(fd)
+
+        # processes without a pidfd are checked on every wakeup
+        for pid, (process, _, pidfd) in list(self._processes.items()):
+            if pidfd is None and process.poll() is not None:
+                self._exited(pid)
+
+        now = time.time()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, callback, interval = heapq.heappop(self._timers)
+            if interval is not None:
+                self.call_later(interval, callback, interval)
+            callback()
+
+    def run_until(self, predicate, timeout):
+        """
+        Run until a condition is met or the time is up
+
+        Parameters
+        ----------
+        predicate : function
+            called without arguments after each round of events
+        timeout : float
+            the maximal time to run in seconds
+
+        Returns
+        -------
+        bool
+            the last result of `predicate`
+
+        """
+        deadline = time.time() + timeout
+        while not predicate():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+
+            self.run_once(remaining)
+
+        return True
+
+    def close(self):
+        """
+        Release the pipes and file descriptors of the reactor
+
+        """
+        for process, _, _ in list(self._processes.values()):
+            self.remove_process(process)
+
+        if self._sigchld is not None:
+            signal.signal(signal.SIGCHLD, self._sigchld)
+            self._sigchld = None
+
+        self.remove_reader(self._wakeup_read)
+        os.close(self._wakeup_read)
+        os.close(self._wakeup_write)
+
+        if self._selector is not None:
+            self._selector.close()
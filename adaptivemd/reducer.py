@@ -248,7 +248,8 @@ class WorkerParser(ActionParser):
     A parser that can interprete transactions from/to ``file://`` for workers
 
     This will write the files to the target location instead of a real
-    transaction. It requires the file to be stored in the DB using ``load()``
+    transaction. It requires the file to be stored in the DB using ``load()``.
+    If the scheduler has a `StagingCache` the file is linked from there.
 
     """
     def parse(self, scheduler, action):
@@ -262,6 +263,10 @@ class WorkerParser(ActionParser):
             tp = scheduler.replace_prefix(target.url)
 
             if source.drive == 'file' and target.drive != 'file':
+                cache = getattr(scheduler, 'staging_cache', None)
+                if cache is not None and cache.stage(source, tp):
+                    return ['# link file `%s` from the staging cache' % tp]
+
                 if source.has_file:
                     with open(tp, 'w') as f:
                         f.write(source.get_file())
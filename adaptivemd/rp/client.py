@@ -4,6 +4,7 @@ from database import Database
 from resource_manager import ResourceManager
 from task_manager import TaskManager
 from multiprocessing import Process, Event, Manager
+import threading
 from utils import *
 from time import sleep
 from exceptions import *
@@ -136,6 +137,8 @@ class Client(object):
 
         """
 
+        watch = None
+
         try:
 
             self._db = Database(self._dburl, self._project)
@@ -157,6 +160,10 @@ class Client(object):
                                          cb_buffer=cb_buffer,
                                          )#scheduler='continuous')#'hombre')#scheduler)
 
+                # wake up as soon as new tasks are created
+                wakeup = threading.Event()
+                watch = self._db.watch_tasks(lambda event: wakeup.set())
+
                 while not self._terminate.is_set():
 
                     task_descs = self._db.get_task_descriptions()
@@ -168,7 +175,8 @@ class Client(object):
                         self._tmgr.run_cuds(cuds)
 
                     else:
-                        sleep(3)
+                        wakeup.wait(3)
+                        wakeup.clear()
 
 
             else:
@@ -182,6 +190,9 @@ class Client(object):
 
         finally:
 
+            if watch:
+                watch.close()
+
             if self._tmgr:
                 #print("CANCELLING TMGR checker")
                 self._tmgr.stop_checker()
@@ -1,7 +1,11 @@
 import time
-from pymongo import MongoClient
+from adaptivemd.mongodb.base import modified_update
+from adaptivemd.mongodb.clients import get_client
+from adaptivemd.mongodb.watch import StoreWatch
 from pprint import pprint
-from utils import hex_to_id, resolve_location
+import uuid
+from bson.binary import Binary, UUID_SUBTYPE
+from utils import ref_to_id, is_reference, resolve_location
 from datetime import datetime
 # Task Status: created, running, fail, halted, success, cancelled
 
@@ -37,9 +41,29 @@ class Database():
         self.configuration_collection = 'configurations'
         self.file_collection = 'files'
         self.generator_collection = 'generators'
-        self.client = MongoClient(self.url)
+        # shared with all other DB users of this process
+        self.client = get_client(self.url)
         self.db = self.client[self.store_name]
 
+        # projects store ids as UUID strings or as binary UUIDs
+        stored = self.db['stores'].find_one({}, {'_id': True})
+        self.binary_ids = stored is not None and \
+            isinstance(stored['_id'], (Binary, uuid.UUID))
+
+    def db_id(self, id):
+        """Convert a UUID string, e.g. a unit name, to a document ID
+        :Parameters:
+            - `id`: UUID string
+        """
+        if self.binary_ids and isinstance(id, basestring) \
+                and not isinstance(id, Binary):
+            try:
+                return Binary(uuid.UUID(id).bytes, UUID_SUBTYPE)
+            except ValueError:
+                # not an id, so nothing will match
+                pass
+        return id
+
     def get_task_descriptions(self, state='created'):
         """Returns a list of task definitions from Mongo.
         Returns an empty list if none is found"""
@@ -54,6 +78,13 @@ class Database():
             task_descriptions.append(task)
         return task_descriptions
 
+    def watch_tasks(self, callback, state='created'):
+        """Calls callback from a background thread whenever a task
+        reaches the given state. Returns the started watch, close it
+        when done"""
+        col = self.db[self.tasks_collection]
+        return StoreWatch(col, {'state': state}, callback).start()
+
     def get_resource_requirements(self):
         """Get a list resources
         """
@@ -83,20 +114,19 @@ class Database():
         if id:
             task_col = self.db[self.tasks_collection]
             file_col = self.db[self.file_collection]
-            task = task_col.find_one({'_id': id})
+            task = task_col.find_one({'_id': self.db_id(id)})
             if task:
                 for directive in task['_dict']['_main'] + task['_dict'].get('post', []):
                     if (isinstance(directive, dict)):
                         if (str(directive.get('_cls', '')).lower() == 'move'):
-                            if '_hex_uuid' in directive['_dict']['target'] \
-                            and '_store' in directive['_dict']['target']:
-                                file_id = hex_to_id(
-                                    directive['_dict']['target']['_hex_uuid'])
+                            if is_reference(directive['_dict']['target']):
+                                file_id = ref_to_id(
+                                    directive['_dict']['target'])
                                 timestamp = time.mktime(datetime.now().timetuple())
-                                result = file_col.update_one({'_id': file_id},
-                                                             {'$set': {
+                                result = file_col.update_one({'_id': self.db_id(file_id)},
+                                                             modified_update({'$set': {
                                                                  'created': timestamp
-                                                             }})
+                                                             }}))
                                 if (udpated is False) and (result.modified_count == 1):
                                     udpated = True
         return udpated
@@ -111,19 +141,19 @@ class Database():
             task_col = self.db[self.tasks_collection]
             file_col = self.db[self.file_collection]
             task = task_col.find_one(
-                {'_id': id, '_cls': 'TrajectoryExtensionTask'})
+                {'_id': self.db_id(id), '_cls': 'TrajectoryExtensionTask'})
             if task:
                 for directive in task['_dict']['_main']:
                     if isinstance(directive, dict):
                         if str(directive.get('_cls', '')).lower() == 'link':
-                            if directive.get('_dict', dict).get('source', dict).get('_hex_uuid', None) is not None:
-                                file_id = hex_to_id(
-                                    directive['_dict']['source']['_hex_uuid'])
+                            if is_reference(directive.get('_dict', dict()).get('source', dict())):
+                                file_id = ref_to_id(
+                                    directive['_dict']['source'])
                                 timestamp = time.mktime(datetime.now().timetuple())
-                                result = file_col.update_one({'_id': file_id},
-                                                             {'$set': {
+                                result = file_col.update_one({'_id': self.db_id(file_id)},
+                                                             modified_update({'$set': {
                                                                  'created': (timestamp * -1)
-                                                             }})
+                                                             }}))
                                 if result.modified_count == 1:
                                     udpated = True
         return udpated
@@ -136,7 +166,7 @@ class Database():
         location = None
         if id:
             col = self.db[self.file_collection]
-            result = col.find_one({'_id': id})
+            result = col.find_one({'_id': self.db_id(id)})
             if result:
                 location = result['_dict']['location']
 
@@ -152,7 +182,7 @@ class Database():
                 if staging['_cls'] == 'Transfer':
                     if staging['_dict']['source']['_store'] == 'files':
                         file = self.get_file_destination(
-                            hex_to_id(staging['_dict']['source']['_hex_uuid']))
+                            ref_to_id(staging['_dict']['source']))
                         if file:
                             shared_files.add(file)
         return list(shared_files)
@@ -164,7 +194,7 @@ class Database():
         """
         generator_files = list()
         col = self.db[self.generator_collection]
-        generator = col.find_one({'_id': id})
+        generator = col.find_one({'_id': self.db_id(id)})
         if generator:
             for key, val in generator['_dict']['types'].iteritems():
                 generator_files.append(val['_dict']['filename'])
@@ -185,8 +215,8 @@ class Database():
                 updates.update(newfields)
             col = self.db[self.tasks_collection]
             # Updates both places where the 'state' value is on
-            result = col.update_one({'_id': id},
-                                    {'$set': updates}
+            result = col.update_one({'_id': self.db_id(id)},
+                                    modified_update({'$set': updates})
                                    )
             if result.modified_count == 1:
                 return True
@@ -5,6 +5,7 @@ from utils import create_cud_from_task_def
 import time
 
 from database import Database
+from adaptivemd.mongodb.base import modified_update
 
 from pprint import pformat, pprint
 
@@ -168,8 +169,8 @@ class TaskManager(object):
         self._running_tasks.extend([cu.uid for cu in cus])
 
         [self._db_obj.db[self._db_obj.tasks_collection].update_one(
-                                    {"_id": cu.name},
-                                    {"$set": {"cuid": cu.uid}}
+                                    {"_id": self._db_obj.db_id(cu.name)},
+                                    modified_update({"$set": {"cuid": cu.uid}})
                                    )
         for cu in cus]
 
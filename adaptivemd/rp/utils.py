@@ -1,4 +1,5 @@
 import uuid
+from bson.binary import Binary
 from pprint import pprint
 import radical.pilot as rp
 import os
@@ -115,7 +116,7 @@ def get_output_staging(task_desc, task_details, db, shared_path, project, contin
             # Get source files
             src_location, is_traj = get_file_location(entity['_dict']['source'], db, shared_path, project)
             if is_traj: # is a trajectory, we need to do something extra
-                hex_id_input = hex_to_id(hex_uuid=task_desc['_dict']['generator']['_hex_uuid'])
+                hex_id_input = ref_to_id(task_desc['_dict']['generator'])
                 traj_files = db.get_source_files(hex_id_input)
                 traj_files.append('restart.npz') # hard-code that we also need restart.npz
             
@@ -167,7 +168,7 @@ def get_file_location(file_entity, db, shared_path, project):
     # it is NOT an entity with '_cls' assume it is something we need to get
     # from the files
     if file_entity.get('_cls', None) is None:
-        hex_id_output = hex_to_id(hex_uuid = file_entity['_hex_uuid'])
+        hex_id_output = ref_to_id(file_entity)
         output_loc = db.get_file_destination(hex_id_output)
         output_loc = resolve_pathholders(output_loc, shared_path, project)
 
@@ -262,7 +263,7 @@ def create_cud_from_task_def(task_descs, db, shared_path, project):
 def generate_pythontask_cud(task_desc, db, shared_path, project):
     # Compute Unit Description
     cud = rp.ComputeUnitDescription()
-    cud.name = task_desc['_id']
+    cud.name = id_to_name(task_desc['_id'])
 
     # Get each component of the task
     pre_task_details  = task_desc['_dict'].get('pre', list())
@@ -343,7 +344,7 @@ def describe_compute_setup(cud, task_desc):
 def generate_trajectorygenerationtask_cud(task_desc, db, shared_path, project):
     # Compute Unit Description
     cud = rp.ComputeUnitDescription()
-    cud.name = task_desc['_id']
+    cud.name = id_to_name(task_desc['_id'])
 
     # Get each component of the task
     pre_task_details  = task_desc['_dict'].get('pre', list())
@@ -490,6 +491,37 @@ def hex_to_id(hex_uuid=None):
     return the_id
 
 
+def is_reference(entity):
+    """Check if a dict is a reference to a stored object
+    :Parameters:
+    - `entity`: the dict to be tested
+    """
+    return '_store' in entity and (
+        '_hex_uuid' in entity or '_bin_uuid' in entity)
+
+
+def ref_to_id(ref):
+    """Return the ID of the object a reference points to
+    :Parameters:
+    - `ref`: reference dict with `_hex_uuid` or binary `_bin_uuid`
+    """
+    if '_bin_uuid' in ref:
+        return id_to_name(ref['_bin_uuid'])
+    return hex_to_id(ref.get('_hex_uuid'))
+
+
+def id_to_name(the_id):
+    """Return the UUID string of a document ID
+    :Parameters:
+    - `the_id`: UUID string or binary UUID
+    """
+    if isinstance(the_id, uuid.UUID):
+        return str(the_id)
+    elif isinstance(the_id, Binary):
+        return str(uuid.UUID(bytes=bytes(the_id)))
+    return the_id
+
+
 def get_environment_from_task(task):
     environment = dict()
     task_environment = task['_dict'].get('_environment', dict())
@@ -532,7 +564,7 @@ def generate_pythontask_input(db, shared_path, task, project):
                 continue
             if cmd['_cls'] == 'Transfer':
                 location = db.get_file_destination(
-                    id=hex_to_id(cmd['_dict']['source']['_hex_uuid']))
+                    id=ref_to_id(cmd['_dict']['source']))
                 if location:
                     temp_src = resolve_pathholders(location, shared_path, project)
                 temp_target = cmd['_dict']['target']['_dict']['location']
@@ -549,7 +581,7 @@ def generate_pythontask_input(db, shared_path, task, project):
             elif key == 'trajectories':
                 for traj in val:
                     location = db.get_file_destination(
-                        id=hex_to_id(traj['_hex_uuid']))
+                        id=ref_to_id(traj))
                     if location:
                         temp.setdefault(
                             'kwargs', dict()).setdefault(
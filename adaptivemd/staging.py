@@ -0,0 +1,349 @@
+##############################################################################
+# adaptiveMD: A Python Framework to Run Adaptive Molecular Dynamics (MD)
+#             Simulations on HPC Resources
+# Copyright 2017 FU Berlin and the Authors
+#
+# Authors: Jan-Hendrik Prinz
+# Contributors:
+#
+# `adaptiveMD` is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with MDTraj. If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+"""
+A cache for file contents from the DB on the node of a worker
+
+Tasks often get the same files from the DB, like the system and integrator
+of an engine. Instead of writing the content into every worker directory it
+is written once into the cache and the tasks get a link to it.
+
+"""
+from __future__ import absolute_import
+
+import errno
+import getpass
+import hashlib
+import os
+import shutil
+import stat
+import tempfile
+
+from six import text_type
+
+
+def default_cache_path():
+    """
+    Return the default location of the cache in the local temp folder
+
+    Returns
+    -------
+    str
+        the path, shared by all workers of the user on this node
+
+    """
+    return os.path.join(
+        tempfile.gettempdir(), 'adaptivemd-cache-%s' % getpass.getuser())
+
+
+class StagingCache(object):
+    """
+    A content addressed store of files shared by the workers on one node
+
+    Each content is stored once under its SHA1 hash in ``objects/``. The
+    stored files are read-only and tasks get a hard link to them, or a
+    copy if the cache is on another filesystem than the task.
+    Contents from the DB are also found by the UUID of their stored
+    `DataDict`, so a cached file is not loaded from the DB again. These are
+    symbolic links in ``uuids/``.
+
+    If the cache grows beyond its size limit the least recently used
+    contents are removed. Tasks keep their links to removed contents.
+
+    Attributes
+    ----------
+    hits : int
+        number of files linked from the cache
+    misses : int
+        number of files that had to be added to the cache
+    evictions : int
+        number of contents removed to keep the size limit
+
+    """
+    def __init__(self, path=None, max_size=None):
+        """
+        Parameters
+        ----------
+        path : str or None
+            the folder of the cache. If None the `default_cache_path` is used
+        max_size : int or None
+            the maximal size of all contents in bytes. If None there is no
+            limit
+        """
+        if path is None:
+            path = default_cache_path()
+
+        self.path = os.path.abspath(os.path.expandvars(path))
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        for folder in [self.objects_path, self.uuids_path]:
+            try:
+                os.makedirs(folder)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    @property
+    def objects_path(self):
+        return os.path.join(self.path, 'objects')
+
+    @property
+    def uuids_path(self):
+        return os.path.join(self.path, 'uuids')
+
+    def _uuid_link(self, uuid):
+        return os.path.join(self.uuids_path, hex(uuid).rstrip('L'))
+
+    def get(self, uuid):
+        """
+        Return the cached content of a stored `DataDict`
+
+        Parameters
+        ----------
+        uuid : int
+            the UUID of the `DataDict`
+
+        Returns
+        -------
+        str or None
+            the path to the cached file, None if it is not cached
+
+        """
+        try:
+            digest = os.readlink(self._uuid_link(uuid))
+        except OSError:
+            return None
+
+        path = os.path.join(self.objects_path, os.path.basename(digest))
+        try:
+            # mark as recently used
+            os.utime(path, None)
+        except OSError:
+            # the content has been evicted
+            return None
+
+        return path
+
+    def put(self, content, uuid=None):
+        """
+        Add a content to the cache
+
+        Parameters
+        ----------
+        content : str or bytes
+            the file content. Text is stored UTF-8 encoded
+        uuid : int or None
+            if given the UUID of the `DataDict` the content is stored in. It
+            can then be found using `get`
+
+        Returns
+        -------
+        str
+            the path to the cached file
+
+        """
+        if isinstance(content, text_type):
+            content = content.encode('utf-8')
+
+        digest = hashlib.sha1(content).hexdigest()
+        path = os.path.join(self.objects_path, digest)
+
+        if os.path.exists(path):
+            os.utime(path, None)
+        else:
+            # write aside and rename, so other workers never see a partial
+            # file
+            fd, tmp = tempfile.mkstemp(dir=self.objects_path, prefix='.')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(content)
+
+                os.chmod(tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                os.rename(tmp, path)
+            except BaseException:
+                os.remove(tmp)
+                raise
+
+        if uuid is not None:
+            link = self._uuid_link(uuid)
+            tmp = '%s.%d' % (link, os.getpid())
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+
+            os.symlink(os.path.join('..', 'objects', digest), tmp)
+            os.rename(tmp, link)
+
+        self.evict(keep=path)
+
+        return path
+
+    @staticmethod
+    def link(path, target):
+        """
+        Link a cached file to a target location
+
+        A hard link is used if possible and a copy otherwise, e.g. if the
+        target is on another filesystem. A symbolic link would break once
+        the content is evicted. An existing file at the target is replaced.
+
+        Parameters
+        ----------
+        path : str
+            the path to the cached file
+        target : str
+            the path to the link to be created
+
+        Returns
+        -------
+        str
+            the kind of link, either `hard` or `copy`
+
+        """
+        if os.path.lexists(target):
+            os.remove(target)
+
+        try:
+            os.link(path, target)
+            return 'hard'
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                raise
+
+        shutil.copy(path, target)
+        return 'copy'
+
+    def stage(self, source, target):
+        """
+        Link the content of a `File` from the DB to a target location
+
+        Parameters
+        ----------
+        source : `File`
+            the file with the content stored in the DB
+        target : str
+            the path of the file to be created
+
+        Returns
+        -------
+        bool
+            True if the file was created, False if the source has no content
+
+        """
+        uuid = source.content_uuid
+        path = self.get(uuid) if uuid is not None else None
+
+        if path is not None:
+            try:
+                self.link(path, target)
+                self.hits += 1
+                return True
+            except (IOError, OSError) as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                # evicted by another worker in the meantime
+
+        if not source.has_file:
+            return False
+
+        self.link(self.put(source.get_file(), uuid), target)
+        self.misses += 1
+        return True
+
+    def _objects(self):
+        objects = []
+        for name in os.listdir(self.objects_path):
+            if name.startswith('.'):
+                continue
+
+            path = os.path.join(self.objects_path, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                # removed by another worker
+                continue
+
+            objects.append((st.st_mtime, st.st_size, path))
+
+        return objects
+
+    @property
+    def size(self):
+        """
+        int : the size of all cached contents in bytes
+        """
+        return sum(size for _, size, _ in self._objects())
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used contents beyond the size limit
+
+        Parameters
+        ----------
+        keep : str or None
+            the path of a content that is never removed
+
+        """
+        if self.max_size is None:
+            return
+
+        objects = sorted(self._objects())
+        size = sum(s for _, s, _ in objects)
+        if size <= self.max_size:
+            return
+
+        for _, s, path in objects:
+            if size <= self.max_size:
+                break
+
+            if path == keep:
+                continue
+
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except OSError:
+                # removed by another worker
+                pass
+
+            size -= s
+
+        # forget the uuids of removed contents
+        for name in os.listdir(self.uuids_path):
+            link = os.path.join(self.uuids_path, name)
+            if not os.path.exists(link):
+                try:
+                    os.remove(link)
+                except OSError:
+                    pass
+
+    def to_dict(self):
+        return {
+            'path': self.path,
+            'max_size': self.max_size,
+            'size': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
@@ -29,12 +29,33 @@ import uuid
 
 from .file import File, JSONFile, FileTransaction
 from .util import get_function_source
-from .mongodb import StorableMixin, SyncVariable, ObjectSyncVariable
+from .mongodb import StorableMixin, SyncVariable, ObjectSyncVariable, \
+    modified_update
 
 import logging
 logger = logging.getLogger(__name__)
 
 
+class TaskStateSyncVariable(SyncVariable):
+    """
+    The state of a task that also updates tasks depending on it
+
+    Once a task is successful its id is removed from the `waiting_on` list
+    of all stored tasks so that these can be selected on the DB side.
+    """
+    def _store_value(self, store, idx, value):
+        super(TaskStateSyncVariable, self)._store_value(store, idx, value)
+
+        if value == 'success':
+            # other buffered writes of the task, like its output, have to be
+            # visible before dependent tasks are run
+            store.flush()
+            _id = store.storage.db_id(idx)
+            store._document.update_many(
+                {'waiting_on': _id},
+                modified_update({'$pull': {'waiting_on': _id}}))
+
+
 class BaseTask(StorableMixin):
     _copy_attributes = [
         '_main', '_add_paths', '_environment'
@@ -196,9 +217,16 @@ class Task(BaseTask):
         ]
 
     _find_by = ['state', 'worker', 'stderr', 'stdout']
-
-    state = SyncVariable('state', lambda x: x in ['success', 'cancelled'])
-    worker = ObjectSyncVariable('worker', 'workers')
+    _query_by = ['waiting_on']
+    # set by the radical.pilot task manager
+    _index_by = ['cuid']
+    # references to the log entries
+    _no_index = ['stderr', 'stdout']
+
+    # other processes claim tasks by these, so they are never buffered
+    state = TaskStateSyncVariable(
+        'state', lambda x: x in ['success', 'cancelled'], buffered=False)
+    worker = ObjectSyncVariable('worker', 'workers', buffered=False)
     stdout = ObjectSyncVariable('stdout', 'logs', lambda x: x is not None)
     stderr = ObjectSyncVariable('stderr', 'logs', lambda x: x is not None)
 
@@ -294,6 +322,115 @@ class Task(BaseTask):
 
         return True
 
+    @property
+    def waiting_on(self):
+        """
+        Return the DB ids of dependencies that have not succeeded yet
+
+        Stored with the task so that tasks with unfinished dependencies can be
+        excluded on the DB side. See :meth:`claim_query`
+
+        Returns
+        -------
+        list of `uuid.UUID`
+            the ids of unfinished dependency tasks. These are stored in the
+            same format as the document `_id`
+        """
+        dependencies = self.dependencies
+        if not dependencies:
+            return []
+
+        return [
+            uuid.UUID(int=d.__uuid__) for d in dependencies
+            if d.state != 'success']
+
+    @staticmethod
+    def claim_query(generators=None, resource_name=None):
+        """
+        Return a DB filter for tasks that can be claimed for execution
+
+        The filter only selects tasks whose dependencies are known to be
+        successful. Tasks stored by older versions do not know their
+        dependencies and are always selected, so the final decision should
+        still use :attr:`ready`.
+
+        Parameters
+        ----------
+        generators : list of stored `TaskGenerator` or None
+            if given, only tasks created by one of these generators are
+            selected
+        resource_name : str or None
+            if given, only tasks without a resource or with this resource
+            are selected
+
+        Returns
+        -------
+        dict
+            the mongodb filter
+
+        """
+        query = {'$and': [{'$or': [
+            {'waiting_on': {'$size': 0}},
+            {'waiting_on': {'$exists': False}}]}]}
+
+        if generators:
+            simplifier = generators[0].__store__.storage.simplifier
+            query.update(
+                simplifier.reference_filter('_dict.generator', generators))
+        elif generators is not None:
+            # an empty list matches no task
+            query['_dict.generator'] = {'$in': []}
+
+        if resource_name is not None:
+            query['$and'].append({'$or': [
+                {'_dict.resource_name': None},
+                {'_dict.resource_name': resource_name}]})
+
+        return query
+
+    @staticmethod
+    def update_waiting(store):
+        """
+        Remove successful dependencies from `waiting_on` of stored tasks
+
+        Dependencies are removed automatically when their state changes to
+        `success`. This repairs tasks that were stored while a dependency
+        finished at the same time.
+
+        Parameters
+        ----------
+        store : `ObjectStore`
+            the task store
+
+        Returns
+        -------
+        int
+            the number of updated tasks
+
+        """
+        collection = store._document
+        waiting = set()
+        for doc in collection.find(
+                {'state': 'created', 'waiting_on.0': {'$exists': True}},
+                {'waiting_on': True}):
+            waiting.update(doc['waiting_on'])
+
+        if not waiting:
+            return 0
+
+        done = [
+            doc['_id'] for doc in collection.find(
+                {'_id': {'$in': list(waiting)}, 'state': 'success'},
+                {'_id': True})]
+
+        if not done:
+            return 0
+
+        return collection.update_many(
+            {'waiting_on': {'$in': done}},
+            modified_update(
+                {'$pull': {'waiting_on': {'$in': done}}})).modified_count
+
     @property
     def ready(self):
         """
@@ -1156,9 +1293,9 @@ class PythonTask(PrePostTask):
         self.post.append(File('output.json').copy(target))
 
     def set_output_stored(self, project, is_stored):
-        my_id = str(uuid.UUID(int=self.__uuid__))
+        my_id = project.storage.db_id(self.__uuid__)
         project.storage.tasks._document.update_one({"_id": my_id},
-            {"$set": {"_dict.output_stored": is_stored}})
+            modified_update({"$set": {"_dict.output_stored": is_stored}}))
 
    ### @property
    ### def output_stored(self):
@@ -0,0 +1,49 @@
+import json
+import unittest
+
+from adaptivemd.benchmark import run_benchmarks, compare, benchmarks
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_run(self):
+        report = run_benchmarks(
+            [20], sample=5, workers=2, claims=6, batch_size=10)
+
+        # the report can be stored and read again
+        report = json.loads(json.dumps(report))
+        self.assertEqual(report['meta']['backend'], 'sqlite')
+
+        names = set(record['benchmark'] for record in report['results'])
+        for name in ['save_bulk', 'load_one', 'iterate_tasks', 'syncvar_get',
+                     'simplify', 'build', 'filestore_put', 'claim']:
+            self.assertIn(name, names)
+
+        bulk = next(record for record in report['results']
+                    if record['benchmark'] == 'save_bulk')
+        self.assertEqual(bulk['ops'], 20)
+        self.assertEqual(bulk['scale'], 20)
+
+        claims = [record for record in report['results']
+                  if record['benchmark'] == 'claim']
+        self.assertEqual([record['ops'] for record in claims], [6, 6, 6])
+
+        self.assertEqual(compare(report, report), [])
+
+    def test_compare(self):
+        def report(us):
+            return {'results': [{
+                'benchmark': 'load_one', 'scale': 10, 'us_per_op': us}]}
+
+        self.assertEqual(compare(report(110.), report(100.)), [])
+        slower = compare(report(150.), report(100.))
+        self.assertEqual(len(slower), 1)
+        self.assertAlmostEqual(slower[0]['ratio'], 1.5)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            run_benchmarks([10], include=benchmarks + ['unknown'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import shutil
+import tempfile
+import unittest
+
+from adaptivemd import Project, Task
+from adaptivemd.mongodb import MongoDBStorage
+
+
+class TestBulkSave(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.url = MongoDBStorage._db_url
+        MongoDBStorage.set_location('sqlite://' + self.path)
+
+        self.project = Project('test-bulk')
+        self.project.initialize()
+        self.storage = self.project.storage
+
+    def tearDown(self):
+        self.project.close()
+        Project.delete('test-bulk')
+        MongoDBStorage.set_location(self.url)
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def document(self, task):
+        return self.storage.tasks._document.find_one(
+            {'_id': self.storage.db_id(task.__uuid__)})
+
+    def test_commit(self):
+        task = Task()
+        with self.storage.bulk_save():
+            self.project.tasks.add(task)
+            task.state = 'cancelled'
+            self.assertIsNone(self.document(task))
+
+        self.assertIs(task.__store__, self.storage.tasks)
+        self.assertEqual(self.document(task)['state'], 'cancelled')
+        self.assertEqual(task.state, 'cancelled')
+
+    def test_rollback(self):
+        task = Task()
+        with self.assertRaises(ValueError):
+            with self.storage.bulk_save():
+                self.project.tasks.add(task)
+                self.assertIn(task.__uuid__, self.storage.tasks.index)
+                raise ValueError()
+
+        self.assertNotIn(task.__uuid__, self.storage.tasks.index)
+        self.assertIsNone(self.document(task))
+        self.assertIsNone(self.storage.bulk)
+
+        # the object can be saved again
+        self.project.tasks.add(task)
+        self.assertEqual(self.document(task)['state'], 'created')
+
+    def test_nested(self):
+        tasks = [Task(), Task()]
+        with self.storage.bulk_save() as outer:
+            self.project.tasks.add(tasks[0])
+            with self.storage.bulk_save() as inner:
+                self.assertIs(inner, outer)
+                self.project.tasks.add(tasks[1])
+
+            self.assertEqual(len(outer), 2)
+            self.assertIsNone(self.document(tasks[1]))
+
+        self.assertEqual(
+            [self.document(t)['_id'] for t in tasks],
+            [self.storage.db_id(t.__uuid__) for t in tasks])
+
+
+if __name__ == '__main__':
+    unittest.main()
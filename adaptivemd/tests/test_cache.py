@@ -0,0 +1,55 @@
+import unittest
+
+from adaptivemd.mongodb import ByteLRUCache, MaxCache, parse_bytes
+
+
+class Item(object):
+    pass
+
+
+class TestCacheStats(unittest.TestCase):
+
+    def test_max_cache(self):
+        cache = MaxCache()
+        cache[1] = Item()
+        cache[1]
+        self.assertRaises(KeyError, cache.__getitem__, 2)
+        self.assertEqual(
+            cache.stats, {'hits': 1, 'misses': 1, 'evictions': 0})
+
+
+class TestByteLRUCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ByteLRUCache(100)
+        self.items = [Item() for _ in range(3)]
+        for key, item in enumerate(self.items):
+            self.cache.__setitem__(key, item, size=40)
+
+    def test_budget(self):
+        self.assertEqual(self.cache.nbytes, 80)
+        self.assertEqual(self.cache.count, (2, 1))
+        self.assertEqual(self.cache.evictions, 1)
+
+        # weakly kept objects are still found and count again
+        self.assertIs(self.cache[0], self.items[0])
+        self.assertEqual(self.cache.nbytes, 80)
+        self.assertNotIn(1, self.cache._cache)
+
+    def test_release(self):
+        del self.items[0]
+        self.assertRaises(KeyError, self.cache.__getitem__, 0)
+        self.assertEqual(self.cache.misses, 1)
+
+        del self.cache[2]
+        self.assertEqual(self.cache.nbytes, 40)
+        self.assertEqual(self.cache.stats['max_bytes'], 100)
+
+    def test_parse_bytes(self):
+        self.assertEqual(parse_bytes('64MB'), 64 * 1024 ** 2)
+        self.assertEqual(parse_bytes('1.5kb'), 1536)
+        self.assertEqual(parse_bytes(10), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
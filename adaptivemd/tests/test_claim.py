@@ -0,0 +1,181 @@
+import shutil
+import tempfile
+import threading
+import unittest
+
+from adaptivemd import Project, Task, TaskGenerator, Worker
+from adaptivemd.mongodb import MongoDBStorage
+
+
+class ClaimTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.url = MongoDBStorage._db_url
+        MongoDBStorage.set_location('sqlite://' + self.path)
+
+        self.project = Project('test-claim')
+        self.project.initialize()
+        self.store = self.project.storage.tasks
+
+    def tearDown(self):
+        self.project.close()
+        Project.delete('test-claim')
+        MongoDBStorage.set_location(self.url)
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def document(self, task):
+        return self.store._document.find_one(
+            {'_id': self.project.storage.db_id(task.__uuid__)})
+
+
+class TestClaimMany(ClaimTestCase):
+
+    def setUp(self):
+        super(TestClaimMany, self).setUp()
+        self.tasks = [Task() for _ in range(8)]
+        self.project.queue(self.tasks)
+
+    def claim(self, store, n, test_fnc=None, fields=None):
+        return store.claim_many(
+            {}, 'state', 'created', 'queued', n, test_fnc, fields=fields)
+
+    def test_order(self):
+        claimed = self.claim(self.store, 3)
+        self.assertEqual(claimed, self.tasks[:3])
+        self.assertEqual(
+            [self.document(t)['state'] for t in self.tasks[:4]],
+            ['queued', 'queued', 'queued', 'created'])
+
+    def test_concurrent_claims_do_not_overlap(self):
+        others = [Project('test-claim') for _ in range(3)]
+        results = []
+
+        def claim(project):
+            results.append(set(
+                t.__uuid__ for t in self.claim(project.storage.tasks, 3)))
+
+        threads = [
+            threading.Thread(target=claim, args=(p,)) for p in others]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sum(len(r) for r in results), 8)
+        self.assertEqual(set.union(*results),
+                         set(t.__uuid__ for t in self.tasks))
+
+        for project in others:
+            project.close()
+
+    def test_rejected_are_given_back(self):
+        worker = Worker()
+        self.project.workers.add(worker)
+        reference = self.project.storage.simplifier.reference(
+            worker, 'workers')
+
+        rejected = set(t.__uuid__ for t in self.tasks[1:3])
+        claimed = self.claim(
+            self.store, 3, lambda t: t.__uuid__ not in rejected,
+            {'worker': reference})
+
+        self.assertEqual(claimed, [self.tasks[0]] + self.tasks[3:5])
+        for task in self.tasks[1:3]:
+            doc = self.document(task)
+            self.assertEqual(doc['state'], 'created')
+            self.assertIsNone(doc['worker'])
+
+        self.assertIsNotNone(self.document(self.tasks[0])['worker'])
+
+    def test_stops_after_rejected_batch(self):
+        collection = self.store._document
+        update_many = collection.update_many
+        writes = []
+
+        def counted(*args, **kwargs):
+            writes.append(args)
+            return update_many(*args, **kwargs)
+
+        collection.update_many = counted
+        self.assertEqual(self.claim(self.store, 2, lambda t: False), [])
+        # one claim and one release
+        self.assertEqual(len(writes), 2)
+        self.assertEqual(
+            len(self.project.tasks.m('state', 'created')), 8)
+
+    def test_release_only_claimed(self):
+        claimed = self.claim(self.store, 2)
+        self.store._document.update_one(
+            {'_id': self.project.storage.db_id(claimed[0].__uuid__)},
+            {'$set': {'state': 'running'}})
+
+        self.store.release_many(
+            [t.__uuid__ for t in claimed], 'state', 'queued', 'created')
+
+        self.assertEqual(self.document(claimed[0])['state'], 'running')
+        self.assertEqual(self.document(claimed[1])['state'], 'created')
+
+
+class TestClaimOne(ClaimTestCase):
+
+    def claim(self, query=None, test_fnc=None):
+        if query is None:
+            query = Task.claim_query()
+
+        return self.store.claim_one(
+            query, 'state', 'created', 'queued', test_fnc)
+
+    def test_rejected_is_put_back(self):
+        tasks = [Task(), Task()]
+        self.project.queue(tasks)
+
+        self.assertEqual(
+            self.claim(test_fnc=lambda t: t != tasks[0]), tasks[1])
+        self.assertEqual(self.document(tasks[0])['state'], 'created')
+        self.assertIsNone(self.claim(test_fnc=lambda t: False))
+        self.assertEqual(self.claim(), tasks[0])
+
+    def test_dependencies(self):
+        first, second = Task(), Task()
+        second.dependencies = [first]
+        self.project.queue([first, second])
+
+        self.assertEqual(self.claim(), first)
+        self.assertIsNone(self.claim())
+
+        first.state = 'success'
+        self.assertEqual(self.document(second)['waiting_on'], [])
+        self.assertEqual(self.claim(), second)
+
+    def test_update_waiting(self):
+        first, second = Task(), Task()
+        second.dependencies = [first]
+        self.project.queue([first, second])
+
+        # finished without removing it from `waiting_on`
+        self.store._document.update_one(
+            {'_id': self.project.storage.db_id(first.__uuid__)},
+            {'$set': {'state': 'success'}})
+        self.assertIsNone(self.claim())
+
+        self.assertEqual(Task.update_waiting(self.store), 1)
+        self.assertEqual(self.claim(), second)
+        self.assertEqual(Task.update_waiting(self.store), 0)
+
+    def test_generators(self):
+        generators = [TaskGenerator(), TaskGenerator()]
+        self.project.generators.add(generators)
+        tasks = [Task(generators[0]), Task(generators[1]), Task()]
+        self.project.queue(tasks)
+
+        self.assertIsNone(self.claim(Task.claim_query([])))
+        query = Task.claim_query(generators[1:])
+        self.assertEqual(self.claim(query), tasks[1])
+        self.assertIsNone(self.claim(query))
+        self.assertEqual(self.claim(Task.claim_query(generators)), tasks[0])
+        self.assertEqual(self.claim(), tasks[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+
+from adaptivemd.mongodb import clients, get_client, close_clients
+
+
+class TestClientRegistry(unittest.TestCase):
+
+    url = 'mongodb://localhost:27017/'
+
+    def tearDown(self):
+        close_clients()
+
+    def test_shared(self):
+        self.assertIs(get_client(self.url), get_client(self.url))
+        self.assertIs(get_client('sqlite://'), get_client('sqlite://'))
+
+    def test_options(self):
+        pooled = get_client(self.url, maxPoolSize=5)
+        self.assertIs(pooled, get_client(self.url, maxPoolSize=5))
+        self.assertIsNot(pooled, get_client(self.url))
+
+    def test_fork(self):
+        client = get_client(self.url)
+        clients._pid = -1
+        self.assertIsNot(client, get_client(self.url))
+        client.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import shutil
+import tempfile
+import unittest
+
+from adaptivemd import Project, Task
+from adaptivemd.mongodb import MongoDBStorage
+
+
+class TestCount(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.url = MongoDBStorage._db_url
+        MongoDBStorage.set_location('sqlite://' + self.path)
+
+        self.project = Project('test-count')
+        self.project.initialize()
+        self.project.tasks.add([Task() for _ in range(3)])
+        self.store = self.project.storage.tasks
+        self.other = Project('test-count')
+
+        collection = self.store._document
+        estimated = collection.estimated_document_count
+        self.counts = []
+        collection.estimated_document_count = lambda: \
+            self.counts.append(True) or estimated()
+
+    def tearDown(self):
+        self.other.close()
+        self.project.close()
+        Project.delete('test-count')
+        MongoDBStorage.set_location(self.url)
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def in_db(self):
+        return self.store._document.count_documents({})
+
+    def test_own_saves(self):
+        n = len(self.store)
+        self.assertEqual(n, self.in_db())
+
+        self.project.tasks.add([Task(), Task()])
+        self.assertEqual(len(self.store), n + 2)
+        self.assertEqual(len(self.counts), 1)
+
+    def test_stale_estimate_recovers(self):
+        n = len(self.store)
+        self.other.tasks.add(Task())
+        self.assertEqual(len(self.store), n)
+
+        # the estimate is older than `count_staleness`
+        self.store._count_time -= self.store.count_staleness + 1.0
+        self.assertEqual(len(self.store), n + 1)
+        self.assertEqual(len(self.counts), 2)
+
+    def test_exact(self):
+        len(self.store)
+        self.other.tasks.add(Task())
+
+        n = self.in_db()
+        self.assertEqual(self.store.count(exact=True), n)
+
+        # the exact count is used as the new estimate
+        del self.counts[:]
+        self.assertEqual(len(self.store), n)
+        self.assertEqual(self.counts, [])
+
+    def test_no_staleness(self):
+        self.store.count_staleness = 0
+        len(self.store)
+        self.other.tasks.add(Task())
+        self.assertEqual(len(self.store), self.in_db())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+import base64
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from adaptivemd import Project, Task
+from adaptivemd.mongodb import MongoDBStorage, ObjectJSON, StorableMixin
+
+
+class PlanExample(StorableMixin):
+    _excluded_attr = ['cache']
+
+    def __init__(self, value, other=None):
+        super(PlanExample, self).__init__()
+        self.value = value
+        self.other = other
+        self.cache = 'not stored'
+        self._private = 'not stored'
+
+
+class TestArrayEncoding(unittest.TestCase):
+
+    def setUp(self):
+        self.simplifier = ObjectJSON()
+        self.array = np.arange(3000, dtype=np.float32).reshape(100, 30)
+
+    def test_binary(self):
+        simple = self.simplifier.simplify(self.array[:, ::3])
+        self.assertIn('_bytes', simple)
+
+        built = self.simplifier.build(simple)
+        self.assertTrue(np.all(built == self.array[:, ::3]))
+        self.assertFalse(built.flags.writeable)
+
+    def test_compressed_json(self):
+        self.simplifier.array_compression = 'zlib'
+        self.simplifier.array_compression_min_size = 0
+
+        json_string = self.simplifier.to_json({'x': self.array})
+        built = self.simplifier.from_json(json_string)['x']
+        self.assertTrue(np.all(built == self.array))
+        self.assertEqual(built.dtype, self.array.dtype)
+
+    def test_legacy_base64(self):
+        legacy = {
+            '_numpy': {'_tuple': [2, 3]},
+            '_dtype': 'int64',
+            '_data': base64.b64encode(
+                np.arange(6, dtype=np.int64).copy(order='C'))
+        }
+        built = self.simplifier.build(legacy)
+        self.assertTrue(np.all(built == np.arange(6).reshape(2, 3)))
+
+
+class TestClassPlans(unittest.TestCase):
+
+    def setUp(self):
+        self.simplifier = ObjectJSON()
+        self.obj = PlanExample(1, PlanExample((2, 3)))
+        self.obj.extra = [4.5, {'x': None}]
+
+    def test_same_as_generic(self):
+        generic = ObjectJSON()
+        generic.use_plans = False
+
+        simple = self.simplifier.simplify(self.obj)
+        self.assertEqual(simple, generic.simplify(self.obj))
+        self.assertNotIn('cache', simple['_dict'])
+        self.assertNotIn('_private', simple['_dict'])
+
+        built = self.simplifier.build(simple)
+        self.assertEqual(built.__uuid__, self.obj.__uuid__)
+        self.assertEqual(built.value, 1)
+        self.assertEqual(built.other.value, (2, 3))
+        self.assertEqual(built.extra, [4.5, {'x': None}])
+        self.assertEqual(
+            generic.simplify(generic.build(simple)), simple)
+
+    def test_cached(self):
+        plan = self.simplifier.plan(PlanExample)
+        self.assertIs(plan, self.simplifier.plan(PlanExample))
+        self.assertEqual(PlanExample.args(), ['value', 'other'])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestPrefetch(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.url = MongoDBStorage._db_url
+        MongoDBStorage.set_location('sqlite://' + self.path)
+
+        self.project = Project('test-prefetch')
+        self.project.initialize()
+
+        # a chain of dependencies
+        self.tasks = [Task()]
+        for _ in range(3):
+            task = Task()
+            task.dependencies = [self.tasks[-1]]
+            self.tasks.append(task)
+
+        self.project.tasks.add(self.tasks)
+
+        # a new project has empty caches
+        self.other = Project('test-prefetch')
+        self.store = self.other.storage.tasks
+        self.simplifier = self.other.storage.simplifier
+        self.batches = []
+        self.lookups = []
+
+        load_batch = self.store._load_batch
+        self.store._load_batch = lambda idxs: \
+            self.batches.append(len(idxs)) or load_batch(idxs)
+
+        collection = self.store._document
+        find_one = collection.find_one
+        collection.find_one = lambda *args, **kwargs: \
+            self.lookups.append(args) or find_one(*args, **kwargs)
+
+    def tearDown(self):
+        self.other.close()
+        self.project.close()
+        Project.delete('test-prefetch')
+        MongoDBStorage.set_location(self.url)
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def load(self):
+        task = self.store.load(self.tasks[-1].__uuid__)
+        chain = [task]
+        while chain[-1].dependencies:
+            chain.append(chain[-1].dependencies[0])
+
+        self.assertEqual(chain, self.tasks[::-1])
+
+    def test_depth(self):
+        self.load()
+        self.assertEqual(self.batches, [1, 1, 1])
+        self.assertEqual(len(self.lookups), 1)
+
+    def test_limited_depth(self):
+        doc = self.store._document.find_one(
+            {'_id': self.other.storage.db_id(self.tasks[-1].__uuid__)})
+
+        for depth in [1, 2, 4]:
+            self.simplifier.prefetch_depth = depth
+            with self.simplifier.prefetching([doc]):
+                self.assertEqual(
+                    set(self.simplifier._prefetched['tasks']),
+                    set(t.__uuid__ for t in self.tasks[-2:-2 - depth:-1]))
+
+    def test_disabled(self):
+        self.simplifier.prefetch_depth = 0
+        self.load()
+        self.assertEqual(self.batches, [])
+        self.assertEqual(len(self.lookups), 4)
+
+    def test_cleanup(self):
+        doc = self.store._document.find_one(
+            {'_id': self.other.storage.db_id(self.tasks[-1].__uuid__)})
+        others = []
+
+        def other_thread():
+            others.append(dict(self.simplifier._prefetched))
+
+        with self.assertRaises(ValueError):
+            with self.simplifier.prefetching([doc]):
+                self.assertEqual(
+                    len(self.simplifier._prefetched['tasks']), 3)
+                thread = threading.Thread(target=other_thread)
+                thread.start()
+                thread.join()
+                raise ValueError()
+
+        self.assertEqual(others, [{}])
+        self.assertEqual(self.simplifier._prefetched, {})
+        self.assertEqual(self.simplifier._local.level, 0)
+        self.assertIsNone(
+            self.simplifier.pop_prefetched('tasks', self.tasks[0].__uuid__))
@@ -0,0 +1,174 @@
+import datetime
+import shutil
+import tempfile
+import unittest
+
+from pymongo import UpdateOne
+
+from adaptivemd.mongodb import SQLiteClient, SQLiteGridFS, StoreWatch
+from adaptivemd.mongodb.matching import match
+
+
+class TestMatch(unittest.TestCase):
+
+    def test_operators(self):
+        doc = {'state': 'created', 'waiting_on': [], 'n': 5,
+               '_dict': {'generator': {'_hex_uuid': '0x1'}}}
+
+        self.assertTrue(match(doc, {'state': 'created'}))
+        self.assertTrue(match(doc, {'n': {'$gte': 5, '$lt': 6}}))
+        self.assertTrue(match(doc, {'waiting_on': {'$size': 0}}))
+        self.assertTrue(match(doc, {'_dict.generator._hex_uuid': {
+            '$in': ['0x1', '0x2']}}))
+        self.assertTrue(match(doc, {'missing': None}))
+        self.assertFalse(match(doc, {'waiting_on.0': {'$exists': True}}))
+        self.assertTrue(match(doc, {'$or': [{'n': 4}, {'state': 'created'}]}))
+        self.assertFalse(match(doc, {'state': {'$nin': ['created']}}))
+
+    def test_arrays(self):
+        doc = {'tags': ['a', 'b']}
+        self.assertTrue(match(doc, {'tags': 'a'}))
+        self.assertTrue(match(doc, {'tags.1': 'b'}))
+        self.assertFalse(match(doc, {'tags': 'c'}))
+
+
+class TestSQLiteCollection(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.client = SQLiteClient('sqlite://' + self.path)
+        self.db = self.client['test']
+        self.col = self.db['tasks']
+        self.col.insert_many([
+            {'_id': str(i), 'state': 'created', '_time': i,
+             'waiting_on': ['x'] if i == 0 else []}
+            for i in range(3)])
+
+    def tearDown(self):
+        self.client.close()
+        shutil.rmtree(self.path)
+
+    def test_find(self):
+        self.assertEqual(self.col.count_documents({}), 3)
+        self.assertEqual(
+            self.col.find_one({'_id': '1'}, {'state': True}),
+            {'_id': '1', 'state': 'created'})
+        self.assertEqual(
+            [d['_id'] for d in self.col.find(
+                {'_id': {'$in': ['0', '2']}}, sort=[('_time', -1)])],
+            ['2', '0'])
+        self.assertEqual(self.col.find_one(sort=[('_time', -1)])['_id'], '2')
+
+    def test_claim(self):
+        before = self.col.find_one_and_update(
+            {'state': 'created', 'waiting_on': {'$size': 0}},
+            {'$set': {'state': 'queued'}},
+            sort=[('_time', 1)])
+        self.assertEqual(before['_id'], '1')
+        self.assertEqual(before['state'], 'created')
+        self.assertEqual(self.col.find_one({'_id': '1'})['state'], 'queued')
+
+        self.col.update_many({'waiting_on': 'x'}, {'$pull': {'waiting_on': 'x'}})
+        self.assertEqual(self.col.find_one({'_id': '0'})['waiting_on'], [])
+
+    def test_bulk_and_remove(self):
+        self.col.bulk_write([
+            UpdateOne({'_id': '0'}, {'$set': {'state': 'success'}}),
+            UpdateOne({'_id': '2'}, {'$set': {'state': 'failed'}})])
+        self.assertEqual(
+            sorted(d['state'] for d in self.col.find()),
+            ['created', 'failed', 'success'])
+
+        self.col.remove({'_id': '0'})
+        self.assertEqual(self.col.estimated_document_count(), 2)
+
+    def test_indexes(self):
+        self.col.create_index('state')
+        self.col.create_index('_time')
+        self.assertIn('state_1', self.col.index_information())
+
+        self.col.insert_many([
+            {'_id': '3', 'state': ['created'], '_time': 3.5},
+            {'_id': '4', '_time': 20}])
+        self.col.update_one({'_id': '1'}, {'$set': {'state': 'running'}})
+
+        def ids(query):
+            return [d['_id'] for d in self.col.find(query)]
+
+        self.assertEqual(ids({'state': 'created'}), ['0', '2', '3'])
+        self.assertEqual(ids({'state': {'$in': ['running', None]}}), ['1', '4'])
+        self.assertEqual(ids({'state': None}), ['4'])
+        self.assertEqual(ids({'_time': {'$gt': 1, '$lte': 3.5}}), ['2', '3'])
+        self.assertEqual(ids({'$and': [{'_time': 1.0}]}), ['1'])
+        self.assertEqual(
+            ids({'$or': [{'_time': {'$gte': 20}}, {'state': 'running'}]}),
+            ['1', '4'])
+
+        # dates are indexed in their order
+        self.col.create_index('_modified')
+        self.col.update_one({'_id': '2'}, {'$currentDate': {'_modified': True}})
+        self.assertEqual(
+            ids({'_modified': {'$gt': datetime.datetime(2000, 1, 1)}}), ['2'])
+
+        # sorted in SQL, missing values first
+        self.col.insert_one({'_id': '5', 'state': 'created'})
+        self.assertEqual(
+            [d['_id'] for d in self.col.find(
+                {'state': 'created'}, sort=[('_time', 1)], limit=2)],
+            ['5', '0'])
+        self.assertEqual(
+            [d['_id'] for d in self.col.find(sort=[('_time', -1)])],
+            ['4', '3', '2', '1', '0', '5'])
+
+        plan = self.db.execute(
+            'EXPLAIN QUERY PLAN SELECT doc FROM tasks WHERE ("k_state" = ? '
+            'OR "k_state" IS NULL)', ('created',))
+        self.assertIn('tasks.state_1', ' '.join(str(row) for row in plan))
+
+        self.col.drop_index('state_1')
+        self.assertNotIn('state_1', self.col.index_information())
+        self.assertEqual(ids({'state': 'created'}), ['0', '2', '3', '5'])
+
+    def test_indexes_from_other_clients(self):
+        other = SQLiteClient('sqlite://' + self.path)['test']['tasks']
+        other.find_one({'state': 'created'})
+        self.col.create_index('state')
+
+        # writes of the other client must update the new column
+        other.update_one({'_id': '0'}, {'$set': {'state': 'running'}})
+        self.assertEqual(
+            [d['_id'] for d in self.col.find({'state': 'running'})], ['0'])
+        other.database.close()
+
+    def test_watch(self):
+        events = []
+        watch = StoreWatch(
+            self.col, {'state': 'running'}, events.append, poll_interval=0.01)
+        watch._start_polling()
+        self.assertEqual(watch.mode, 'poll')
+
+        self.col.update_one(
+            {'_id': '1'}, {'$set': {'state': 'running'},
+                             '$currentDate': {'_modified': True}})
+        self.col.update_one(
+            {'_id': '2'}, {'$set': {'n': 1},
+                             '$currentDate': {'_modified': True}})
+        watch._poll()
+        self.assertEqual(
+            [(e['operation'], e['id']) for e in events], [('update', 1)])
+
+        watch._poll()
+        self.assertEqual(len(events), 1)
+
+    def test_gridfs(self):
+        grid = SQLiteGridFS(self.db)
+        grid.put(u'content', _id='0x1', _time=5, encoding='utf8')
+        f = grid.find_one({'_id': '0x1'})
+        self.assertEqual(f.read(), b'content')
+        self.assertEqual(f._time, 5)
+        self.assertTrue(grid.exists('0x1'))
+        self.assertEqual(self.db['fs.files'].count_documents({}), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import uuid
+
+from bson.binary import Binary
+
+from adaptivemd.mongodb import SQLiteClient, migrate_ids, uuid_from_db, \
+    uuid_to_str, uuid_to_binary
+
+
+class TestIdConversion(unittest.TestCase):
+
+    def setUp(self):
+        self.uuid = uuid.uuid1()
+        self.idx = self.uuid.int
+
+    def test_representations(self):
+        self.assertEqual(uuid_to_str(self.idx), str(self.uuid))
+        self.assertEqual(bytes(uuid_to_binary(self.idx)), self.uuid.bytes)
+
+        for value in [str(self.uuid), hex(self.idx), hex(self.idx) + 'L',
+                      uuid_to_binary(self.idx), self.uuid]:
+            self.assertEqual(uuid_from_db(value), self.idx)
+
+
+class TestMigration(unittest.TestCase):
+
+    def setUp(self):
+        self.client = SQLiteClient('sqlite://')
+        self.db = self.client['storage-ids']
+        self.task = uuid.uuid1()
+        self.file = uuid.uuid1()
+        self.db['stores'].insert_one({'_id': str(uuid.uuid1())})
+        self.db['tasks'].insert_one({
+            '_id': str(self.task),
+            '_obj_uuid': str(self.task),
+            '_cls': 'Task',
+            '_dict': {'target': {
+                '_hex_uuid': hex(self.file.int), '_store': 'files'}},
+            'waiting_on': [str(self.file)]})
+        self.db['fs.files'].insert_one({'_id': hex(self.file.int)})
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_round_trip(self):
+        migrate_ids(self.db, 'binary', batch_size=1)
+        doc = self.db['tasks'].find_one(
+            {'_id': uuid_to_binary(self.task.int)})
+        self.assertNotIn('_obj_uuid', doc)
+        self.assertEqual(doc['waiting_on'], [self.file])
+        self.assertEqual(
+            uuid_from_db(doc['_dict']['target']['_bin_uuid']), self.file.int)
+        self.assertIsNotNone(self.db['fs.files'].find_one(
+            {'_id': Binary(self.file.bytes, 4)}))
+
+        # nothing left to do
+        self.assertEqual(
+            sum(migrate_ids(self.db, 'binary').values()), 0)
+
+        migrate_ids(self.db, 'string')
+        doc = self.db['tasks'].find_one({'_id': str(self.task)})
+        self.assertEqual(doc['_obj_uuid'], str(self.task))
+        self.assertEqual(doc['_dict']['target']['_hex_uuid'], hex(self.file.int))
+        self.assertEqual(self.db['tasks'].count_documents({}), 1)
+        self.assertIsNotNone(
+            self.db['fs.files'].find_one({'_id': hex(self.file.int)}))
+
+
+if __name__ == '__main__':
+    unittest.main()
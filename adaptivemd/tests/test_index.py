@@ -0,0 +1,68 @@
+import unittest
+
+from adaptivemd import JSONFile, Worker
+from adaptivemd.mongodb import UUIDIndex, ObjectStore
+
+
+class TestUUIDIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = UUIDIndex([5, 3, 9])
+
+    def test_order_and_membership(self):
+        self.assertEqual(list(self.index), [5, 3, 9])
+        self.assertEqual(self.index[1], 3)
+        self.assertIn(9, self.index)
+        self.assertNotIn(4, self.index)
+
+    def test_no_duplicates(self):
+        self.assertFalse(self.index.append(3))
+        self.assertEqual(self.index.extend([3, 7, 7]), 1)
+        self.assertEqual(list(self.index), [5, 3, 9, 7])
+
+    def test_remove_and_truncate(self):
+        self.index.remove(3)
+        self.assertNotIn(3, self.index)
+        self.assertRaises(ValueError, self.index.remove, 3)
+
+        del self.index[1:]
+        self.assertEqual(list(self.index), [5])
+        self.assertNotIn(9, self.index)
+
+    def test_order(self):
+        self.index.append(7)
+        orders = [self.index.order(uuid) for uuid in [5, 3, 9, 7]]
+        self.assertEqual(orders, sorted(orders))
+        self.assertIsNone(self.index.order(4))
+
+        self.index.remove(3)
+        self.assertIsNone(self.index.order(3))
+        self.assertEqual(sorted(self.index, key=self.index.order), [5, 9, 7])
+
+    def test_high_water(self):
+        self.assertIsNone(self.index.high_water)
+        self.index.update_high_water(10.0)
+        self.index.update_high_water(None)
+        self.index.update_high_water(5.0)
+        self.assertEqual(self.index.high_water, 10.0)
+
+        self.index.clear()
+        self.assertEqual(len(self.index), 0)
+        self.assertIsNone(self.index.high_water)
+
+
+class TestIndexKeys(unittest.TestCase):
+
+    def test_payload_and_heartbeat_are_not_indexed(self):
+        keys = ObjectStore('files', JSONFile).index_keys()
+        self.assertIn('created', keys)
+        self.assertNotIn('_data', keys)
+
+        keys = ObjectStore('workers', Worker).index_keys()
+        self.assertIn('state', keys)
+        for key in ['seen', 'verbose', 'prefetch', 'n_tasks']:
+            self.assertNotIn(key, keys)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import shutil
+import tempfile
+import unittest
+
+from adaptivemd import Project, Task
+from adaptivemd.model import Model
+from adaptivemd.mongodb import MongoDBStorage
+from adaptivemd.mongodb.proxy import FieldLoaderProxy
+
+
+class TestLazyFields(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.url = MongoDBStorage._db_url
+        MongoDBStorage.set_location('sqlite://' + self.path)
+
+        self.project = Project('test-lazy')
+        self.project.initialize()
+        self.model = Model({'msm': [[0.9, 0.1], [0.1, 0.9]]})
+        self.task = Task()
+        self.project.models.add(self.model)
+        self.project.tasks.add(self.task)
+
+        # a new project has empty caches
+        self.other = Project('test-lazy')
+        self.queries = []
+
+    def tearDown(self):
+        self.other.close()
+        self.project.close()
+        Project.delete('test-lazy')
+        MongoDBStorage.set_location(self.url)
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def spy(self, store):
+        collection = store._document
+        find_one = collection.find_one
+
+        def logged(*args, **kwargs):
+            self.queries.append(args)
+            return find_one(*args, **kwargs)
+
+        collection.find_one = logged
+
+    def test_projection(self):
+        store = self.other.storage.models
+        self.assertEqual(store.lazy_fields(), ['data'])
+
+        self.spy(store)
+        model = store.load(self.model.__uuid__)
+        self.assertEqual(self.queries[0][1], {'_dict.data': False})
+        self.assertIsInstance(
+            list(model.__dict__['_lazy'].values())[0], FieldLoaderProxy)
+
+    def test_first_access_loads(self):
+        store = self.other.storage.models
+        model = store.load(self.model.__uuid__)
+
+        self.spy(store)
+        self.assertEqual(model.data, self.model.data)
+        self.assertEqual(model['msm'], [[0.9, 0.1], [0.1, 0.9]])
+        self.assertEqual(len(self.queries), 1)
+        self.assertEqual(self.queries[0][1], {'_dict.data': True})
+
+    def test_sync_variables_without_dict(self):
+        store = self.other.storage.tasks
+        task = store.load(self.task.__uuid__)
+
+        self.spy(store)
+        self.assertEqual(task.state, 'created')
+        self.assertIsNone(task.worker)
+        self.assertEqual(
+            [query[1] for query in self.queries], [{'_dict': False}] * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
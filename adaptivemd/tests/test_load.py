@@ -0,0 +1,95 @@
+import shutil
+import tempfile
+import unittest
+
+from adaptivemd import Project, Task
+from adaptivemd.mongodb import MongoDBStorage
+
+
+class TestLoadMany(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.url = MongoDBStorage._db_url
+        MongoDBStorage.set_location('sqlite://' + self.path)
+
+        self.project = Project('test-load')
+        self.project.initialize()
+        self.tasks = [Task() for _ in range(7)]
+        self.project.tasks.add(self.tasks)
+        self.uuids = [t.__uuid__ for t in self.tasks]
+
+        # a new project has empty caches
+        self.other = Project('test-load')
+        self.store = self.other.storage.tasks
+
+        collection = self.store._document
+        find, find_one = collection.find, collection.find_one
+        self.queries = []
+
+        def logged(fnc):
+            def query(*args, **kwargs):
+                self.queries.append(args[0])
+                return fnc(*args, **kwargs)
+
+            return query
+
+        collection.find = logged(find)
+        collection.find_one = logged(find_one)
+
+    def tearDown(self):
+        self.other.close()
+        self.project.close()
+        Project.delete('test-load')
+        MongoDBStorage.set_location(self.url)
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def requested(self):
+        return [len(query['_id']['$in']) for query in self.queries]
+
+    def test_batches_and_order(self):
+        missing = Task().__uuid__
+        idxs = self.uuids[::-1] + [missing]
+        loaded = self.store.load_many(idxs, batch_size=3)
+
+        self.assertEqual([t.__uuid__ for t in loaded], self.uuids[::-1])
+        self.assertEqual(self.requested(), [3, 3, 2])
+        self.assertNotIn(missing, self.store.index)
+
+    def test_cache_hits(self):
+        cached = self.store.load(self.uuids[2])
+        del self.queries[:]
+
+        loaded = self.store.load_many(self.uuids)
+        self.assertIs(loaded[2], cached)
+        self.assertEqual(self.requested(), [6])
+
+        self.assertEqual(self.store.load_many(self.uuids), loaded)
+        self.assertEqual(len(self.queries), 1)
+
+    def test_iter(self):
+        self.store.default_store_chunk_size = 3
+        uuids = [t.__uuid__ for t in self.store]
+
+        self.assertEqual(uuids, list(self.store.index))
+        self.assertEqual(uuids[-7:], self.uuids)
+        # one query per batch of uncached objects
+        requested = self.requested()
+        self.assertEqual(len(requested), (len(uuids) + 2) // 3)
+        self.assertLessEqual(max(requested), 3)
+
+    def test_cache_all(self):
+        self.store.cache_all()
+        self.assertEqual(len(self.queries), 1)
+
+        del self.queries[:]
+        for idx in self.uuids:
+            self.assertIn(idx, self.store.cache)
+            self.store.load(idx)
+
+        self.store.cache_all()
+        self.assertEqual(self.queries, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from adaptivemd.logentry import OutputSpool
+
+
+class TestOutputSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.spool = OutputSpool(os.path.join(self.path, 'stdout.log'))
+        self.spool.head_size = 8
+        self.spool.tail_size = 8
+
+    def tearDown(self):
+        self.spool.close()
+        shutil.rmtree(self.path)
+
+    def test_short_output_is_complete(self):
+        self.spool.write(b'hello ')
+        self.spool.write(b'world!')
+        self.assertFalse(self.spool.truncated)
+        self.assertEqual(self.spool.preview(), 'hello world!')
+
+    def test_long_output_keeps_head_and_tail(self):
+        for n in range(100):
+            self.spool.write(b'%03d,' % n)
+
+        self.spool.close()
+        self.assertTrue(self.spool.truncated)
+        self.assertEqual(self.spool.size, 400)
+
+        preview = self.spool.preview()
+        self.assertTrue(preview.startswith('000,001,'))
+        self.assertTrue(preview.endswith('098,099,'))
+        self.assertIn('384 bytes omitted', preview)
+
+        with open(self.spool.filename, 'rb') as f:
+            self.assertEqual(len(f.read()), 400)
+
+    def test_split_characters(self):
+        data = u'é'.encode('utf8') * 20
+        self.spool.write(data[:5])
+        self.spool.write(data[5:])
+        preview = self.spool.preview()
+        self.assertNotIn(u'�', preview)
+        self.assertTrue(preview.startswith(u'é' * 4))
@@ -0,0 +1,159 @@
+import shutil
+import tempfile
+import threading
+import unittest
+
+from adaptivemd import File, Trajectory, Project
+from adaptivemd.bundle import QueryBundle, StoredBundle
+from adaptivemd.mongodb import ObjectStore, MongoDBStorage
+from adaptivemd.mongodb.view import query_fields
+
+
+class TestClassFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.store = ObjectStore('files', File)
+
+    def test_subclasses(self):
+        query = self.store.class_filter(Trajectory)
+        self.assertIn('Trajectory', query['_cls']['$in'])
+        self.assertNotIn('File', query['_cls']['$in'])
+        self.assertIn('File', self.store.class_filter(File)['_cls']['$in'])
+
+    def test_not_storable(self):
+        self.assertIsNone(self.store.class_filter(str))
+
+    def test_bundle(self):
+        bundle = StoredBundle()
+        view = bundle.c(Trajectory)
+        self.assertIsInstance(view, QueryBundle)
+        self.assertEqual(len(view), 0)
+        self.assertEqual(list(view), [])
+
+
+class TestQueryFields(unittest.TestCase):
+
+    def test_nested(self):
+        query = {'$and': [
+            {'_cls': {'$in': ['Trajectory']}},
+            {'$or': [{'created': {'$gt': 0}}, {'_dict.data': None}]}]}
+        self.assertEqual(query_fields(query), {'_cls', 'created', '_dict'})
+
+
+class TestMaterializedView(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.url = MongoDBStorage._db_url
+        MongoDBStorage.set_location('sqlite://' + self.path)
+
+        self.project = Project('test-view')
+        self.project.initialize()
+        pdb = File('file:///tmp/initial.pdb')
+        self.trajectories = [
+            self.project.new_trajectory(pdb, 100) for _ in range(3)]
+        self.project.files.add(self.trajectories)
+
+    def tearDown(self):
+        self.project.close()
+        Project.delete('test-view')
+        MongoDBStorage.set_location(self.url)
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def test_local_changes(self):
+        view = self.project.trajectories
+        self.assertEqual(len(view), 0)
+
+        files = self.project.storage.files._document
+        find_one = files.find_one
+        lookups = []
+        files.find_one = lambda *args, **kwargs: \
+            lookups.append(args) or find_one(*args, **kwargs)
+
+        self.trajectories[0].created = 1.0
+        self.trajectories[2].created = 2.0
+        self.trajectories[2].created = -1.0
+        self.assertEqual(list(view), [self.trajectories[0]])
+        self.assertEqual(lookups, [])
+
+    def test_changes_of_other_clients(self):
+        view = self.project.trajectories
+        self.assertEqual(len(view), 0)
+        view.materialized.update_interval = 0.0
+
+        other = Project('test-view')
+        other.storage.files.load(self.trajectories[1].__uuid__).created = 1.0
+        self.assertIn(self.trajectories[1], view)
+        self.assertEqual(len(view), 1)
+
+        other.storage.files.load(self.trajectories[1].__uuid__).created = -1.0
+        self.assertEqual(len(view), 0)
+        other.close()
+
+    def test_changes_are_requested_once_per_interval(self):
+        view = self.project.trajectories
+        self.assertEqual(len(view), 0)
+
+        files = self.project.storage.files._document
+        find = files.find
+        queries = []
+        files.find = lambda *args, **kwargs: \
+            queries.append(args) or find(*args, **kwargs)
+
+        view.materialized.update_interval = 60.0
+        for trajectory in self.trajectories:
+            self.assertNotIn(trajectory, view)
+        self.assertEqual(queries, [])
+
+        view.materialized.update_interval = 0.0
+        self.assertEqual(len(view), 0)
+        self.assertEqual(len(queries), 1)
+
+    def test_ties_are_ordered_by_save_time(self):
+        store = self.project.storage.files
+        uuids = [t.__uuid__ for t in self.trajectories]
+        query = {'_id': {'$in': [store.storage.db_id(u) for u in uuids]}}
+
+        for saved, uuid in enumerate(uuids):
+            store._document.update_one(
+                {'_id': store.storage.db_id(uuid)},
+                {'$set': {'_time': 1, '_saved': 10.0 - saved}})
+
+        self.assertEqual(store.find_uuids(query), uuids[::-1])
+
+        # saved together, in the order of the index
+        store._document.update_many(query, {'$set': {'_saved': 1.0}})
+        self.assertEqual(store.find_uuids(query), uuids)
+
+    def test_every_waiter_is_woken(self):
+        view = self.project.trajectories
+        self.assertEqual(len(view), 0)
+        refresh = view.materialized.refresh
+        refreshed = []
+        view.materialized.refresh = lambda: \
+            refreshed.append(True) or refresh()
+
+        ready = threading.Barrier(3)
+        woken = []
+
+        def wait():
+            self.project.wait_for_change(0.0)
+            ready.wait()
+            woken.append(self.project.wait_for_change(10.0))
+
+        threads = [threading.Thread(target=wait) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+
+        ready.wait()
+        self.trajectories[0].created = 1.0
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(woken, [True, True])
+        self.assertEqual(list(view), [self.trajectories[0]])
+        self.assertEqual(refreshed, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import subprocess
+import threading
+import time
+import unittest
+
+from adaptivemd.reactor import Reactor
+
+
+class TestReactor(unittest.TestCase):
+
+    def setUp(self):
+        self.reactor = Reactor()
+
+    def tearDown(self):
+        self.reactor.close()
+
+    def test_timers(self):
+        calls = []
+        self.reactor.call_later(0.05, lambda: calls.append('once'))
+        self.reactor.call_every(0.02, lambda: calls.append('every'))
+
+        self.assertTrue(self.reactor.run_until(lambda: 'once' in calls, 5.0))
+        self.assertGreaterEqual(calls.count('every'), 2)
+        self.assertEqual(calls.count('once'), 1)
+
+    def test_wakeup_from_thread(self):
+        woken = []
+
+        def wake():
+            time.sleep(0.05)
+            woken.append(True)
+            self.reactor.wakeup()
+
+        threading.Thread(target=wake).start()
+        start = time.time()
+        self.assertTrue(self.reactor.run_until(lambda: woken, 10.0))
+        self.assertLess(time.time() - start, 5.0)
+
+    def test_reader_and_process(self):
+        process = subprocess.Popen(
+            ['/bin/sh', '-c', 'echo hello; sleep 0.1'],
+            stdout=subprocess.PIPE)
+        fd = process.stdout.fileno()
+        data = []
+        exited = []
+
+        def read(fd):
+            chunk = os.read(fd, 1024)
+            data.append(chunk)
+            if not chunk:
+                self.reactor.remove_reader(fd)
+
+        self.reactor.add_reader(fd, read)
+        self.reactor.add_process(process, exited.append)
+
+        self.assertTrue(self.reactor.run_until(lambda: exited, 10.0))
+        self.assertEqual(exited, [process])
+        self.assertEqual(process.returncode, 0)
+        self.assertIn(b'hello', b''.join(data))
+        process.stdout.close()
@@ -0,0 +1,96 @@
+import errno
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from adaptivemd.staging import StagingCache
+
+
+class Source(object):
+    def __init__(self, content, content_uuid=None):
+        self.content = content
+        self.content_uuid = content_uuid
+        self.reads = 0
+
+    @property
+    def has_file(self):
+        return self.content is not None
+
+    def get_file(self):
+        self.reads += 1
+        return self.content
+
+
+class TestStagingCache(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = StagingCache(os.path.join(self.path, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def read(self, name):
+        with open(os.path.join(self.path, name)) as f:
+            return f.read()
+
+    def test_stage_by_uuid(self):
+        source = Source(u'system\n', 123)
+        for name in ['a.xml', 'b.xml']:
+            self.assertTrue(
+                self.cache.stage(source, os.path.join(self.path, name)))
+            self.assertEqual(self.read(name), 'system\n')
+
+        self.assertEqual(source.reads, 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(
+            os.stat(os.path.join(self.path, 'b.xml')).st_nlink, 3)
+
+    def test_same_content_is_stored_once(self):
+        first = self.cache.put(b'integrator', 1)
+        second = self.cache.put(u'integrator', 2)
+        self.assertEqual(first, second)
+        self.assertEqual(self.cache.get(2), first)
+        self.assertIsNone(self.cache.get(3))
+        self.assertEqual(self.cache.size, 10)
+
+    def test_no_content(self):
+        target = os.path.join(self.path, 'missing')
+        self.assertFalse(self.cache.stage(Source(None, 5), target))
+        self.assertFalse(os.path.exists(target))
+
+    def test_least_recently_used_are_evicted(self):
+        self.cache.max_size = 20
+        old = self.cache.put(b'0123456789', 1)
+        new = self.cache.put(b'abcdefghij', 2)
+        past = time.time() - 100
+        os.utime(old, (past, past))
+        os.utime(new, (past + 50, past + 50))
+
+        self.assertEqual(self.cache.get(1), old)
+        self.cache.put(b'ABCDEFGHIJ', 3)
+
+        self.assertEqual(self.cache.evictions, 1)
+        self.assertIsNotNone(self.cache.get(1))
+        self.assertIsNone(self.cache.get(2))
+        self.assertLessEqual(self.cache.size, 20)
+
+    def test_copy_across_filesystems(self):
+        def cross_device(path, target):
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+
+        self.cache.max_size = 10
+        target = os.path.join(self.path, 'a.xml')
+        link = os.link
+        os.link = cross_device
+        try:
+            self.assertTrue(self.cache.stage(Source(b'0123456789', 1), target))
+        finally:
+            os.link = link
+
+        self.assertFalse(os.path.islink(target))
+        self.cache.put(b'abcdefghij', 2)
+        self.assertEqual(self.cache.evictions, 1)
+        self.assertEqual(self.read('a.xml'), '0123456789')
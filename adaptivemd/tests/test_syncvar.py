@@ -0,0 +1,156 @@
+import shutil
+import tempfile
+import time
+import unittest
+
+from adaptivemd import Project, Task, Worker
+from adaptivemd.mongodb import MongoDBStorage
+
+
+class SyncVariableTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.url = MongoDBStorage._db_url
+        MongoDBStorage.set_location('sqlite://' + self.path)
+
+        self.project = Project('test-syncvar')
+        self.project.initialize()
+        self.storage = self.project.storage
+
+    def tearDown(self):
+        self.project.close()
+        Project.delete('test-syncvar')
+        MongoDBStorage.set_location(self.url)
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def document(self, obj):
+        return obj.__store__._document.find_one(
+            {'_id': self.storage.db_id(obj.__uuid__)})
+
+
+class TestWriteBuffer(SyncVariableTestCase):
+
+    def setUp(self):
+        super(TestWriteBuffer, self).setUp()
+        self.worker = Worker()
+        self.task = Task()
+        self.project.workers.add(self.worker)
+        self.project.tasks.add(self.task)
+        self.storage.set_write_behind()
+        self.buffer = self.storage.write_buffer
+
+    def test_writes_are_merged(self):
+        for seen in [1.0, 2.0, 3.0]:
+            self.worker.seen = seen
+
+        self.assertEqual(len(self.buffer), 1)
+        self.assertEqual(self.worker.seen, 3.0)
+        self.assertNotEqual(self.document(self.worker).get('seen'), 3.0)
+
+        self.assertEqual(self.storage.flush(), 1)
+        self.assertEqual(self.document(self.worker)['seen'], 3.0)
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_flush_after_interval(self):
+        self.storage.set_write_behind(interval=0.05)
+        self.worker.seen = 1.0
+        self.assertNotEqual(self.document(self.worker).get('seen'), 1.0)
+
+        timeout = time.time() + 5.0
+        while self.document(self.worker).get('seen') != 1.0:
+            self.assertLess(time.time(), timeout)
+            time.sleep(0.01)
+
+        self.assertEqual(len(self.storage.write_buffer), 0)
+
+    def test_task_state_and_worker_are_not_buffered(self):
+        self.task.state = 'queued'
+        self.task.worker = self.worker
+        self.assertEqual(len(self.buffer), 0)
+
+        doc = self.document(self.task)
+        self.assertEqual(doc['state'], 'queued')
+        self.assertEqual(
+            doc['worker'],
+            self.storage.simplifier.reference(self.worker, 'workers'))
+
+    def test_direct_write_discards_buffered_one(self):
+        store = self.storage.tasks
+        self.buffer.set(store, self.task.__uuid__, 'state', 'running')
+        self.assertEqual(self.task.state, 'running')
+
+        self.task.state = 'failed'
+        self.assertIsNone(self.buffer.pending(store, self.task.__uuid__))
+        self.assertEqual(self.storage.flush(), 0)
+        self.assertEqual(self.document(self.task)['state'], 'failed')
+
+
+class TestSyncSnapshot(SyncVariableTestCase):
+
+    def setUp(self):
+        super(TestSyncSnapshot, self).setUp()
+        self.tasks = [Task(), Task()]
+        self.project.tasks.add(self.tasks)
+        self.store = self.storage.tasks
+
+        collection = self.store._document
+        find_one = collection.find_one
+        self.lookups = []
+
+        def logged(*args, **kwargs):
+            self.lookups.append(args)
+            return find_one(*args, **kwargs)
+
+        collection.find_one = logged
+
+    def change(self, task, state):
+        # a write of another process
+        self.store._document.update_one(
+            {'_id': self.storage.db_id(task.__uuid__)},
+            {'$set': {'state': state}})
+
+    def test_reads_from_snapshot(self):
+        with self.store.snapshot(['state']) as snapshot:
+            self.assertIs(self.store.sync_snapshot, snapshot)
+            self.change(self.tasks[0], 'running')
+            self.assertEqual(
+                [t.state for t in self.tasks], ['created', 'created'])
+            self.assertEqual(self.lookups, [])
+
+            snapshot.refresh()
+            self.assertEqual(self.tasks[0].state, 'running')
+
+            # not in the snapshot
+            self.assertIsNone(self.tasks[0].worker)
+            self.assertEqual(len(self.lookups), 1)
+
+        self.assertIsNone(self.store.sync_snapshot)
+
+    def test_max_age(self):
+        with self.store.snapshot(max_age=60.0) as snapshot:
+            self.change(self.tasks[0], 'running')
+            self.assertEqual(self.tasks[0].state, 'created')
+
+            snapshot.time -= 120.0
+            self.assertEqual(self.tasks[0].state, 'running')
+            self.assertEqual(self.lookups, [])
+
+    def test_own_writes(self):
+        with self.store.snapshot() as snapshot:
+            self.tasks[1].state = 'running'
+            self.assertEqual(
+                snapshot.get(self.tasks[1].__uuid__, 'state')['state'],
+                'running')
+            self.assertEqual(self.tasks[1].state, 'running')
+            self.assertEqual(self.lookups, [])
+
+            # created after the snapshot was taken
+            task = Task()
+            self.project.tasks.add(task)
+            self.assertEqual(task.state, 'created')
+            self.assertEqual(len(self.lookups), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,8 +3,10 @@ import json
 import random
 import string
 import unittest
+import uuid
 import adaptivemd.rp.utils as utils
 import radical.pilot as rp
+from bson.binary import Binary
 from adaptivemd.rp.database import Database
 
 # Configuration Variables
@@ -537,6 +539,16 @@ class TestUtils(unittest.TestCase):
         actual = "04f01b52-8c69-11e7-9eb2-00000000003a"
         self.assertEquals(hex_uuid, actual)
 
+    def test_ref_to_id(self):
+        """Test references with hex and binary ids"""
+        actual = "04f01b52-8c69-11e7-9eb2-00000000003a"
+        self.assertEquals(utils.ref_to_id({
+            '_hex_uuid': "0x4f01b528c6911e79eb200000000003aL",
+            '_store': 'files'}), actual)
+        self.assertEquals(utils.ref_to_id({
+            '_bin_uuid': Binary(uuid.UUID(actual).bytes, 4),
+            '_store': 'files'}), actual)
+
     def test_resolve_pathholders(self):
         """Test our path expander/resolver"""
         # Direct Path
@@ -0,0 +1,139 @@
+import shutil
+import tempfile
+import unittest
+
+from adaptivemd import Project, Task
+from adaptivemd.mongodb import MongoDBStorage
+from adaptivemd.mongodb.matching import match
+from adaptivemd.worker import Slots
+
+
+class Requires(object):
+    def __init__(self, cpu_threads=1, gpu_contexts=0, mpi_rank=0, memory=0):
+        self.resource_requirements = {
+            'cpu_threads': cpu_threads,
+            'gpu_contexts': gpu_contexts,
+            'mpi_rank': mpi_rank,
+            'memory': memory}
+
+
+class TestSlots(unittest.TestCase):
+
+    def setUp(self):
+        self.slots = Slots(cpus=[0, 1, 2, 3], gpus=['0', '1'], memory=1000)
+
+    def test_undeclared_runs_one_task(self):
+        slots = Slots()
+        self.assertTrue(slots.fits(Requires()))
+        slot = slots.acquire(Requires())
+        self.assertIsNone(slot.cpus)
+        self.assertIsNone(slot.environment())
+        self.assertFalse(slots.free)
+        self.assertFalse(slots.fits(Requires()))
+
+        slots.release(slot)
+        self.assertTrue(slots.free)
+
+    def test_assign_and_release(self):
+        first = self.slots.acquire(Requires(cpu_threads=2, gpu_contexts=1))
+        second = self.slots.acquire(Requires(memory=500))
+        self.assertEqual(first.cpus, [0, 1])
+        self.assertEqual(first.environment()['CUDA_VISIBLE_DEVICES'], '0')
+        self.assertEqual(second.cpus, [2])
+        self.assertEqual(second.environment()['CUDA_VISIBLE_DEVICES'], '')
+
+        self.assertTrue(self.slots.fits(Requires(gpu_contexts=1)))
+        self.assertFalse(self.slots.fits(Requires(cpu_threads=2)))
+        self.assertFalse(self.slots.fits(Requires(mpi_rank=2)))
+        self.assertFalse(self.slots.fits(Requires(memory=600)))
+
+        self.slots.release(first)
+        self.assertTrue(self.slots.fits(Requires(cpu_threads=3)))
+        third = self.slots.acquire(Requires(cpu_threads=3))
+        self.assertEqual(third.cpus, [0, 1, 3])
+        self.assertEqual(self.slots.n_used, 2)
+
+    def test_oversized_task_runs_alone(self):
+        task = Requires(cpu_threads=8, gpu_contexts=4)
+        self.assertTrue(self.slots.fits(task))
+        slot = self.slots.acquire(task)
+        self.assertEqual(slot.cpus, [0, 1, 2, 3])
+        self.assertEqual(slot.gpus, ['0', '1'])
+        self.assertFalse(self.slots.free)
+
+    def test_free_slots_count_gpus_and_memory(self):
+        self.assertEqual(self.slots.n_free, 4)
+        self.slots.acquire(Requires(gpu_contexts=1, memory=300))
+        # the smallest task seen needs a GPU and 300 MB
+        self.assertEqual(self.slots.minimal, (1, 1, 300))
+        self.assertEqual(self.slots.n_free, 1)
+
+        self.slots.acquire(Requires(gpu_contexts=1, memory=300))
+        self.assertEqual(self.slots.n_free, 0)
+        self.assertFalse(self.slots.free)
+
+    def test_claim_filter(self):
+        self.assertIsNone(self.slots.claim_filter())
+        self.slots.acquire(Requires(gpu_contexts=1, memory=300))
+        query = self.slots.claim_filter('req')
+
+        def fits(**req):
+            return match({'req': req}, query)
+
+        # 3 CPUs, 1 GPU and 700 MB are free
+        self.assertTrue(fits(cpu_threads=3, gpu_contexts=1, mpi_rank=0))
+        self.assertTrue(fits(cpu_threads=1, mpi_rank=3))
+        self.assertTrue(fits())
+        self.assertFalse(fits(cpu_threads=2, mpi_rank=2))
+        self.assertFalse(fits(cpu_threads=4))
+        self.assertFalse(fits(gpu_contexts=2))
+        self.assertFalse(fits(memory=800))
+
+
+class TestClaimFitting(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.url = MongoDBStorage._db_url
+        MongoDBStorage.set_location('sqlite://' + self.path)
+
+        self.project = Project('test-slots')
+        self.project.initialize()
+        self.project.queue([Task(gpu_contexts=1) for _ in range(20)])
+
+    def tearDown(self):
+        self.project.close()
+        Project.delete('test-slots')
+        MongoDBStorage.set_location(self.url)
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def claim(self, slots):
+        query = Task.claim_query()
+        query['$and'].append(slots.claim_filter())
+        return self.project.storage.tasks.claim_many(
+            query, 'state', 'created', 'queued', 4)
+
+    def test_busy_gpus(self):
+        slots = Slots(cpus=[0, 1, 2, 3], gpus=['0'])
+        slots.acquire(Requires(gpu_contexts=1))
+
+        collection = self.project.storage.tasks._document
+        writes = []
+        for name in ['update_one', 'update_many', 'find_one_and_update']:
+            def write(*args, **kwargs):
+                writes.append(args)
+            setattr(collection, name, write)
+
+        # GPU tasks are not claimed and given back
+        self.assertEqual(self.claim(slots), [])
+        self.assertEqual(writes, [])
+
+    def test_claims_tasks_that_fit(self):
+        slots = Slots(cpus=[0, 1, 2, 3], gpus=['0'])
+        slots.acquire(Requires(gpu_contexts=1))
+        task = Task()
+        self.project.queue(task)
+
+        self.assertEqual(self.claim(slots), [task])
+        self.assertEqual(
+            len(self.project.tasks.m('state', 'created')), 20)
@@ -43,7 +43,9 @@ The worker consists of two parts:
 from __future__ import print_function, absolute_import
 
 import six
+import codecs
 import os
+import multiprocessing
 import socket
 import subprocess
 import time
@@ -53,6 +55,7 @@ import signal
 import ctypes
 import re
 import shutil
+from collections import OrderedDict
 from fcntl import fcntl, F_GETFL, F_SETFL
 
 from .mongodb import (StorableMixin, SyncVariable, create_to_dict,
@@ -60,7 +63,10 @@ from .mongodb import (StorableMixin, SyncVariable, create_to_dict,
 
 from .scheduler import Scheduler
 from .reducer import StrFilterParser, WorkerParser, BashParser, PrefixParser
-from .logentry import LogEntry
+from .logentry import LogEntry, OutputSpool
+from .reactor import Reactor
+from .staging import StagingCache
+from .task import Task
 from .util import DT
 from adaptivemd import Transfer
 
@@ -73,8 +79,362 @@ except OSError:
     libc = None
 
 
+def _available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    else:
+        return list(range(multiprocessing.cpu_count()))
+
+
+class Slot(object):
+    """
+    The CPUs, GPUs and memory assigned to a single running task
+    """
+    def __init__(self, cpus=None, gpus=None, memory=0):
+        """
+        Parameters
+        ----------
+        cpus : list of int or None
+            the ids of the CPUs the task is pinned to. None is no pinning
+        gpus : list of str or None
+            the CUDA device ids visible to the task. None keeps the
+            environment of the worker
+        memory : int
+            the memory in MB reserved for the task
+        """
+        self.cpus = cpus
+        self.gpus = gpus
+        self.memory = memory
+
+    def environment(self):
+        """
+        Return the environment of the task process
+
+        Returns
+        -------
+        dict or None
+            the environment variables or None to inherit the ones of the
+            worker
+
+        """
+        if self.gpus is None:
+            return None
+
+        env = dict(os.environ)
+        env['CUDA_VISIBLE_DEVICES'] = ','.join(self.gpus)
+        return env
+
+    def pin(self):
+        """
+        Restrict the calling process to the CPUs of the slot
+
+        """
+        if self.cpus and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, self.cpus)
+
+
+class Slots(object):
+    """
+    The resources of a worker shared by concurrently running tasks
+
+    If no capacity is declared a single task runs at a time using the whole
+    node, as before. Otherwise tasks are started as long as their
+    `resource_requirements` fit into the free CPUs, GPUs and memory. Each
+    task is pinned to its own CPUs and only sees its GPUs through
+    `CUDA_VISIBLE_DEVICES`. Memory is reserved but not enforced.
+
+    A task that needs more than the whole capacity is run alone with all
+    resources, so it cannot block the worker.
+
+    The free slots are counted in tasks of the smallest requirements seen so
+    far, by default one CPU and no GPUs or memory.
+    """
+    def __init__(self, cpus=None, gpus=None, memory=None):
+        """
+        Parameters
+        ----------
+        cpus : int or list of int or None
+            the number of CPUs or the ids of the CPUs to use. If None all CPUs
+            available to the worker process are used
+        gpus : int or list of str or None
+            the number of GPUs or the CUDA device ids to use. A number selects
+            the first devices in `CUDA_VISIBLE_DEVICES`, if set. If None all
+            devices in `CUDA_VISIBLE_DEVICES` are used
+        memory : int or None
+            the memory in MB all tasks together may use. None is unlimited
+        """
+        self.declared = not (cpus is None and gpus is None and memory is None)
+
+        available = _available_cpus()
+        if cpus is None:
+            cpus = available
+        elif isinstance(cpus, int):
+            cpus = available[:cpus]
+
+        visible = os.environ.get('CUDA_VISIBLE_DEVICES')
+        devices = [x for x in visible.split(',') if x] if visible else []
+        if gpus is None:
+            gpus = devices
+        elif isinstance(gpus, int):
+            gpus = (devices or [str(x) for x in range(gpus)])[:gpus]
+
+        self.cpus = [int(x) for x in cpus]
+        self.gpus = [str(x) for x in gpus]
+        self.memory = memory
+
+        self._free_cpus = list(self.cpus)
+        self._free_gpus = list(self.gpus)
+        self._used_memory = 0
+        self._n_used = 0
+        # the smallest requirements of all started tasks
+        self._minimal = None
+
+    def to_dict(self):
+        return {
+            'cpus': self.cpus,
+            'gpus': self.gpus,
+            'memory': self.memory
+        }
+
+    @staticmethod
+    def requirements(task):
+        """
+        Return the resources a task needs
+
+        Parameters
+        ----------
+        task : `Task`
+            the task
+
+        Returns
+        -------
+        tuple of int
+            the number of CPUs, GPUs and the memory in MB
+
+        """
+        req = getattr(task, 'resource_requirements', None) or {}
+        cpus = max(1, req.get('cpu_threads', 1)) * max(1, req.get('mpi_rank', 0))
+        gpus = max(0, req.get('gpu_contexts', 0))
+        memory = req.get('memory', 0) or 0
+
+        return cpus, gpus, memory
+
+    @property
+    def n_used(self):
+        """
+        int : the number of acquired slots
+        """
+        return self._n_used
+
+    @property
+    def minimal(self):
+        """
+        tuple of int : the smallest number of CPUs, GPUs and memory in MB
+        needed by the started tasks
+        """
+        return self._minimal or (1, 0, 0)
+
+    @property
+    def free(self):
+        """
+        bool : True if a task with the smallest requirements fits
+        """
+        return self.n_free > 0
+
+    @property
+    def n_free(self):
+        """
+        int : the number of tasks with the smallest requirements that fit
+        """
+        if self._n_used == 0:
+            # a task that needs more than the capacity runs alone
+            return max(1, self._n_fit(self.minimal)) if self.declared else 1
+
+        if not self.declared:
+            return 0
+
+        return self._n_fit(self.minimal)
+
+    def _n_fit(self, requirements):
+        cpus, gpus, memory = requirements
+        counts = [len(self._free_cpus) // cpus]
+        if gpus:
+            counts.append(len(self._free_gpus) // gpus)
+        if memory and self.memory is not None:
+            counts.append(max(0, self.memory - self._used_memory) // memory)
+
+        return min(counts)
+
+    def fits(self, task):
+        """
+        Check whether a task can be started now
+
+        Parameters
+        ----------
+        task : `Task`
+            the task
+
+        Returns
+        -------
+        bool
+            True if the task fits into the free resources
+
+        """
+        if self._n_used == 0:
+            return True
+
+        if not self.declared:
+            return False
+
+        cpus, gpus, memory = self.requirements(task)
+
+        return cpus <= len(self._free_cpus) and \
+            gpus <= len(self._free_gpus) and (
+                self.memory is None or
+                self._used_memory + memory <= self.memory)
+
+    def claim_filter(self, field='_dict.resource_requirements'):
+        """
+        Return a DB filter for tasks that fit into the free resources
+
+        Use it to claim only tasks that can be started now, so tasks that do
+        not fit are never claimed and given back. A task that fits alone
+        may still have to wait for others claimed at the same time.
+
+        Parameters
+        ----------
+        field : str
+            the name of the `resource_requirements` in the task documents
+
+        Returns
+        -------
+        dict or None
+            the mongodb filter, None if any task can be started
+
+        """
+        if self._n_used == 0:
+            # a task that needs more than the capacity runs alone
+            return None
+
+        if not self.declared or not self._free_cpus:
+            return {'_id': {'$in': []}}
+
+        def key(name):
+            return '%s.%s' % (field, name)
+
+        def at_most(name, value, default):
+            condition = {key(name): {'$lte': value}}
+            if default <= value:
+                # a missing value counts as the default
+                return {'$or': [condition, {key(name): None}]}
+
+            return condition
+
+        n_cpus = len(self._free_cpus)
+
+        # a task needs `cpu_threads` times `mpi_rank` CPUs. Ranks that allow
+        # the same number of threads share one condition
+        ranks = [{'$and': [
+            {'$or': [{key('mpi_rank'): {'$lte': 1}}, {key('mpi_rank'): None}]},
+            at_most('cpu_threads', n_cpus, 1)]}]
+        rank = 2
+        while rank <= n_cpus:
+            threads = n_cpus // rank
+            last = n_cpus // threads
+            ranks.append({'$and': [
+                {key('mpi_rank'): {'$gte': rank, '$lte': last}},
+                at_most('cpu_threads', threads, 1)]})
+            rank = last + 1
+
+        clauses = [
+            {'$or': ranks},
+            at_most('gpu_contexts', len(self._free_gpus), 0)]
+
+        if self.memory is not None:
+            clauses.append(
+                at_most('memory', self.memory - self._used_memory, 0))
+
+        return {'$and': clauses}
+
+    def acquire(self, task):
+        """
+        Assign free resources to a task
+
+        Parameters
+        ----------
+        task : `Task`
+            the task to be started. Check :meth:`fits` first
+
+        Returns
+        -------
+        `Slot`
+            the assigned resources
+
+        """
+        self._n_used += 1
+
+        if not self.declared:
+            return Slot()
+
+        cpus, gpus, memory = self.requirements(task)
+        if self._minimal is None:
+            self._minimal = (cpus, gpus, memory)
+        else:
+            self._minimal = tuple(
+                min(x, y) for x, y in zip(self._minimal, (cpus, gpus, memory)))
+
+        slot = Slot(
+            self._free_cpus[:cpus],
+            self._free_gpus[:gpus] if self.gpus else None,
+            memory)
+
+        del self._free_cpus[:cpus]
+        del self._free_gpus[:gpus]
+        self._used_memory += memory
+
+        return slot
+
+    def release(self, slot):
+        """
+        Return the resources of a finished task
+
+        Parameters
+        ----------
+        slot : `Slot`
+            the resources returned by :meth:`acquire`
+
+        """
+        self._n_used -= 1
+
+        if not self.declared:
+            return
+
+        free_cpus = set(self._free_cpus).union(slot.cpus)
+        self._free_cpus = [x for x in self.cpus if x in free_cpus]
+        free_gpus = set(self._free_gpus).union(slot.gpus or [])
+        self._free_gpus = [x for x in self.gpus if x in free_gpus]
+        self._used_memory -= slot.memory
+
+
+class _Job(object):
+    """
+    A task running in its own folder and process on a slot
+    """
+    def __init__(self, task, slot):
+        self.task = task
+        self.slot = slot
+        self.unit_dir = 'worker.%s' % hex(task.__uuid__)
+        self.sub = None
+        self.spools = {}
+        # output may be split inside a multi-byte character
+        self.decoders = {
+            s: codecs.getincrementaldecoder('utf8')('replace')
+            for s in ['stdout', 'stderr']}
+
+
 class WorkerScheduler(Scheduler):
-    def __init__(self, resource, verbose=False):
+    def __init__(self, resource, verbose=False, cpus=None, gpus=None,
+                 memory=None):
         """
         A single instance worker scheduler to interprete `Task` objects
 
@@ -84,11 +444,20 @@ class WorkerScheduler(Scheduler):
             the resource this scheduler should use.
         verbose : bool
             if True the worker will report lots of stuff
+        cpus : int or list of int or None
+            the CPUs shared by concurrently running tasks, see `Slots`
+        gpus : int or list of str or None
+            the GPUs shared by concurrently running tasks, see `Slots`
+        memory : int or None
+            the memory in MB shared by concurrently running tasks
         """
         super(WorkerScheduler, self).__init__(resource)
-        self._current_sub = None
-        self._current_unit_dir = None
-        self.current_task = None
+        self.slots = Slots(cpus, gpus, memory)
+        self._jobs = OrderedDict()
+        # if set, running tasks report output and exit to this `Reactor`
+        self.reactor = None
+        # if set, files from the DB are linked from this `StagingCache`
+        self.staging_cache = None
         self.home_path = os.path.expanduser('~')
         self._done_tasks = set()
         self._save_log_to_db = True
@@ -96,8 +465,6 @@ class WorkerScheduler(Scheduler):
         self._fail_after_each_command = True
         self._cleanup_successful = True
 
-        self._std = {}
-
     @property
     def path(self):
         return os.path.expandvars(self.resource.shared_path)
@@ -158,6 +525,62 @@ class WorkerScheduler(Scheduler):
 
         return tasks
 
+    @property
+    def running_tasks(self):
+        """
+        Returns
+        -------
+        list of `Task`
+            the tasks executed at the time in the order they were started
+
+        """
+        return [job.task for job in self._jobs.values()]
+
+    @property
+    def current_task(self):
+        """
+        Returns
+        -------
+        `Task` or None
+            the earliest started of the running tasks or None if no task is
+            executed at the time
+
+        """
+        for job in self._jobs.values():
+            return job.task
+
+        return None
+
+    @property
+    def accepting(self):
+        """
+        Check whether the scheduler can start more tasks
+
+        Returns
+        -------
+        bool
+            True if all submitted tasks are running and there are free slots
+
+        """
+        return len(self.tasks) == len(self._jobs) and self.slots.free
+
+    def task_dir(self, task):
+        """
+        Return the path to the worker directory of a task
+
+        Parameters
+        ----------
+        task : `Task`
+            the task
+
+        Returns
+        -------
+        str
+            the path the task is executed in
+
+        """
+        return self.path + '/workers/' + 'worker.%s' % hex(task.__uuid__)
+
     @property
     def current_task_dir(self):
         """
@@ -168,8 +591,9 @@ class WorkerScheduler(Scheduler):
             the path or None if no task is executed at the time
 
         """
-        if self._current_unit_dir is not None:
-            return self.path + '/workers/' + self._current_unit_dir
+        task = self.current_task
+        if task is not None:
+            return self.task_dir(task)
         else:
             return None
 
@@ -183,9 +607,19 @@ class WorkerScheduler(Scheduler):
             the task to be executed
 
         """
-        self._current_unit_dir = 'worker.%s' % hex(task.__uuid__)
+        job = _Job(task, self.slots.acquire(task))
+        self._jobs[task.__uuid__] = job
 
-        script_location = self.current_task_dir
+        try:
+            self._start_process(job)
+        except:
+            self._finish_job(job)
+            raise
+
+    def _start_process(self, job):
+        task = job.task
+        slot = job.slot
+        script_location = self.task_dir(task)
 
         if os.path.exists(script_location):
             print('removing existing folder', script_location)
@@ -196,7 +630,11 @@ class WorkerScheduler(Scheduler):
         # create a fresh folder
         os.makedirs(script_location)
 
-        # and set the current directory
+        # the full output goes to files, only a preview is kept in memory
+        for s in ['stdout', 'stderr']:
+            job.spools[s] = OutputSpool('%s/%s.log' % (script_location, s))
+
+        # and set the current directory. Staging paths are relative to it
         os.chdir(script_location)
 
         task.fire('submit', self)
@@ -211,199 +649,264 @@ class WorkerScheduler(Scheduler):
         task.state = 'running'
         task.fire(task.state, self)
 
-        if libc is not None:
-            def set_pdeathsig(sig=signal.SIGTERM):
-                def death_fnc():
-                    return libc.prctl(1, sig)
+        def preexec_fn():
+            if libc is not None:
+                # terminate the task if the worker dies
+                libc.prctl(1, signal.SIGTERM)
 
-                return death_fnc
+            slot.pin()
 
-            preexec_fn = set_pdeathsig(signal.SIGTERM)
-        else:
-            preexec_fn = None
-
-        self._current_sub = subprocess.Popen(
+        # other tasks change the current directory, so pass it explicitly
+        job.sub = subprocess.Popen(
             ['/bin/bash', script_location + '/running.sh'],
             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            cwd=script_location, env=slot.environment(),
             preexec_fn=preexec_fn, shell=False)
 
         # this is a special hack that allows to read from stdout and stderr
         # without a blocking `.read`, let's hope this works
-        flags = fcntl(self._current_sub.stdout, F_GETFL)  # get current p.stdout flags
-        fcntl(self._current_sub.stdout, F_SETFL, flags | os.O_NONBLOCK)
+        flags = fcntl(job.sub.stdout, F_GETFL)  # get current p.stdout flags
+        fcntl(job.sub.stdout, F_SETFL, flags | os.O_NONBLOCK)
 
-        flags = fcntl(self._current_sub.stderr, F_GETFL)  # get current p.stderr flags
-        fcntl(self._current_sub.stderr, F_SETFL, flags | os.O_NONBLOCK)
+        flags = fcntl(job.sub.stderr, F_GETFL)  # get current p.stderr flags
+        fcntl(job.sub.stderr, F_SETFL, flags | os.O_NONBLOCK)
 
-        # prepare std catching
-        self._start_std()
+        if self.reactor is not None:
+            # read output as soon as it arrives so the pipes never fill up
+            for s in ['stdout', 'stderr']:
+                self.reactor.add_reader(
+                    getattr(job.sub, s).fileno(),
+                    lambda fd, s=s: self._read_std(job, s))
 
-    def stop_current(self):
-        """
-        Stop execution of the current task immediately
+            # wake up as soon as the task exits
+            self.reactor.add_process(job.sub)
 
+    @property
+    def has_exited(self):
+        """
         Returns
         -------
         bool
-            if True the current task was cancelled, False if there
-            was no task running
+            True if the process of a running task has exited and
+            :meth:`advance` needs to be called
 
         """
-        if self._current_sub is not None:
-            task = self.current_task
-            self._current_sub.kill()
-            del self.tasks[task.__uuid__]
-            self._final_std()
-            self.current_task = None
+        return any(
+            job.sub is not None and job.sub.returncode is not None
+            for job in self._jobs.values())
 
-            return True
-        else:
+    def stop(self, task):
+        """
+        Stop execution of a running task immediately
+
+        Parameters
+        ----------
+        task : `Task`
+            the task to be stopped
+
+        Returns
+        -------
+        bool
+            if True the task was cancelled, False if it was not running
+
+        """
+        job = self._jobs.get(task.__uuid__)
+        if job is None:
             return False
 
-    def _start_std(self):
-        self._std = {
-            'stdout': '',
-            'stderr': ''
-        }
+        job.sub.kill()
+        del self.tasks[task.__uuid__]
+        self._final_std(job)
+        self._finish_job(job)
+
+        return True
 
-    def _advance_std(self):
+    def stop_current(self):
         """
-        Advance the stdout and stderr for some bytes, save it and redirect
+        Stop execution of all running tasks immediately
+
+        Returns
+        -------
+        bool
+            if True the running tasks were cancelled, False if there
+            was no task running
+
         """
-        for s in ['stdout', 'stderr']:
-            try:
-                new_std = os.read(getattr(self._current_sub, s).fileno(), 1024)
-                if six.PY3:
-                    new_std = new_std.decode('utf8')
-                self._std[s] += new_std
-                if self.verbose:
-                    # send to stdout, stderr
-                    std = getattr(sys, s)
-                    std.write(new_std)
-                    std.flush()
+        stopped = False
+        for task in self.running_tasks:
+            stopped = self.stop(task) or stopped
 
-            except OSError:
-                pass
+        return stopped
 
-    def _final_std(self):
+    def _read_std(self, job, s):
         """
-        Finish capturing of stdout and stderr
+        Read all output available from stdout or stderr of a task
+
+        Parameters
+        ----------
+        job : `_Job`
+            the running task
+        s : str
+            `stdout` or `stderr`
+
+        Returns
+        -------
+        bool
+            False once the stream has been closed
 
         """
-        task = self.current_task
-        try:
-            out, err = self._current_sub.communicate()
-            if six.PY3:
-                out = out.decode('utf8')
-                err = err.decode('utf8')
-            if self.verbose:
-                sys.stderr.write(err)
-                sys.stdout.write(out)
+        fd = getattr(job.sub, s).fileno()
+        while True:
+            try:
+                new_std = os.read(fd, 65536)
+            except OSError:
+                # nothing to read at the moment
+                return True
 
-            # save full message
-            stdout = self._std['stdout'] + out
-            stderr = self._std['stderr'] + err
+            if not new_std:
+                if self.reactor is not None:
+                    self.reactor.remove_reader(fd)
 
-            if self._save_log_to_db:
-                log_err = LogEntry(
-                    'worker',
-                    'stderr from running task',
-                    stderr
-                )
-                log_out = LogEntry(
-                    'worker',
-                    'stdout from running task',
-                    stdout
-                )
-                self.project.logs.add(log_err)
-                self.project.logs.add(log_out)
+                return False
 
-                task.stdout = log_out
-                task.stderr = log_err
+            job.spools[s].write(new_std)
+            if self.verbose:
+                if six.PY3:
+                    new_std = job.decoders[s].decode(new_std)
+                # send to stdout, stderr
+                std = getattr(sys, s)
+                std.write(new_std)
+                std.flush()
 
-        except ValueError:
-            pass
+    def _advance_std(self, job):
+        """
+        Advance the stdout and stderr, save it and redirect
+        """
+        for s in ['stdout', 'stderr']:
+            if not getattr(job.sub, s).closed:
+                self._read_std(job, s)
+
+    def _final_std(self, job):
+        """
+        Finish capturing of stdout and stderr
+
+        """
+        task = job.task
+        for s in ['stdout', 'stderr']:
+            stream = getattr(job.sub, s)
+            if not stream.closed:
+                # read what is left, but do not wait for processes that
+                # inherited the pipe and are still running
+                self._read_std(job, s)
+                if self.reactor is not None:
+                    self.reactor.remove_reader(stream.fileno())
+
+                stream.close()
+
+        job.sub.wait()
+
+        if self._save_log_to_db:
+            storage = self.project.storage
+            log_err = job.spools['stderr'].log_entry(
+                storage, 'worker', 'stderr from running task')
+            log_out = job.spools['stdout'].log_entry(
+                storage, 'worker', 'stdout from running task')
+            self.project.logs.add(log_err)
+            self.project.logs.add(log_out)
+
+            task.stdout = log_out
+            task.stderr = log_err
 
     def advance(self):
         """
         Advance checking if tasks are completed or failed
 
+        Finished tasks free their slots first, then waiting tasks are
+        started in the order they were submitted as long as they fit.
         Needs to be called in regular intervals. Usually by the main
         worker instance
 
         """
-        if self.current_task is None:
-            if len(self.tasks) > 0:
-                t = next(iter(self.tasks.values()))
-                self.current_task = t
-                self._start_job(t)
-        else:
-            task = self.current_task
-            # get current outputs
-            return_code = self._current_sub.poll()
-
-            # update current stdout and stderr by 1024 bytes
-
-            self._advance_std()
-
-            if return_code is not None:
-                # finish std catching
-                self._final_std()
-
-                if return_code == 0:
-                    # success
-
-                    all_files_present = True
-                    # see first if we have all claimed files for worker output staging transfer
-                    for f in task.targets:
-                        if isinstance(f, Transfer):
-                            if not os.path.exists(self.replace_prefix(f.source.url)):
-                                log = LogEntry(
-                                    'worker',
-                                    'execution error',
-                                    'failed to create file before staging %s' % f.source.short,
-                                    objs={'file': f, 'task': task}
-                                )
-                                self.project.logs.add(log)
-                                all_files_present = False
-
-                    if all_files_present:
-                        try:
-                            task.fire('success', self)
-                            task.state = 'success'
-                            print('task succeeded')
-                            if self._cleanup_successful:
-                                print('removing worker dir')
-                                # go to an existing folder before we delete
-                                os.chdir(self.path)
-                                script_location = self.current_task_dir
-                                if script_location is not None:
-                                    shutil.rmtree(script_location)
-                        except IOError:
-
-                            task.state = 'fail'
-                    else:
-                        task.state = 'fail'
-                else:
-                    # failed
-                    log = LogEntry(
-                        'worker',
-                        'task failed',
-                        'see log files',
-                        objs={'task': task}
-                    )
-                    self.project.logs.add(log)
-                    task.state = 'failed'
+        for job in list(self._jobs.values()):
+            self._advance_job(job)
+
+        for task in list(self.tasks.values()):
+            if task.__uuid__ not in self._jobs:
+                if not self.slots.fits(task):
+                    # keep the order, a large task must not starve
+                    break
+
+                self._start_job(task)
+
+    def _advance_job(self, job):
+        task = job.task
+        # get current outputs
+        return_code = job.sub.poll()
+
+        # update current stdout and stderr by 1024 bytes
+
+        self._advance_std(job)
+
+        if return_code is not None:
+            # finish std catching
+            self._final_std(job)
+
+            # staging paths and callbacks are relative to the task folder
+            script_location = self.task_dir(task)
+            os.chdir(script_location)
+
+            if return_code == 0:
+                # success
+
+                all_files_present = True
+                # see first if we have all claimed files for worker output staging transfer
+                for f in task.targets:
+                    if isinstance(f, Transfer):
+                        if not os.path.exists(self.replace_prefix(f.source.url)):
+                            log = LogEntry(
+                                'worker',
+                                'execution error',
+                                'failed to create file before staging %s' % f.source.short,
+                                objs={'file': f, 'task': task}
+                            )
+                            self.project.logs.add(log)
+                            all_files_present = False
+
+                if all_files_present:
                     try:
-                        task.fire('fail', self)
+                        task.fire('success', self)
+                        task.state = 'success'
+                        print('task succeeded')
+                        if self._cleanup_successful:
+                            print('removing worker dir')
+                            # go to an existing folder before we delete
+                            os.chdir(self.path)
+                            shutil.rmtree(script_location)
                     except IOError:
-                        pass
 
+                        task.state = 'fail'
+                else:
                     task.state = 'fail'
+            else:
+                # failed
+                log = LogEntry(
+                    'worker',
+                    'task failed',
+                    'see log files',
+                    objs={'task': task}
+                )
+                self.project.logs.add(log)
+                task.state = 'failed'
+                try:
+                    task.fire('fail', self)
+                except IOError:
+                    pass
 
-                del self.tasks[task.__uuid__]
-                self._done_tasks.add(task.__uuid__)
-                self._initialize_current()
+                task.state = 'fail'
+
+            del self.tasks[task.__uuid__]
+            self._done_tasks.add(task.__uuid__)
+            self._finish_job(job)
 
     def release_queued_tasks(self):
         """
@@ -413,16 +916,40 @@ class WorkerScheduler(Scheduler):
         and this releases not started jobs back to the queue
 
         """
-        for t in list(self.tasks.values()):
-            if t.state == 'queued':
-                t.state = 'created'
-                t.worker = None
-                del self.tasks[t.__uuid__]
+        queued = [
+            t for t in self.tasks.values() if t.__uuid__ not in self._jobs]
+
+        # only tasks that are still queued are changed, all in one request
+        self.project.storage.tasks.release_many(
+            [t.__uuid__ for t in queued], 'state', 'queued', 'created',
+            ['worker'])
+
+        for t in queued:
+            del self.tasks[t.__uuid__]
+
+    def _finish_job(self, job):
+        del self._jobs[job.task.__uuid__]
+        self.slots.release(job.slot)
+        for spool in job.spools.values():
+            spool.close()
 
-    def _initialize_current(self):
-        self._current_sub = None
-        self._current_unit_dir = None
-        self.current_task = None
+        if self.reactor is not None and job.sub is not None:
+            self.reactor.remove_process(job.sub)
+
+    def wait(self, timeout):
+        """
+        Wait until a running task exits or the time is up
+
+        Parameters
+        ----------
+        timeout : float
+            the maximal time to wait in seconds
+
+        """
+        if self.reactor is not None:
+            self.reactor.run_until(lambda: self.has_exited, timeout)
+        else:
+            time.sleep(timeout)
 
     def enter(self, project=None):
         self.change_state('booting')
@@ -511,16 +1038,14 @@ class WorkerScheduler(Scheduler):
             max_wait = 15
             while len(self.tasks) > 0 and time.time() - curr < max_wait:
                 self.advance()
-                time.sleep(2.0)
+                self.wait(2.0)
 
-        # kill the current job
+        # kill the running jobs
         self.change_state('shuttingdown')
-        if self.current_task:
-            if True:
-                self.current_task.state = 'created'
-            else:
-                self.current_task.state = 'cancelled'
-            self.stop_current()
+        for task in self.running_tasks:
+            task.state = 'created'
+
+        self.stop_current()
 
         self.change_state('down')
 
@@ -531,17 +1056,21 @@ class Worker(StorableMixin):
     """
 
     _find_by = ['state', 'n_tasks', 'seen', 'verbose', 'prefetch', 'current']
+    _no_index = ['n_tasks', 'seen', 'verbose', 'prefetch']
 
     state = SyncVariable('state')
     n_tasks = SyncVariable('n_tasks')
     seen = SyncVariable('seen')
     verbose = SyncVariable('verbose')
     prefetch = SyncVariable('prefetch')
-    command = SyncVariable('command')
+    # commands are a mailbox between processes and must not be delayed
+    command = SyncVariable('command', buffered=False)
     current = ObjectSyncVariable('current', 'tasks')
+    cache = SyncVariable('cache')
 
     def __init__(self, walltime=None, generators=None, sleep=None,
-                 heartbeat=None, prefetch=1, verbose=False):
+                 heartbeat=None, prefetch=1, verbose=False, cpus=None,
+                 gpus=None, memory=None, cache_path=None, cache_size=1024):
         super(Worker, self).__init__()
         self.hostname = socket.gethostname()
         self.cwd = os.getcwd()
@@ -559,10 +1088,19 @@ class Worker(StorableMixin):
         self.current = None
         self._last_current = None
         self.pid = os.getpid()
+        # the declared capacity shared by concurrent tasks, see `Slots`
+        self.cpus = cpus
+        self.gpus = gpus
+        self.memory = memory
+        # the node local cache of files from the DB, see `StagingCache`
+        self.cache_path = cache_path
+        self.cache_size = cache_size
+        self.cache = None
 
     to_dict = create_to_dict([
         'walltime', 'generators', 'sleep', 'heartbeat', 'hostname',
-        'cwd', 'seen', 'prefetch', 'pid'
+        'cwd', 'seen', 'prefetch', 'pid', 'cpus', 'gpus', 'memory',
+        'cache_path', 'cache_size'
     ])
 
     @classmethod
@@ -576,8 +1114,16 @@ class Worker(StorableMixin):
         return obj
 
     def create(self, project):
-        scheduler = WorkerScheduler(project._current_configuration, self.verbose)
+        scheduler = WorkerScheduler(
+            project._current_configuration, self.verbose,
+            self.cpus, self.gpus, self.memory)
         scheduler._state_cb = self._state_cb
+        if self.cache_size != 0:
+            scheduler.staging_cache = StagingCache(
+                self.cache_path,
+                self.cache_size * 1024 * 1024
+                if self.cache_size is not None else None)
+
         self._scheduler = scheduler
         self._project = project
         scheduler.enter(project)
@@ -611,13 +1157,13 @@ class Worker(StorableMixin):
 
     def _stop_current(self, mode):
         sc = self.scheduler
-        task = sc.current_task
 
-        if task:
-            attempt = self.project.storage.tasks.modify_test_one(
-                lambda x: x == task, 'state', 'running', 'stopping')
+        for task in sc.running_tasks:
+            attempt = self.project.storage.tasks.claim_one(
+                {'_id': self.project.storage.db_id(task.__uuid__)},
+                'state', 'running', 'stopping')
             if attempt is not None:
-                if sc.stop_current():
+                if sc.stop(task):
                     # success, so mark the task as cancelled
                     task.state = mode
                     task.worker = None
@@ -630,6 +1176,23 @@ class Worker(StorableMixin):
                 # semms in the meantime the task has finished (success/fail)
                 pass
 
+    def _claim_query(self):
+        generators = None
+        if self.generators:
+            generators = [
+                g for g in self.project.generators
+                if g.name in self.generators]
+
+        query = Task.claim_query(generators)
+
+        # only claim tasks that can be started now
+        if self._scheduler is not None:
+            fits = self._scheduler.slots.claim_filter()
+            if fits is not None:
+                query['$and'].append(fits)
+
+        return query
+
     def execute(self, command):
         """
         Send and execute a single command to the worker
@@ -653,13 +1216,19 @@ class Worker(StorableMixin):
         """
         Start the worker to execute tasks until it is shut down
 
+        The worker waits in a `Reactor` until there is something to do: a
+        running task exited, the DB reports new tasks or a command, or the
+        heartbeat is due. Output of running tasks is read as it arrives.
+        The DB is polled for tasks and commands with every heartbeat, and
+        every `sleep` seconds if change notifications are not available.
+
         """
         scheduler = self._scheduler
         project = self._project
 
-        last = time.time()
         last_n_tasks = 0
-        self.seen = last
+        last_cache = None
+        self.seen = time.time()
 
         def task_test(x):
             return x.ready and (not self.generators or (
@@ -668,6 +1237,40 @@ class Worker(StorableMixin):
 
         print('up and running ...')
 
+        # claimed tasks reference this worker
+        worker_ref = project.storage.simplifier.reference(self, 'workers')
+
+        reactor = Reactor()
+        scheduler.reactor = reactor
+
+        # the reasons to run the next iteration, also added from other threads
+        events = set()
+
+        def notify(event):
+            def callback(*args):
+                events.add(event)
+                reactor.wakeup()
+
+            return callback
+
+        watches = [
+            project.storage.tasks.watch(
+                {'state': 'created'}, notify('tasks')),
+            project.storage.workers.watch(
+                {'_id': project.storage.db_id(self.__uuid__),
+                 'command': {'$ne': None}},
+                notify('command'))]
+
+        def fallback():
+            if not all(watch.active for watch in watches):
+                notify('poll')()
+
+        reactor.call_every(self.heartbeat, notify('heartbeat'))
+        reactor.call_every(self.sleep, fallback)
+
+        # check everything once at the start
+        events.update(['poll', 'heartbeat'])
+
         try:
             reconnect = True
 
@@ -681,64 +1284,88 @@ class Worker(StorableMixin):
 
                         print('remove all pending tasks')
                         # remove all pending tasks as much as possible
+                        running = scheduler.running_tasks
                         for t in list(scheduler.tasks.values()):
-                            if t is not scheduler.current_task:
+                            if t not in running:
                                 if t.worker == self:
                                     t.state = 'created'
                                     t.worker = None
 
                                 del scheduler.tasks[t.__uuid__]
 
-                        # see, if we can salvage the currently running task
-                        # unless it has been cancelled and is running with another worker
-                        t = scheduler.current_task
-                        if t.worker == self and t.state == 'running':
-                            print('continuing current task')
-                            # seems like the task is still ours to finish
-                            pass
-                        else:
-                            print('current task has been captured. releasing.')
-                            scheduler.stop_current()
+                        # see, if we can salvage the running tasks unless
+                        # they have been cancelled and run with another worker
+                        for t in running:
+                            if t.worker == self and t.state == 'running':
+                                print('continuing running task')
+                                # seems like the task is still ours to finish
+                                pass
+                            else:
+                                print('running task has been captured. releasing.')
+                                scheduler.stop(t)
 
                     # the main worker loop
                     while scheduler.state != 'down':
-                        state = self.state
+                        woken = set()
+                        while events:
+                            woken.add(events.pop())
+
+                        polled = woken.intersection(['command', 'poll', 'heartbeat'])
+
+                        if polled:
+                            # the state might have been changed by others
+                            state = self.state
+                        else:
+                            state = scheduler.state
+
                         # check the state of the worker
                         if state in self._running_states:
                             scheduler.advance()
-                            if scheduler.is_idle:
-                                for _ in range(self.prefetch):
-                                    done = False
-                                    attempt = 0
-                                    retries = 10
-                                    while not done:
-
-                                        try:
-                                            tasklist = scheduler(
-                                                project.storage.tasks.modify_test_one(
-                                                 task_test, 'state', 'created', 'queued'))
-                                            done = True
-
-                                        except RuntimeError as e:
-                                            if attempt < retries:
-                                                print("Connection Timeout #{0} ignored"
-                                                      .format(attempt))
-                                                attempt += 1
-                                                time.sleep(2)
-                                            else:
-                                                raise e
-
-                                    for task in tasklist:
-                                        task.worker = self
-                                        print('queued a task [%s] from generator `%s`' % (
-                                            task.__class__.__name__,
-                                            task.generator.name if task.generator else '---'))
+                            # claim tasks until all slots are used
+                            while scheduler.accepting:
+                                n_claimed = len(scheduler.tasks)
+                                done = False
+                                attempt = 0
+                                retries = 10
+                                while not done:
+
+                                    try:
+                                        # claim and assign in bulk
+                                        tasklist = scheduler(
+                                            project.storage.tasks.claim_many(
+                                                self._claim_query(),
+                                                'state', 'created', 'queued',
+                                                max(self.prefetch,
+                                                    scheduler.slots.n_free),
+                                                task_test,
+                                                fields={'worker': worker_ref}))
+                                        done = True
+
+                                    except RuntimeError as e:
+                                        if attempt < retries:
+                                            print("Connection Timeout #{0} ignored"
+                                                  .format(attempt))
+                                            attempt += 1
+                                            time.sleep(2)
+                                        else:
+                                            raise e
+
+                                for task in tasklist:
+                                    print('queued a task [%s] from generator `%s`' % (
+                                        task.__class__.__name__,
+                                        task.generator.name if task.generator else '---'))
 
                                 self.n_tasks = len(scheduler.tasks)
+                                if len(scheduler.tasks) == n_claimed:
+                                    # nothing left to claim
+                                    break
+
+                                # start the claimed tasks right away
+                                scheduler.advance()
 
                         # handle commands
                         # todo: Place all commands in a separate store and consume ?!?
-                        command = self.command
+                        command = self.command if polled else None
 
                         if command == 'shutdown':
                             # someone wants us to shutdown
@@ -768,12 +1395,29 @@ class Worker(StorableMixin):
                         if command:
                             self.command = None
 
-                        if time.time() - last > self.heartbeat:
-                            # heartbeat
-                            last = time.time()
-                            self.seen = last
+                        if 'heartbeat' in polled:
+                            self.seen = time.time()
+
+                            cache = scheduler.staging_cache
+                            if cache is not None:
+                                stats = cache.to_dict()
+                                if stats != last_cache:
+                                    self.cache = stats
+                                    last_cache = stats
+
+                            if scheduler.is_idle:
+                                # make sure no task waits for finished ones
+                                Task.update_waiting(project.storage.tasks)
+
+                        # send buffered updates of this iteration in bulk
+                        project.storage.flush()
+
+                        # wait for something to happen
+                        reactor.run_until(
+                            lambda: events or scheduler.has_exited or
+                            scheduler.state == 'down',
+                            self.heartbeat)
 
-                        time.sleep(self.sleep)
                         if self.walltime and time.time() - self.__time__ > self.walltime:
                             # we have reached the set walltime and will shutdown
                             print('hit walltime of %s' % DT(self.walltime).length)
@@ -799,6 +1443,13 @@ class Worker(StorableMixin):
             scheduler.shut_down()
             pass
 
+        finally:
+            for watch in watches:
+                watch.close()
+
+            scheduler.reactor = None
+            reactor.close()
+
     def shutdown(self, gracefully=True):
         """
         Shut down the worker
@@ -810,3 +1461,8 @@ class Worker(StorableMixin):
 
         """
         self._scheduler.shut_down(gracefully)
+
+        reactor = self._scheduler.reactor
+        if reactor is not None:
+            # end a running wait of the main loop
+            reactor.wakeup()